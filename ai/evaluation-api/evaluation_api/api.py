@@ -0,0 +1,226 @@
+# --- File: evaluation_api/api.py ---
+# HTTP front end of the long-lived generation service.
+#
+# Corpora, search backends, ground truths and LLM clients stay resident across jobs
+# (server/registry.py), so a job only pays for its own selection, generation and
+# evaluation. Jobs run on a bounded worker pool (server/jobs.py).
+#
+#   GET    /health                      service status, resident state, job counts
+#   GET    /corpora                     resident corpora
+#   POST   /corpora                     {"overrides": {...}} load (warm) a corpus now
+#   POST   /corpora/<fingerprint>/chunks  {"upsert": [{doc_id, chunk_id, chunk_text, embedding}], "delete": [[doc_id, chunk_id]]}
+#                                       update a resident corpus in place
+#   DELETE /corpora/<fingerprint>       evict a corpus
+#   POST   /jobs                        {"kind": "generate", "evaluation_mode": "hybrid", "overrides": {...}}
+#                                       {"kind": "metrics", "ground_truth": "...", "runs": [...], "k": [...], "stream": false}
+#   GET    /jobs                        job list
+#   GET    /jobs/<id>                   job status, counters and timings
+#   GET    /jobs/<id>/results           NDJSON results; follows the job until it ends
+#                                       (?offset=<bytes> to resume, ?follow=0 for what exists now)
+#   DELETE /jobs/<id>                   cancel a queued job
+#
+# Run:
+#   python -m evaluation_api.api --config evaluation_api/configs/generation_config.py --port 8090
+
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .server.jobs import JobManager, QueueFullError
+from .server.registry import ResidentRegistry, job_config
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationService:
+    """Registry + job manager behind a threaded HTTP server; ``start()``/``stop()`` or a context manager."""
+
+    def __init__(self, base_config, metrics_config, server_config=None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.base_config = base_config
+        self.registry = ResidentRegistry(server_config)
+        self.jobs = JobManager(self.registry, base_config, metrics_config, server_config)
+        self.started_at = time.time()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "GenerationService":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="generation-service", daemon=True)
+        self._thread.start()
+        logger.info("Generation service listening on %s", self.url)
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.jobs.shutdown(wait=False)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def preload(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        corpus, _ = self.registry.corpus(job_config(self.base_config, overrides))
+        return corpus.describe()
+
+    # --- Routes ---
+    def _handle_json(self, method: str, parts: list, body: Dict[str, Any]) -> Tuple[int, Any]:
+        if method == "GET" and parts == ["health"]:
+            return 200, {
+                "status": "ok",
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "workers": self.jobs.max_workers,
+                "jobs": self.jobs.counts(),
+                **self.registry.describe(),
+            }
+        if parts[:1] == ["corpora"]:
+            if method == "GET" and len(parts) == 1:
+                return 200, self.registry.describe()["corpora"]
+            if method == "POST" and len(parts) == 1:
+                return 200, self.preload(body.get("overrides"))
+            if method == "POST" and len(parts) == 3 and parts[2] == "chunks":
+                upserts = body.get("upsert") or []
+                deletes = [tuple(k) for k in body.get("delete") or []]
+                if not isinstance(upserts, list) or any(len(k) != 2 for k in deletes):
+                    raise ValueError("upsert must be a list of chunks and delete a list of [doc_id, chunk_id]")
+                result = self.registry.update_corpus(parts[1], upserts, deletes)
+                return (200, result) if result is not None else (404, {"error": "corpus not resident"})
+            if method == "DELETE" and len(parts) == 2:
+                evicted = self.registry.evict_corpus(parts[1])
+                return (200 if evicted else 404), {"evicted": evicted}
+        if parts[:1] == ["jobs"]:
+            if method == "GET" and len(parts) == 1:
+                return 200, self.jobs.list()
+            if method == "POST" and len(parts) == 1:
+                kind = body.pop("kind", "generate")
+                job = self.jobs.submit(kind, body)
+                return 202, {"job_id": job.id, "status": job.status}
+            job = self.jobs.get(parts[1]) if len(parts) >= 2 else None
+            if job is None:
+                return 404, {"error": "unknown job"}
+            if method == "GET" and len(parts) == 2:
+                return 200, job.describe()
+            if method == "DELETE" and len(parts) == 2:
+                cancelled = self.jobs.cancel(job.id)
+                return (200 if cancelled else 409), {"cancelled": cancelled, "status": job.status}
+        return 404, {"error": f"unsupported route {method} /{'/'.join(parts)}"}
+
+    def _make_handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status: int, payload: Any):
+                data = json.dumps(payload, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream_results(self, job, query: Dict[str, list]):
+                offset = int((query.get("offset") or ["0"])[0])
+                follow = (query.get("follow") or ["1"])[0] not in ("0", "false")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for line in job.iter_output(offset=offset, follow=follow):
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.debug("Results client for job %s disconnected", job.id)
+
+            def _dispatch(self, method: str):
+                url = urlsplit(self.path)
+                parts = [p for p in url.path.split("/") if p]
+                if method == "GET" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "results":
+                    job = service.jobs.get(parts[1])
+                    if job is None:
+                        self._send_json(404, {"error": "unknown job"})
+                    else:
+                        self._stream_results(job, parse_qs(url.query))
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                    if not isinstance(body, dict):
+                        raise ValueError("request body must be a JSON object")
+                    status, payload = service._handle_json(method, parts, body)
+                except QueueFullError as e:
+                    status, payload = 429, {"error": str(e)}
+                except (ValueError, json.JSONDecodeError) as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:  # noqa: BLE001
+                    logger.error("Request %s %s failed: %s", method, self.path, e)
+                    status, payload = 500, {"error": str(e)}
+                self._send_json(status, payload)
+
+            def do_GET(self):  # noqa: N802
+                self._dispatch("GET")
+
+            def do_POST(self):  # noqa: N802
+                self._dispatch("POST")
+
+            def do_DELETE(self):  # noqa: N802
+                self._dispatch("DELETE")
+
+            def log_message(self, fmt, *args):
+                logger.debug("generation-service: " + fmt, *args)
+
+        return Handler
+
+
+def main():
+    from .configs import metrics_config, server_config
+    from .generation.cli import load_config
+
+    parser = argparse.ArgumentParser(description="Long-lived generation and metrics service")
+    parser.add_argument("--config", type=str, default=server_config.SERVER_GENERATION_CONFIG,
+                        help="Base generation_config.py; jobs may override individual settings")
+    parser.add_argument("--host", default=server_config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=server_config.SERVER_PORT)
+    parser.add_argument("--no-preload", action="store_true", help="Load the corpus on the first job instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] [%(name)s] - %(message)s")
+    service = GenerationService(load_config(args.config), metrics_config, server_config,
+                                host=args.host, port=args.port)
+    if server_config.SERVER_PRELOAD and not args.no_preload:
+        try:
+            logger.info("Preloaded corpus: %s", service.preload())
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Corpus preload failed (%s); it will be loaded by the first job.", e)
+    service.start()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info("generation-service jobs: %s", service.jobs.counts())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/api.py ---
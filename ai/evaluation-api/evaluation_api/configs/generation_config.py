@@ -21,6 +21,14 @@ INPUT_PATHS = ["/Users/venkata/ai/evaluation-api/evaluation_api/sample_data"]
 OUTPUT_PATH = "./output/synthetic_ground_truth.jsonl"
 REJECTED_CHUNKS_PATH = "./output/rejected_chunks.jsonl"
 CACHE_PATH = ".cache/generation/"
+# Output layout for the dataset and rejected-chunks log. --stream appends plain JSONL to
+# <OUTPUT_PATH>.stream.jsonl (kept for --resume) and writes this layout once the run completes.
+# OUTPUT_SHARD_MAX_MB > 0 writes <path>.shards/part-NNNNN.* plus manifest.json, rotating
+# shards at that many MB of uncompressed JSON; 0 writes a single file.
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "jsonl")              # jsonl | parquet (needs pyarrow)
+OUTPUT_COMPRESSION = os.getenv("OUTPUT_COMPRESSION", "none")     # none | gzip | zstd (needs zstandard)
+OUTPUT_SHARD_MAX_MB = float(os.getenv("OUTPUT_SHARD_MAX_MB", "0"))
+OUTPUT_PARQUET_ROW_GROUP_SIZE = int(os.getenv("OUTPUT_PARQUET_ROW_GROUP_SIZE", "10000"))
 
 # --- Chunk Validation Thresholds ---
 MIN_TOKEN_LENGTH = 5
@@ -46,6 +54,13 @@ SELECTION_NUM_BUNDLES = int(os.getenv("SELECTION_NUM_BUNDLES", "0"))
 # Prefer sampling bundles across distinct documents to increase diversity
 SELECTOR_DEDUP_DOCS = bool(os.getenv("SELECTOR_DEDUP_DOCS", "True").lower() in ("true", "1", "yes"))
 
+# --- Low-memory Selection (cli --low-memory) ---
+# Stream the input once: goldens are reservoir-sampled, normalized embeddings spill to a
+# float32 matrix file in this directory, and chunk text is kept only for goldens and their neighbours
+SELECTION_STREAM_DIR = os.getenv("SELECTION_STREAM_DIR", "./cache/selection")
+# Matrix rows scanned per block (block memory ~ rows x EMBED_DIM x 4 bytes)
+SELECTION_STREAM_BLOCK_ROWS = int(os.getenv("SELECTION_STREAM_BLOCK_ROWS", "16384"))
+
 # --- Multi-golden selection (multi-document ground truth) ---
 # Modes: off | cluster
 MULTI_GOLDEN_MODE = os.getenv("MULTI_GOLDEN_MODE", "cluster")
@@ -132,14 +147,51 @@ for _qt, _default in list(QUERY_TYPE_MAX_TOKENS.items()):
             except ValueError:
                 pass
 
+# --- Prompt Token Budget ---
+# Input token budget for the golden + distractor contexts of one generation prompt.
+# Distractors are trimmed first, then goldens are reduced to their salient sentences.
+PROMPT_BUDGET_ENABLED = bool(os.getenv("PROMPT_BUDGET_ENABLED", "True").lower() in ("true", "1", "yes"))
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "1500"))
+# Per-type overrides (types not listed use PROMPT_INPUT_TOKEN_BUDGET)
+PROMPT_TYPE_INPUT_BUDGETS = {
+    "web_search_like": 1000,
+    "keyword": 800,
+    "short": 800,
+    "exact_snippet": 2000,
+    "comparison": 2500,
+}
+# Distractor context kept even when goldens alone exceed the budget
+PROMPT_MIN_DISTRACTOR_TOKENS = int(os.getenv("PROMPT_MIN_DISTRACTOR_TOKENS", "96"))
+# Smallest useful share for a single chunk
+PROMPT_MIN_CHUNK_TOKENS = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "32"))
+# Cache-friendly layout: system instructions + bundle context form a stable prefix shared by
+# every query type of a bundle that has the same input budget
+PROMPT_CACHE_FRIENDLY = bool(os.getenv("PROMPT_CACHE_FRIENDLY", "True").lower() in ("true", "1", "yes"))
+# Send a bundle's first request alone and its siblings back to back after it completes,
+# so they hit the provider's prompt cache
+PROMPT_PREFIX_WARMUP = bool(os.getenv("PROMPT_PREFIX_WARMUP", "True").lower() in ("true", "1", "yes"))
+# tiktoken encoding used for counting (falls back to a character estimate if tiktoken is missing)
+PROMPT_TOKENIZER_ENCODING = os.getenv("PROMPT_TOKENIZER_ENCODING", "o200k_base")
+
 # Azure OpenAI config (for real implementation)
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "")
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "")
 
+# --- Model Cascade (query generation) ---
+# Draft every query on a small deployment and check it with the non-LLM gate (BM25 + coverage);
+# only rejected drafts are regenerated on AZURE_OPENAI_DEPLOYMENT_NAME
+GENERATION_CASCADE = bool(os.getenv("GENERATION_CASCADE", "False").lower() in ("true", "1", "yes"))
+AZURE_OPENAI_DRAFT_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DRAFT_DEPLOYMENT_NAME", "")
+
 # --- Embeddings / Reproducibility ---
 # Set to match input embedding dimension
 EMBED_DIM = 512
 SEED = 42
+# Keep validated embeddings in one shared float32 matrix that worker processes attach to
+# without copying (generation/shared_embeddings.py): "none" | "shm" | "memmap"
+EMBEDDING_STORE = os.getenv("EMBEDDING_STORE", "none")
+# Directory for EMBEDDING_STORE=memmap files (a shared filesystem lets other hosts map them)
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "./cache/embeddings")
 
 # --- Azure Blob (optional path) ---
 # When INPUT_TYPE == "azure_blob_chunks", these are used
@@ -188,6 +240,30 @@ BM25_MIN_MARGIN = 0.5
 COVERAGE_MIN_GOLDEN = 0.6
 COVERAGE_GAP_MIN = 0.2
 EVAL_LLM_SAMPLE_RATE = 0.1
+# Concurrent evaluation threads for llm/hybrid modes (calls share one token bucket;
+# EVAL_LLM_BURST_CAPACITY / EVAL_LLM_REFILL_RATE default to the LLM_* values)
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "8"))
+EVAL_LLM_BURST_CAPACITY = int(os.getenv("EVAL_LLM_BURST_CAPACITY", "0")) or None
+EVAL_LLM_REFILL_RATE = float(os.getenv("EVAL_LLM_REFILL_RATE", "0")) or None
+# RAGAS scoring: one shared metric, test cases scored EVAL_SCORE_BATCH_SIZE at a time
+# with up to EVAL_SCORE_CONCURRENCY concurrent metric calls
+EVAL_SCORE_BATCH_SIZE = int(os.getenv("EVAL_SCORE_BATCH_SIZE", "32"))
+EVAL_SCORE_CONCURRENCY = int(os.getenv("EVAL_SCORE_CONCURRENCY", "8"))
+# Judge model for the RAGAS metric ("" = deepeval's default); cached scores are tagged with it
+RAGAS_JUDGE_MODEL = os.getenv("RAGAS_JUDGE_MODEL", "")
+# Queries scored per sparse batch by the non-LLM (BM25/coverage) gate
+NONLLM_BATCH_SIZE = int(os.getenv("NONLLM_BATCH_SIZE", "1024"))
+
+# Corpus-level retrieval gate (--evaluation-mode retrieval): queries are embedded locally
+# and searched against the whole corpus; the golden doc must rank within MAX_RANK documents.
+# RETRIEVAL_GATE_EMBEDDER is "sentence-transformers" or "package.module:factory" (called
+# with the config); the model must embed into the same space as the chunk embeddings.
+RETRIEVAL_GATE_MAX_RANK = int(os.getenv("RETRIEVAL_GATE_MAX_RANK", "5"))
+RETRIEVAL_GATE_OVERFETCH = int(os.getenv("RETRIEVAL_GATE_OVERFETCH", "3"))  # chunks fetched per rank slot
+RETRIEVAL_GATE_EMBEDDER = os.getenv("RETRIEVAL_GATE_EMBEDDER", "sentence-transformers")
+RETRIEVAL_GATE_EMBED_MODEL = os.getenv("RETRIEVAL_GATE_EMBED_MODEL", "sentence-transformers/distiluse-base-multilingual-cased-v2")
+RETRIEVAL_GATE_EMBED_BATCH_SIZE = int(os.getenv("RETRIEVAL_GATE_EMBED_BATCH_SIZE", "64"))
+RETRIEVAL_GATE_BATCH_SIZE = int(os.getenv("RETRIEVAL_GATE_BATCH_SIZE", "1024"))
 
 # --- LLM Concurrency / Rate Limiting ---
 # Max concurrent LLM calls; tune to your Azure OpenAI limits
@@ -195,6 +271,64 @@ LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))
 # Approx QPS cap across workers - increase based on your Azure OpenAI quota
 LLM_MAX_QPS = float(os.getenv("LLM_MAX_QPS", "10.0"))
 
+# --- Adaptive Concurrency (AIMD) ---
+# When enabled, the number of in-flight LLM calls adapts between LLM_AIMD_MIN and
+# LLM_MAX_WORKERS: +LLM_AIMD_INCREASE per healthy window, x LLM_AIMD_DECREASE_FACTOR
+# on 429s, timeouts, error-rate or p95 latency spikes.
+LLM_ADAPTIVE_CONCURRENCY = bool(os.getenv("LLM_ADAPTIVE_CONCURRENCY", "True").lower() in ("true", "1", "yes"))
+LLM_AIMD_INITIAL = int(os.getenv("LLM_AIMD_INITIAL", "4"))
+LLM_AIMD_MIN = int(os.getenv("LLM_AIMD_MIN", "1"))
+LLM_AIMD_INCREASE = float(os.getenv("LLM_AIMD_INCREASE", "1.0"))
+LLM_AIMD_DECREASE_FACTOR = float(os.getenv("LLM_AIMD_DECREASE_FACTOR", "0.5"))
+LLM_AIMD_MAX_ERROR_RATE = float(os.getenv("LLM_AIMD_MAX_ERROR_RATE", "0.05"))
+# Absolute p95 latency ceiling in ms; 0 = detect spikes relative to the best observed p95
+LLM_AIMD_LATENCY_P95_MS = float(os.getenv("LLM_AIMD_LATENCY_P95_MS", "0"))
+LLM_AIMD_LATENCY_SPIKE_FACTOR = float(os.getenv("LLM_AIMD_LATENCY_SPIKE_FACTOR", "2.0"))
+LLM_AIMD_COOLDOWN_SECONDS = float(os.getenv("LLM_AIMD_COOLDOWN_SECONDS", "2.0"))
+
+# --- Streaming Pipeline (cli --stream) ---
+# Bounded queue size between generation -> evaluation -> writer stages
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+# Evaluation worker threads consuming generated queries
+STREAM_EVAL_WORKERS = int(os.getenv("STREAM_EVAL_WORKERS", "4"))
+# Queries an evaluation worker takes from the queue at once for the batched gates
+# (only what is already queued; a worker never waits to fill a batch)
+STREAM_EVAL_BATCH_SIZE = int(os.getenv("STREAM_EVAL_BATCH_SIZE", "16"))
+# Flush the output file every N accepted records (journaled runs flush before each journal entry)
+STREAM_FLUSH_EVERY = int(os.getenv("STREAM_FLUSH_EVERY", "1"))
+# Append-only journal of completed work items; rerun with --resume to continue
+RUN_JOURNAL_PATH = os.getenv("RUN_JOURNAL_PATH", "./output/run_journal.jsonl")
+
+# --- Profiling (cli --profile [cpu|memory|all], --profile-flamegraph) ---
+# Per-run artifact directories are created below this one (<timestamp>/ unless --profile-dir)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./output/profiles")
+# Functions / allocation sites listed per stage
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "30"))
+# Stack sampling interval for the flame graph (.folded) output
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# Frames kept per allocation; >1 groups allocators by call path but slows tracing further
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+# --- Distributed Generation (cli --shards N, python -m evaluation_api.generation.distributed) ---
+# Run directories (manifest, per-shard bundles/output/journal) are created below this one
+DIST_RUN_DIR = os.getenv("DIST_RUN_DIR", "./output/distributed")
+DIST_NUM_SHARDS = int(os.getenv("DIST_NUM_SHARDS", "4"))
+# Local worker processes for `run` / --shards (0 = one per shard)
+DIST_LOCAL_WORKERS = int(os.getenv("DIST_LOCAL_WORKERS", "0"))
+# Split the LLM_* / EVAL_LLM_* rate limits and worker counts among the workers running at once
+DIST_SPLIT_RATE_LIMITS = bool(os.getenv("DIST_SPLIT_RATE_LIMITS", "True").lower() in ("true", "1", "yes"))
+# Drop queries generated for different expected documents in different bundles
+DIST_MERGE_DROP_AMBIGUOUS = bool(os.getenv("DIST_MERGE_DROP_AMBIGUOUS", "True").lower() in ("true", "1", "yes"))
+
+# --- Offline Batch Mode (--batch prepare|ingest) ---
+# Directory holding requests.jsonl, manifest.jsonl, job.json and output.jsonl
+BATCH_DIR = os.getenv("BATCH_DIR", "./output/batch")
+# none = write files only (submit by hand), azure = Azure OpenAI Batch API, local = mock stand-in
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "none")
+BATCH_API_VERSION = os.getenv("BATCH_API_VERSION", "2024-10-21")
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_LOCAL_DIR = os.getenv("BATCH_LOCAL_DIR", "./cache/local_batch")
+
 # --- LLM Request Optimization ---
 # Optimize for faster query generation
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.5"))  # Lower = more consistent, faster
@@ -216,6 +350,8 @@ CACHE_DATA_LOADING = bool(os.getenv("CACHE_DATA_LOADING", "True").lower() in ("t
 CACHE_VALIDATION = bool(os.getenv("CACHE_VALIDATION", "True").lower() in ("true", "1", "yes"))
 CACHE_SELECTION = bool(os.getenv("CACHE_SELECTION", "True").lower() in ("true", "1", "yes"))
 CACHE_LLM_QUERIES = bool(os.getenv("CACHE_LLM_QUERIES", "True").lower() in ("true", "1", "yes"))
+# Raw evaluation artifacts (BM25 metrics, LLM answer, RAGAS score); acceptance is
+# re-decided from them, so threshold changes need no new LLM calls
 CACHE_EVALUATION = bool(os.getenv("CACHE_EVALUATION", "True").lower() in ("true", "1", "yes"))
 
 # Cache management
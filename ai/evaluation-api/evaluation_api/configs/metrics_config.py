@@ -0,0 +1,34 @@
+# This file stores all the parameters for the search metrics evaluator
+# (python -m evaluation_api.metrics.metrics_evaluator).
+
+import os
+
+# --- Inputs ---
+# Ground truth written by the generation pipeline (JSONL, compressed JSONL, Parquet or a .shards dir)
+GROUND_TRUTH_PATH = os.getenv("GROUND_TRUTH_PATH", "./output/synthetic_ground_truth.jsonl")
+# Search run to score: one JSON object per query, e.g. {"query": "...", "doc_ids": ["d1", "d7", ...]}
+RUN_PATH = os.getenv("RUN_PATH", "./output/search_run.jsonl")
+RUN_QUERY_FIELD = os.getenv("RUN_QUERY_FIELD", "query")
+# Ranked results, best first: doc id strings or {"doc_id": ...} objects
+RUN_DOCS_FIELD = os.getenv("RUN_DOCS_FIELD", "doc_ids")
+
+# --- Metrics ---
+# Cutoffs; NDCG, MRR, MAP, Recall and Precision are reported at every k
+METRICS_K = [int(k) for k in os.getenv("METRICS_K", "1,3,5,10,20,100").split(",") if k.strip()]
+# Queries per dense relevance block (bounds memory at block_size x max(k) floats)
+METRICS_BLOCK_SIZE = int(os.getenv("METRICS_BLOCK_SIZE", "200000"))
+# Threads reading dataset shards in parallel
+METRICS_READ_WORKERS = int(os.getenv("METRICS_READ_WORKERS", "8"))
+
+# --- Out-of-core mode (--stream) ---
+# Hash-join both inputs through on-disk buckets; memory is bounded by one bucket
+METRICS_STREAMING = bool(os.getenv("METRICS_STREAMING", "False").lower() in ("true", "1", "yes"))
+# More buckets = smaller joins; ~1M queries x top-100 fits comfortably in 64
+METRICS_STREAM_PARTITIONS = int(os.getenv("METRICS_STREAM_PARTITIONS", "64"))
+# Run files scored in parallel worker processes (the ground truth is partitioned once)
+METRICS_STREAM_WORKERS = int(os.getenv("METRICS_STREAM_WORKERS", "4"))
+# Where the buckets go (default: system temp dir); needs roughly the size of the inputs without scores
+METRICS_TMP_DIR = os.getenv("METRICS_TMP_DIR", "")
+
+# --- Output ---
+METRICS_OUTPUT_PATH = os.getenv("METRICS_OUTPUT_PATH", "./output/metrics.json")
@@ -0,0 +1,36 @@
+# This file stores all the parameters for the long-lived generation service
+# (python -m evaluation_api.api).
+
+import os
+
+# --- HTTP ---
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8090"))
+
+# Base generation config; each job may override individual UPPERCASE settings
+SERVER_GENERATION_CONFIG = os.getenv(
+    "SERVER_GENERATION_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_config.py"),
+)
+
+# --- Jobs ---
+# Jobs running at once; the rest wait in a bounded queue (full queue -> HTTP 429)
+SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "2"))
+SERVER_MAX_QUEUED = int(os.getenv("SERVER_MAX_QUEUED", "32"))
+# Finished jobs kept for status/results queries (oldest are forgotten first)
+SERVER_MAX_FINISHED_JOBS = int(os.getenv("SERVER_MAX_FINISHED_JOBS", "1000"))
+# Job outputs (<job_id>.jsonl)
+SERVER_OUTPUT_DIR = os.getenv("SERVER_OUTPUT_DIR", "./output/jobs")
+
+# --- Resident state ---
+# Loaded corpora (chunks + search backend) kept warm, keyed by corpus fingerprint (LRU)
+SERVER_MAX_CORPORA = int(os.getenv("SERVER_MAX_CORPORA", "2"))
+# Ground-truth datasets kept warm for metrics jobs, keyed by path, size and mtime (LRU)
+SERVER_MAX_GROUND_TRUTHS = int(os.getenv("SERVER_MAX_GROUND_TRUTHS", "4"))
+# LLM clients / query generators kept warm, keyed by the job's effective config (LRU)
+SERVER_MAX_CLIENTS = int(os.getenv("SERVER_MAX_CLIENTS", "8"))
+# Search resident corpora through a mutable ID-mapped index so chunks can be upserted/deleted
+# in place (POST /corpora/<fingerprint>/chunks) instead of reloading the corpus
+SERVER_INCREMENTAL_INDEX = bool(os.getenv("SERVER_INCREMENTAL_INDEX", "True").lower() in ("true", "1", "yes"))
+# Load the base config's corpus at startup so the first job is already warm
+SERVER_PRELOAD = bool(os.getenv("SERVER_PRELOAD", "True").lower() in ("true", "1", "yes"))
@@ -0,0 +1,262 @@
+# --- File: evaluation_api/generation/batch_mode.py ---
+# Offline batch-job mode for query generation.
+#
+#   prepare: every (bundle, query_type) prompt -> requests.jsonl (+ manifest.jsonl)
+#            and optionally submit it to a batch endpoint (job.json records the job)
+#   ingest:  join the batch output back to the manifest by custom_id, postprocess
+#            into GeneratedQuery objects and hand them to the rest of the pipeline
+#
+# Batch backends: "azure" (Azure OpenAI Batch API), "local" (file-based stand-in
+# that answers with the mock LLM), or "none" (write files only; submit by hand).
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .journal import item_id
+from .models import ChunkData, GeneratedQuery, SelectionBundle
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_FILE = "requests.jsonl"
+MANIFEST_FILE = "manifest.jsonl"
+OUTPUT_FILE = "output.jsonl"
+JOB_FILE = "job.json"
+
+
+# --- Batch backends ---
+class LocalBatchClient:
+    """File-based stand-in for a batch endpoint.
+
+    Jobs live under ``root_dir/<job_id>/``; the output is produced on submit using
+    the mock LLM's deterministic completions, in the Batch API output format.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def submit(self, requests_path: str) -> str:
+        from ..utils.mock_llm_server import build_mock_completion
+
+        with open(requests_path, "rb") as f:
+            job_id = "localbatch-" + hashlib.sha256(f.read()).hexdigest()[:12]
+        job_dir = os.path.join(self.root_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        shutil.copyfile(requests_path, os.path.join(job_dir, "input.jsonl"))
+        with open(requests_path, "r", encoding="utf-8") as fin, \
+                open(os.path.join(job_dir, OUTPUT_FILE), "w", encoding="utf-8") as fout:
+            for line in fin:
+                if not line.strip():
+                    continue
+                req = json.loads(line)
+                fout.write(json.dumps({
+                    "custom_id": req["custom_id"],
+                    "response": {"status_code": 200, "body": build_mock_completion(req["body"])},
+                    "error": None,
+                }) + "\n")
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        done = os.path.exists(os.path.join(self.root_dir, job_id, OUTPUT_FILE))
+        return "completed" if done else "in_progress"
+
+    def download(self, job_id: str, dest_path: str):
+        shutil.copyfile(os.path.join(self.root_dir, job_id, OUTPUT_FILE), dest_path)
+
+
+class AzureBatchClient:
+    """Azure OpenAI Batch API (requires a Global-Batch deployment)."""
+
+    def __init__(self, config):
+        from openai import AzureOpenAI  # type: ignore
+
+        api_key = (
+            os.environ.get("AZURE_OPENAI_KEY")
+            or os.environ.get("AZURE_OPENAI_API_KEY")
+            or os.environ.get("OPENAI_API_KEY")
+        )
+        endpoint = getattr(config, "AZURE_OPENAI_ENDPOINT", None)
+        if not (endpoint and api_key):
+            raise RuntimeError("AZURE_OPENAI_ENDPOINT and an Azure OpenAI key are required for batch submission")
+        self.client = AzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=getattr(config, "BATCH_API_VERSION", "2024-10-21"),
+        )
+        self.completion_window = getattr(config, "BATCH_COMPLETION_WINDOW", "24h")
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/chat/completions",
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def download(self, job_id: str, dest_path: str):
+        batch = self.client.batches.retrieve(job_id)
+        if not batch.output_file_id:
+            raise RuntimeError(f"Batch {job_id} has no output file (status={batch.status})")
+        content = self.client.files.content(batch.output_file_id)
+        with open(dest_path, "wb") as f:
+            f.write(content.read())
+
+
+def create_batch_client(config):
+    """Return the batch client for BATCH_BACKEND, or None when files are submitted by hand."""
+    backend = str(getattr(config, "BATCH_BACKEND", "none")).lower()
+    if backend == "azure":
+        return AzureBatchClient(config)
+    if backend == "local":
+        return LocalBatchClient(getattr(config, "BATCH_LOCAL_DIR", "./cache/local_batch"))
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown BATCH_BACKEND: {backend}")
+
+
+# --- Prepare ---
+def prepare_batch(bundles: List[SelectionBundle], q_generator, batch_dir: str, client=None) -> Dict[str, Any]:
+    """Serialize every (bundle, query_type) prompt into a batch request file.
+
+    ``custom_id`` is the stable ``<bundle_id>:<query_type>`` work item ID; the manifest
+    keeps the chunk keys needed to rebuild the bundle at ingest time.
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    requests_path = os.path.join(batch_dir, REQUESTS_FILE)
+    manifest_path = os.path.join(batch_dir, MANIFEST_FILE)
+    # An output left over from an earlier batch would otherwise be ingested against this manifest
+    stale_output = os.path.join(batch_dir, OUTPUT_FILE)
+    if os.path.exists(stale_output):
+        os.remove(stale_output)
+        logger.info("Removed stale batch output %s", stale_output)
+    seen = set()
+    count = 0
+    with open(requests_path, "w", encoding="utf-8") as freq, open(manifest_path, "w", encoding="utf-8") as fman:
+        for bundle, query_type in q_generator.plan_tasks(bundles):
+            if query_type == "comparison" and len(bundle.golden_chunks) < 2:
+                continue
+            custom_id = item_id(bundle.bundle_id(), query_type)
+            if custom_id in seen:
+                continue
+            seen.add(custom_id)
+            prompt, max_tokens = q_generator._build_prompt(bundle, query_type)
+            freq.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/chat/completions",
+                "body": q_generator._request_body(prompt, max_tokens),
+            }) + "\n")
+            fman.write(json.dumps({
+                "custom_id": custom_id,
+                "query_type": query_type,
+                "golden": [[c.doc_id, c.chunk_id] for c in bundle.golden_chunks],
+                "distractors": [[c.doc_id, c.chunk_id] for c in bundle.distractor_chunks],
+            }) + "\n")
+            count += 1
+    logger.info("Wrote %d batch requests to %s", count, requests_path)
+
+    job = {"requests": count, "requests_path": requests_path, "job_id": None, "submitted_at": None}
+    if client is not None:
+        job["job_id"] = client.submit(requests_path)
+        job["submitted_at"] = time.time()
+        logger.info("Submitted batch job %s", job["job_id"])
+    with open(os.path.join(batch_dir, JOB_FILE), "w", encoding="utf-8") as f:
+        json.dump(job, f, indent=2)
+    return job
+
+
+# --- Ingest ---
+def fetch_output(batch_dir: str, client=None) -> Optional[str]:
+    """Return the local batch output path, downloading it when the job has completed."""
+    output_path = os.path.join(batch_dir, OUTPUT_FILE)
+    if os.path.exists(output_path):
+        return output_path
+    job_path = os.path.join(batch_dir, JOB_FILE)
+    if client is None or not os.path.exists(job_path):
+        logger.error("No batch output at %s; place the downloaded output file there.", output_path)
+        return None
+    with open(job_path, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    if not job.get("job_id"):
+        logger.error("Batch in %s was never submitted.", batch_dir)
+        return None
+    status = client.status(job["job_id"])
+    if status != "completed":
+        logger.info("Batch job %s is %s; rerun ingest later.", job["job_id"], status)
+        return None
+    client.download(job["job_id"], output_path)
+    return output_path
+
+
+def _parse_output_line(rec: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Return (content, error) for one batch output record."""
+    if rec.get("error"):
+        return None, str(rec["error"])
+    response = rec.get("response") or {}
+    if int(response.get("status_code", 0)) != 200:
+        return None, f"status {response.get('status_code')}"
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None, "malformed response body"
+    return (content or "").strip(), None
+
+
+def ingest_batch(batch_dir: str, chunks: List[ChunkData], q_generator, output_path: Optional[str] = None) -> List[GeneratedQuery]:
+    """Join batch output with the manifest and postprocess into GeneratedQuery objects."""
+    output_path = output_path or os.path.join(batch_dir, OUTPUT_FILE)
+    by_key: Dict[Tuple[str, str], ChunkData] = {(c.doc_id, c.chunk_id): c for c in chunks}
+
+    manifest: Dict[str, Dict[str, Any]] = {}
+    with open(os.path.join(batch_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                manifest[rec["custom_id"]] = rec
+
+    results: List[GeneratedQuery] = []
+    failed = missing_chunks = unknown = 0
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            entry = manifest.get(rec.get("custom_id"))
+            if entry is None:
+                unknown += 1
+                continue
+            content, error = _parse_output_line(rec)
+            if error or not content:
+                failed += 1
+                logger.debug("Batch item %s failed: %s", rec.get("custom_id"), error)
+                continue
+            try:
+                bundle = SelectionBundle(
+                    golden_chunks=[by_key[(d, c)] for d, c in entry["golden"]],
+                    distractor_chunks=[by_key[(d, c)] for d, c in entry["distractors"]],
+                )
+            except KeyError:
+                missing_chunks += 1
+                continue
+            if q_generator.cache_enabled and q_generator.cache:
+                # Make batch results reusable by later interactive runs
+                q_generator._cache_query(bundle, entry["query_type"], content)
+            results.append(q_generator.build_query(bundle, entry["query_type"], content))
+    if q_generator.cache_enabled and q_generator.cache:
+        q_generator.cache.flush()
+
+    logger.info("Ingested %d/%d batch results (%d failed, %d with missing chunks, %d unknown IDs).",
+                len(results), len(manifest), failed, missing_chunks, unknown)
+    return results
+
+# --- End File: evaluation_api/generation/batch_mode.py ---
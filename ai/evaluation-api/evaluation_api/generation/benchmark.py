@@ -0,0 +1,162 @@
+# --- File: evaluation_api/generation/benchmark.py ---
+# Throughput benchmark for the query generation and evaluation stages.
+# Drives QueryGenerator and evaluation_layer against the local mock LLM server
+# (or any OpenAI-compatible endpoint) and reports queries/sec, p95 latency and retries.
+#
+# Example:
+#   python -m evaluation_api.generation.benchmark --num-bundles 200 --latency-ms 400 --rate-limit-prob 0.05
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+from . import evaluation_layer
+from . import query_generator
+from .cli import load_config, setup_logging
+from .models import ChunkData, SelectionBundle
+from ..utils.mock_llm_server import MockLLMConfig, MockLLMServer
+
+logger = logging.getLogger("generation.benchmark")
+
+_DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), "..", "configs", "generation_config.py")
+
+_VOCAB = (
+    "model embedding latency throughput index vector shard replica cluster query document "
+    "retrieval ranking token context window benchmark dataset release version gateway cache "
+    "storage partition region tenant quota policy schema pipeline deployment endpoint metric"
+).split()
+
+
+def synthetic_bundles(num_bundles: int, num_distractors: int, words_per_chunk: int = 120, seed: int = 42) -> List[SelectionBundle]:
+    """Random-text bundles so the benchmark does not depend on a corpus or search backend."""
+    rng = random.Random(seed)
+
+    def chunk(doc: int, idx: int) -> ChunkData:
+        words = [rng.choice(_VOCAB) for _ in range(words_per_chunk)]
+        words[0] = f"Item-{doc}-{idx}"
+        return ChunkData(
+            doc_id=f"bench-doc-{doc}",
+            chunk_id=f"c-{idx}",
+            chunk_text=" ".join(words) + ".",
+            embedding=[],
+        )
+
+    bundles = []
+    for b in range(num_bundles):
+        golden = chunk(b, 0)
+        distractors = [chunk(num_bundles + b * num_distractors + i, 0) for i in range(num_distractors)]
+        bundles.append(SelectionBundle(golden_chunks=[golden], distractor_chunks=distractors))
+    return bundles
+
+
+def run_benchmark(config, bundles: List[SelectionBundle], evaluation_mode: str) -> Dict[str, Any]:
+    """Run generation then evaluation and return per-stage throughput numbers."""
+    report: Dict[str, Any] = {"bundles": len(bundles), "evaluation_mode": evaluation_mode}
+
+    q_generator = query_generator.QueryGenerator(config)
+    started = time.perf_counter()
+    generated = q_generator.generate_queries(bundles)
+    gen_elapsed = time.perf_counter() - started
+    report["generation"] = {
+        "queries": len(generated),
+        "elapsed_s": round(gen_elapsed, 3),
+        "queries_per_sec": round(len(generated) / gen_elapsed, 3) if gen_elapsed > 0 else 0.0,
+        "llm": q_generator.get_call_stats(),
+        "prompts": q_generator.get_prompt_stats(),
+    }
+
+    # One evaluation client, so its call stats (p95 latency, retries) can be reported
+    llm = evaluation_layer.prepare_llm(config, evaluation_mode)
+    started = time.perf_counter()
+    accepted = evaluation_layer.evaluate_queries(generated, config, evaluation_mode, llm=llm)
+    eval_elapsed = time.perf_counter() - started
+    eval_stats = getattr(llm[0], "stats", None)
+    report["evaluation"] = {
+        "queries": len(generated),
+        "accepted": len(accepted),
+        "elapsed_s": round(eval_elapsed, 3),
+        "queries_per_sec": round(len(generated) / eval_elapsed, 3) if eval_elapsed > 0 else 0.0,
+        "llm": eval_stats.snapshot() if eval_stats is not None else None,
+    }
+    total = gen_elapsed + eval_elapsed
+    report["end_to_end_queries_per_sec"] = round(len(accepted) / total, 3) if total > 0 else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generation + evaluation against a mock LLM endpoint")
+    parser.add_argument("--config", type=str, default=_DEFAULT_CONFIG, help="Path to the generation_config.py file")
+    parser.add_argument("--evaluation-mode", type=str, default="llm", choices=["none", "nonllm", "llm", "hybrid"])
+    parser.add_argument("--num-bundles", type=int, default=100)
+    parser.add_argument("--endpoint", type=str, default="",
+                        help="Use an already running OpenAI-compatible endpoint instead of starting the mock server")
+    parser.add_argument("--mode", default="mock", choices=["mock", "record", "replay"])
+    parser.add_argument("--recordings", default="", help="JSONL file for record/replay")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=250.0)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--report", type=str, default="", help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    setup_logging()
+    config = load_config(args.config)
+    # Every request must reach the endpoint for the numbers to mean anything
+    config.ENABLE_CACHING = False
+    if not getattr(config, "AZURE_OPENAI_DEPLOYMENT_NAME", ""):
+        config.AZURE_OPENAI_DEPLOYMENT_NAME = "mock-deployment"
+
+    real_key = (
+        os.environ.get("AZURE_OPENAI_KEY")
+        or os.environ.get("AZURE_OPENAI_API_KEY")
+        or os.environ.get("OPENAI_API_KEY")
+    )
+    server = None
+    if args.endpoint:
+        config.AZURE_OPENAI_ENDPOINT = args.endpoint
+    else:
+        server = MockLLMServer(MockLLMConfig(
+            mode=args.mode,
+            latency_dist=args.latency_dist,
+            latency_ms=args.latency_ms,
+            latency_spread=args.latency_spread,
+            rate_limit_prob=args.rate_limit_prob,
+            capacity=args.capacity,
+            retry_after_s=args.retry_after,
+            recordings_path=args.recordings,
+            upstream_endpoint=getattr(config, "AZURE_OPENAI_ENDPOINT", ""),
+            upstream_api_key=real_key or "",
+            seed=int(getattr(config, "SEED", 42)),
+        )).start()
+        config.AZURE_OPENAI_ENDPOINT = server.url
+    if not real_key:
+        os.environ["AZURE_OPENAI_API_KEY"] = "mock-key"
+
+    bundles = synthetic_bundles(args.num_bundles, int(getattr(config, "NUM_DISTRACTORS", 3)),
+                                seed=int(getattr(config, "SEED", 42)))
+    try:
+        report = run_benchmark(config, bundles, args.evaluation_mode)
+        if server is not None:
+            report["server"] = server.stats()
+    finally:
+        if server is not None:
+            server.stop()
+
+    logger.info("Benchmark report:\n%s", json.dumps(report, indent=2))
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Benchmark report saved to %s", args.report)
+
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/generation/benchmark.py ---
@@ -0,0 +1,220 @@
+# --- File: evaluation_api/generation/bm25_scorer.py ---
+# Vectorized BM25 / coverage scoring for the non-LLM evaluation gate.
+#
+# Each query is judged against its own mini-corpus [golden (joined), distractor, ...],
+# exactly like evaluation_layer._bm25_nonllm_check with rank_bm25.BM25Okapi, but:
+#   - every chunk is tokenized once into a shared vocabulary (cached term counts)
+#   - all mini-corpora of a batch are stacked into one CSR term matrix and scored
+#     with sparse ops (per-corpus IDF, avgdl and epsilon floor included)
+
+import logging
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import ChunkData, GeneratedQuery
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-zA-Z0-9]+")
+
+
+@lru_cache(maxsize=1)
+def stop_words() -> FrozenSet[str]:
+    """sklearn's English stop words, loaded once (empty if sklearn is missing)."""
+    try:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS  # type: ignore
+        return frozenset(ENGLISH_STOP_WORDS)
+    except Exception:  # noqa: BLE001
+        return frozenset()
+
+
+def tokenize(text: str) -> List[str]:
+    stop = stop_words()
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in stop]
+
+
+class _TermTables:
+    """Vocabulary and cached chunk term counts; term IDs are only valid within one table."""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.chunk_terms: Dict[Tuple[str, str, bytes], Dict[int, int]] = {}
+
+
+class BM25BatchScorer:
+    """Batch non-LLM gate: same decisions and metrics as ``_bm25_nonllm_check``.
+
+    Term tables are reset once they exceed ``max_cached_chunks`` chunks or ``max_terms``
+    terms, so a long-lived scorer (e.g. in the resident server) stays bounded.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 max_cached_chunks: int = 50000, max_terms: int = 500000):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.max_cached_chunks = max(1, int(max_cached_chunks))
+        self.max_terms = max(1, int(max_terms))
+        self._tables = _TermTables()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Drop the cached vocabulary and chunk term counts (e.g. when the corpus changes)."""
+        with self._lock:
+            self._tables = _TermTables()
+
+    def _current_tables(self) -> _TermTables:
+        # A batch keeps the table it started with, so a concurrent reset never mixes term IDs
+        with self._lock:
+            tables = self._tables
+            if len(tables.chunk_terms) > self.max_cached_chunks or len(tables.vocab) > self.max_terms:
+                logger.debug("Resetting BM25 term tables (%d chunks, %d terms cached).",
+                             len(tables.chunk_terms), len(tables.vocab))
+                tables = self._tables = _TermTables()
+            return tables
+
+    # --- Tokenization (cached) ---
+    def _term_counts(self, tables: _TermTables, text: str) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        with self._lock:
+            for tok in tokenize(text):
+                tid = tables.vocab.setdefault(tok, len(tables.vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+        return counts
+
+    def _chunk_counts(self, tables: _TermTables, chunk: ChunkData) -> Dict[int, int]:
+        key = chunk.content_key()
+        counts = tables.chunk_terms.get(key)
+        if counts is None:
+            counts = self._term_counts(tables, chunk.chunk_text)
+            with self._lock:
+                tables.chunk_terms[key] = counts
+        return counts
+
+    # --- Scoring ---
+    def check(self, queries: Sequence[GeneratedQuery], config) -> List[Tuple[bool, Dict[str, Any]]]:
+        """Return ``(accept, metrics)`` for every query, in order."""
+        if not queries:
+            return []
+        from scipy import sparse  # type: ignore
+
+        tables = self._current_tables()
+        rows: List[Dict[int, int]] = []
+        group: List[int] = []
+        golden_row: List[int] = []
+        q_rows: List[Dict[int, int]] = []
+        for qi, q in enumerate(queries):
+            # Golden contexts are scored as one joined document
+            golden: Dict[int, int] = {}
+            for c in q.golden_chunks:
+                for tid, n in self._chunk_counts(tables, c).items():
+                    golden[tid] = golden.get(tid, 0) + n
+            golden_row.append(len(rows))
+            rows.append(golden)
+            group.append(qi)
+            for c in getattr(q, "distractor_chunks", []) or []:
+                rows.append(self._chunk_counts(tables, c))
+                group.append(qi)
+            q_rows.append(self._term_counts(tables, q.query))
+
+        n_q, n_rows, n_terms = len(queries), len(rows), len(tables.vocab)
+        D = _csr(rows, n_terms)
+        Q = _csr(q_rows, n_terms)
+        g = np.asarray(group, dtype=np.int64)
+        G = sparse.csr_matrix((np.ones(n_rows), (g, np.arange(n_rows))), shape=(n_q, n_rows))
+
+        doc_len = np.asarray(D.sum(axis=1)).ravel()
+        corpus_size = np.bincount(g, minlength=n_q).astype(np.float64)
+        avgdl = np.bincount(g, weights=doc_len, minlength=n_q) / corpus_size
+
+        # Per-corpus document frequencies and ATIRE IDF with the epsilon floor
+        D_bin = D.copy()
+        D_bin.data[:] = 1.0
+        DF = (G @ D_bin).tocsr()
+        df_rows = np.repeat(np.arange(n_q), np.diff(DF.indptr))
+        idf = np.log(corpus_size[df_rows] - DF.data + 0.5) - np.log(DF.data + 0.5)
+        vocab_size = np.maximum(np.diff(DF.indptr), 1)
+        avg_idf = np.bincount(df_rows, weights=idf, minlength=n_q) / vocab_size
+        idf = np.where(idf < 0, self.epsilon * avg_idf[df_rows], idf)
+        IDF = sparse.csr_matrix((idf, DF.indices, DF.indptr), shape=DF.shape)
+
+        # Saturated term frequencies, weighted by query term counts and IDF of the row's corpus
+        d_rows = np.repeat(np.arange(n_rows), np.diff(D.indptr))
+        tf = D.data
+        denom = tf + self.k1 * (1 - self.b + self.b * doc_len[d_rows] / avgdl[g[d_rows]])
+        TF = sparse.csr_matrix((tf * (self.k1 + 1) / denom, D.indices, D.indptr), shape=D.shape)
+        scores = np.asarray(TF.multiply(Q[g]).multiply(IDF[g]).sum(axis=1)).ravel()
+
+        # Coverage: share of distinct query terms present in a document
+        Q_bin = Q.copy()
+        Q_bin.data[:] = 1.0
+        q_set_size = np.maximum(np.asarray(Q_bin.sum(axis=1)).ravel(), 1.0)
+        overlap = np.asarray(D_bin.multiply(Q_bin[g]).sum(axis=1)).ravel()
+        coverage = overlap / q_set_size[g]
+
+        results: List[Tuple[bool, Dict[str, Any]]] = []
+        ends = golden_row[1:] + [n_rows]
+        for qi in range(n_q):
+            start, end = golden_row[qi], ends[qi]
+            group_scores = scores[start:end]
+            golden_score = float(group_scores[0])
+            distractor_scores = group_scores[1:]
+            best_distractor_score = float(distractor_scores.max()) if len(distractor_scores) else 0.0
+            margin = golden_score - best_distractor_score
+            rank = 1 + int(np.count_nonzero(group_scores > golden_score))
+            golden_cov = float(coverage[start])
+            best_dist_cov = 0.0
+            if len(distractor_scores):
+                # argmax returns the first maximum, matching max(..., key=...) in the per-query check
+                best_dist_cov = float(coverage[start + 1 + int(np.argmax(distractor_scores))])
+            metrics = {
+                "bm25_rank": rank,
+                "bm25_margin": round(margin, 4),
+                "golden_score": round(golden_score, 4),
+                "best_distractor_score": round(best_distractor_score, 4),
+                "golden_coverage": round(golden_cov, 4),
+                "best_distractor_coverage": round(best_dist_cov, 4),
+            }
+            results.append((nonllm_accept(metrics, config), metrics))
+        return results
+
+
+def nonllm_accept(metrics: Dict[str, Any], config) -> bool:
+    """Acceptance decision of the non-LLM gate from its (threshold-independent) metrics."""
+    min_margin = float(getattr(config, "BM25_MIN_MARGIN", 0.5))
+    min_golden_cov = float(getattr(config, "COVERAGE_MIN_GOLDEN", 0.6))
+    min_cov_gap = float(getattr(config, "COVERAGE_GAP_MIN", 0.2))
+    golden_cov = metrics["golden_coverage"]
+    return (metrics["bm25_rank"] == 1) and (metrics["bm25_margin"] >= min_margin) and \
+        (golden_cov >= min_golden_cov) and ((golden_cov - metrics["best_distractor_coverage"]) >= min_cov_gap)
+
+
+def _csr(rows: List[Dict[int, int]], n_terms: int):
+    from scipy import sparse  # type: ignore
+
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(r) for r in rows])
+    indices = np.fromiter((t for r in rows for t in r), dtype=np.int64, count=int(indptr[-1]))
+    data = np.fromiter((n for r in rows for n in r.values()), dtype=np.float64, count=int(indptr[-1]))
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_terms))
+    # Same term order in every row, so documents with equal contributions get bit-identical sums
+    matrix.sort_indices()
+    return matrix
+
+
+def create_scorer(evaluation_mode: str) -> Optional[BM25BatchScorer]:
+    """Batch scorer for modes that use the non-LLM gate; None if scipy is unavailable."""
+    if (evaluation_mode or "").lower() not in ("nonllm", "hybrid"):
+        return None
+    try:
+        import scipy.sparse  # type: ignore  # noqa: F401
+    except ImportError:
+        logger.info("scipy not installed; using the per-query BM25 check.")
+        return None
+    return BM25BatchScorer()
+
+# --- End File: evaluation_api/generation/bm25_scorer.py ---
@@ -3,27 +3,52 @@
 # and their "distractor" (hard negative) neighbors.
 
 import logging
-import random
-from typing import List
+from typing import List, Optional
 from tqdm import tqdm
 
 from .models import ChunkData, SelectionBundle
-from .search_backends import create_search_backend
+from ..utils.rng import rng_stream
 
 logger = logging.getLogger(__name__)
 
+def target_bundles(config) -> Optional[int]:
+    """Number of bundles to select: SELECTION_NUM_BUNDLES, or estimated from SELECTION_TARGET_QUERIES
+    and the per-bundle query sampling; None means sample by SELECTION_SAMPLE_RATE."""
+    direct_bundles = int(getattr(config, "SELECTION_NUM_BUNDLES", 0) or 0)
+    if direct_bundles > 0:
+        return direct_bundles
+    # Estimate bundles from target queries and per-bundle query sampling
+    target_queries = int(getattr(config, "SELECTION_TARGET_QUERIES", 0) or 0)
+    if target_queries <= 0:
+        return None
+    sampling_mode = str(getattr(config, "QUERY_SAMPLING_MODE", "all_per_bundle")).lower()
+    if sampling_mode == "sample_per_bundle":
+        min_q = int(getattr(config, "MIN_QUERY_TYPES_PER_BUNDLE", 1))
+        max_q = int(getattr(config, "MAX_QUERY_TYPES_PER_BUNDLE", max(1, len(getattr(config, "QUERY_TYPES", ["keyword"])))))
+        avg_q = max(1, int(round((min_q + max_q) / 2)))
+        queries_per_bundle = avg_q
+    else:
+        queries_per_bundle = max(1, len(getattr(config, "QUERY_TYPES", ["keyword"])) )
+    return max(1, (target_queries + queries_per_bundle - 1) // queries_per_bundle)
+
 class ContextSelector:
-    def __init__(self, chunks: List[ChunkData], config, backend=None):
+    def __init__(self, chunks: List[ChunkData], config, backend=None, bundle_cache=None):
         self.chunks = chunks
         self.config = config
-        # Set deterministic seeds if provided
+        # Optional per-golden cache (incremental_index.SelectionCache) of a resident corpus
+        self.bundle_cache = bundle_cache
+        # Selection draws from its own stream; the global random state is left untouched
         seed = getattr(self.config, "SEED", None)
+        self.rng = rng_stream(seed, "selection")
         if seed is not None:
-            random.seed(seed)
             logger.info("ContextSelector seeded with SEED=%s", seed)
         
         # Initialize or reuse search backend
-        self.backend = backend if backend is not None else create_search_backend(chunks, config)
+        if backend is None:
+            # Backends pull in faiss / the Azure Search SDK; only import them when one is built here
+            from .search_backends import create_search_backend
+            backend = create_search_backend(chunks, config)
+        self.backend = backend
         if self.backend is None:
             raise RuntimeError("Failed to initialize search backend")
 
@@ -40,24 +65,7 @@ class ContextSelector:
             return []
             
         # Determine target number of bundles
-        direct_bundles = int(getattr(self.config, "SELECTION_NUM_BUNDLES", 0) or 0)
-        if direct_bundles > 0:
-            target_bundles = direct_bundles
-        else:
-            # Estimate bundles from target queries and per-bundle query sampling
-            target_queries = int(getattr(self.config, "SELECTION_TARGET_QUERIES", 0) or 0)
-            if target_queries > 0:
-                sampling_mode = str(getattr(self.config, "QUERY_SAMPLING_MODE", "all_per_bundle")).lower()
-                if sampling_mode == "sample_per_bundle":
-                    min_q = int(getattr(self.config, "MIN_QUERY_TYPES_PER_BUNDLE", 1))
-                    max_q = int(getattr(self.config, "MAX_QUERY_TYPES_PER_BUNDLE", max(1, len(getattr(self.config, "QUERY_TYPES", ["keyword"])))))
-                    avg_q = max(1, int(round((min_q + max_q) / 2)))
-                    queries_per_bundle = avg_q
-                else:
-                    queries_per_bundle = max(1, len(getattr(self.config, "QUERY_TYPES", ["keyword"])) )
-                target_bundles = max(1, (target_queries + queries_per_bundle - 1) // queries_per_bundle)
-            else:
-                target_bundles = None
+        target = target_bundles(self.config)
 
         # Determine sampling unit
         sample_mode = getattr(self.config, "SELECTION_SAMPLE_MODE", "chunks").lower()
@@ -70,27 +78,34 @@ class ContextSelector:
             doc_to_chunks = defaultdict(list)
             for c in self.chunks:
                 doc_to_chunks[c.doc_id].append(c)
-            doc_ids = list(doc_to_chunks.keys())
-            if target_bundles is not None:
-                num_docs = min(target_bundles, len(doc_ids))
+            # Sort so the sample does not depend on (parallel) load order
+            for chunks in doc_to_chunks.values():
+                chunks.sort(key=lambda c: c.chunk_id)
+            doc_ids = sorted(doc_to_chunks.keys())
+            if target is not None:
+                num_docs = min(target, len(doc_ids))
             else:
                 num_docs = max(1, min(int(len(doc_ids) * sample_rate), len(doc_ids)))
             if num_docs > len(doc_ids):
                 num_docs = len(doc_ids)
-            sampled_docs = random.sample(doc_ids, num_docs) if doc_ids else []
-            sampled_chunks = [random.choice(doc_to_chunks[d]) for d in sampled_docs]
+            sampled_docs = self.rng.sample(doc_ids, num_docs) if doc_ids else []
+            sampled_chunks = [self.rng.choice(doc_to_chunks[d]) for d in sampled_docs]
         else:
             # Chunk-based sampling
             total = len(self.chunks)
-            if target_bundles is not None:
-                num_to_sample = min(target_bundles, total)
+            if target is not None:
+                num_to_sample = min(target, total)
             else:
                 num_to_sample = max(1, min(int(total * sample_rate), total))
-            sampled_chunks = random.sample(self.chunks, num_to_sample) if total else []
+            ordered = sorted(self.chunks, key=lambda c: (c.doc_id, c.chunk_id))
+            sampled_chunks = self.rng.sample(ordered, num_to_sample) if total else []
 
         logger.info("Attempting to select %s contexts (mode=%s) using %s backend...",
                    len(sampled_chunks), sample_mode, self.backend.get_backend_info().get('backend', 'Unknown'))
-        
+        return self.build_bundles(sampled_chunks)
+
+    def build_bundles(self, sampled_chunks: List[ChunkData]) -> List[SelectionBundle]:
+        """Finds distractors (and, in cluster mode, extra goldens) for already sampled golden chunks."""
         bundles = []
         mode = str(getattr(self.config, "MULTI_GOLDEN_MODE", "off")).lower()
         sim_thr = float(getattr(self.config, "GOLDEN_SIM_THRESHOLD", 0.92))
@@ -98,6 +113,12 @@ class ContextSelector:
         min_golden_docs = int(getattr(self.config, "GOLDEN_MIN_DOCS", 2))
 
         for golden_chunk in tqdm(sampled_chunks, desc="Selecting contexts"):
+            # Read before selecting, so a bundle computed across an index change is not cached
+            cache_revision = self.bundle_cache.revision if self.bundle_cache is not None else None
+            cached = self.bundle_cache.get(golden_chunk) if self.bundle_cache is not None else None
+            if cached is not None:
+                bundles.append(cached)
+                continue
             try:
                 if mode == "cluster":
                     # Get a larger pool to choose both multi-goldens and distractors
@@ -138,7 +159,7 @@ class ContextSelector:
                         logger.debug("Chunk %s found only %s/%s distractors (cluster mode).",
                                      golden_chunk.chunk_id, len(distractors), self.config.NUM_DISTRACTORS)
 
-                    bundles.append(SelectionBundle(golden_chunks=golden_list, distractor_chunks=distractors))
+                    bundle = SelectionBundle(golden_chunks=golden_list, distractor_chunks=distractors)
                 else:
                     # Single-golden mode (existing behavior)
                     distractor_chunks = self.backend.find_similar_chunks(
@@ -148,7 +169,10 @@ class ContextSelector:
                     if len(distractor_chunks) < self.config.NUM_DISTRACTORS:
                         logger.debug("Chunk %s found only %s/%s distractors.",
                                      golden_chunk.chunk_id, len(distractor_chunks), self.config.NUM_DISTRACTORS)
-                    bundles.append(SelectionBundle(golden_chunks=[golden_chunk], distractor_chunks=distractor_chunks))
+                    bundle = SelectionBundle(golden_chunks=[golden_chunk], distractor_chunks=distractor_chunks)
+                bundles.append(bundle)
+                if self.bundle_cache is not None:
+                    self.bundle_cache.put(golden_chunk, bundle, revision=cache_revision)
             except (ValueError, RuntimeError) as e:
                 logger.warning("Error finding distractors for chunk %s: %s", golden_chunk.chunk_id, e)
                 
@@ -4,7 +4,6 @@
 import logging
 import numpy as np
 from typing import List, Tuple, Optional, Any
-from sklearn.metrics.pairwise import cosine_similarity
 from tqdm import tqdm
 
 from .models import ChunkData
@@ -162,7 +161,8 @@ def validate_duplicates_legacy(valid_chunks: List[ChunkData], rejected_chunks: L
         use_faiss = False
         logger.warning("FAISS unavailable; falling back to O(n^2) cosine duplicate check for n=%s (below guard=%s).", num, large_guard)
         try:
-            sim_matrix = cosine_similarity(embeddings_norm)
+            # Rows are L2-normalized, so the Gram matrix is the cosine similarity matrix
+            sim_matrix = embeddings_norm @ embeddings_norm.T
             for i in tqdm(range(len(valid_chunks)), desc="Finding duplicates (cosine)"):
                 if i in duplicate_indices:
                     continue
@@ -6,16 +6,15 @@ import logging
 import importlib.util
 import sys
 import os
-import json
-from typing import List
-
-# Import all the modules in the pipeline
-from . import data_loader
-from . import chunk_validator
-from . import chunk_selector
-from . import query_generator
-from . import evaluation_layer
+from typing import Any, Iterable, List, Optional, Tuple
+
+# Stage modules (numpy, tqdm, search backends, LLM clients) are imported where a stage
+# runs, so --help and --dry-run start without them (see generation/startup_benchmark.py)
+from .journal import RunJournal, truncate_output
 from .models import ValidatedGroundTruth, ChunkData
+from ..utils.cache_utils import create_config_hash
+from ..utils.dataset_io import create_dataset_writer
+from ..utils.profiling import PROFILE_MODES, RunProfiler
 
 # Module-level logger
 logger = logging.getLogger("generation.cli")
@@ -47,28 +46,103 @@ def setup_logging():
         ]
     )
 
-def save_dataset(dataset: List[ValidatedGroundTruth], path: str):
-    """Saves the final dataset to a JSONL file."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, 'w', encoding='utf-8') as f:
-        for item in dataset:
-            f.write(json.dumps(item.to_dict()) + "\n")
-    logger.info("Final dataset saved to %s", path)
+def save_dataset(dataset: Iterable[ValidatedGroundTruth], path: str, config=None):
+    """Streams the final dataset to disk (format/compression/shards from OUTPUT_* config)."""
+    with create_dataset_writer(config, path) as writer:
+        writer.write_all(item.to_dict() for item in dataset)
+    logger.info("Final dataset saved to %s (%d records)", writer.path, writer.records)
 
-def save_rejected(chunks: List[ChunkData], path: str):
+def save_rejected(chunks: List[ChunkData], path: str, config=None):
     """Saves the rejected chunks for auditing."""
     if not path or not chunks:
         return
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, 'w', encoding='utf-8') as f:
-        for chunk in chunks:
-            f.write(json.dumps({
-                "doc_id": chunk.doc_id,
-                "chunk_id": chunk.chunk_id,
-                "chunk_text": chunk.chunk_text,
-                "reject_reason": chunk.validation_meta.get('reject_reason', 'Unknown')
-            }) + "\n")
-    logger.info("Rejected chunks log saved to %s", path)
+    with create_dataset_writer(config, path) as writer:
+        writer.write_all({
+            "doc_id": chunk.doc_id,
+            "chunk_id": chunk.chunk_id,
+            "chunk_text": chunk.chunk_text,
+            "reject_reason": chunk.validation_meta.get('reject_reason', 'Unknown')
+        } for chunk in chunks)
+    logger.info("Rejected chunks log saved to %s", writer.path)
+
+
+def load_corpus(config, drop_embeddings: bool = True,
+                profiler: Optional[RunProfiler] = None) -> Tuple[List[ChunkData], List[ChunkData], Optional[Any]]:
+    """Loads and validates the corpus; returns (valid_chunks, rejected_chunks, backend)."""
+    from . import chunk_validator, data_loader
+
+    profiler = profiler or RunProfiler()
+    with profiler.stage("load"):
+        all_chunks = data_loader.load_data(config)
+    if not all_chunks:
+        logger.error("No data loaded. Exiting.")
+        return [], [], None
+
+    with profiler.stage("validate"):
+        valid_chunks, rejected_chunks, backend = chunk_validator.validate_chunks(all_chunks, config)
+        save_rejected(rejected_chunks, config.REJECTED_CHUNKS_PATH, config)
+    if not valid_chunks:
+        logger.error("No valid chunks after validation. Exiting.")
+        return [], rejected_chunks, backend
+
+    try:
+        be_info = backend.get_backend_info() if backend else {}
+    except Exception:
+        # Best-effort; continue if anything goes wrong
+        be_info = {}
+    if drop_embeddings and be_info.get("backend") == "FAISS":
+        # Optional: Drop per-chunk embeddings to reduce memory when using FAISS backend
+        # (a shared matrix would only be a second copy next to FAISS's)
+        for c in valid_chunks:
+            # Remove external embedding copy; FAISS backend holds normalized matrix
+            c.embedding = []  # type: ignore[assignment]
+        logger.info("Dropped per-chunk embeddings to reduce memory (FAISS in use).")
+    elif str(getattr(config, "EMBEDDING_STORE", "none")).lower() != "none":
+        # One shared matrix replaces the per-chunk lists; chunks keep read-only row views
+        from . import shared_embeddings
+
+        shared_embeddings.SharedEmbeddingMatrix.from_chunks(valid_chunks, config)
+    return valid_chunks, rejected_chunks, backend
+
+
+def _log_llm_stats(q_generator):
+    """Logs LLM cache and call statistics for the run."""
+    cache_stats = q_generator.get_cache_stats()
+    if cache_stats.get("caching") != "disabled":
+        logger.info("LLM Cache Stats: %d entries, %.2f MB, %d hits / %d misses (hit rate %.1f%%)",
+                   cache_stats.get("entry_count", 0),
+                   cache_stats.get("total_size_mb", 0),
+                   cache_stats.get("hits", 0),
+                   cache_stats.get("misses", 0),
+                   100.0 * cache_stats.get("hit_rate", 0.0))
+    call_stats = q_generator.get_call_stats()
+    logger.info("LLM Call Stats: %d calls, %d retries (%d rate-limited), p95 latency %.0f ms",
+               call_stats["calls"], call_stats["retries"], call_stats["rate_limited"],
+               call_stats["latency_p95_ms"])
+    if call_stats["prompt_tokens"]:
+        logger.info("LLM Tokens: %d prompt (%d cached by provider, %.1f%%), %d completion",
+                   call_stats["prompt_tokens"], call_stats["cached_prompt_tokens"],
+                   call_stats["cached_prompt_pct"], call_stats["completion_tokens"])
+    prompt_stats = q_generator.get_prompt_stats()
+    if prompt_stats["prompts"]:
+        logger.info("Prompt tokens (%s): mean %.0f, p50 %d, p95 %d, max %d; %d/%d prompts trimmed, "
+                   "%.1f%% context tokens saved",
+                   prompt_stats["tokenizer"], prompt_stats["prompt_tokens_mean"],
+                   prompt_stats["prompt_tokens_p50"], prompt_stats["prompt_tokens_p95"],
+                   prompt_stats["prompt_tokens_max"], prompt_stats["trimmed_prompts"],
+                   prompt_stats["prompts"], prompt_stats["context_tokens_saved_pct"])
+    cascade = call_stats.get("cascade")
+    if cascade:
+        logger.info("Model cascade: draft %d calls (%.1f%% accepted), large %d calls (%.1f%% accepted), "
+                   "escalation rate %.1f%%",
+                   cascade["draft"]["calls"], 100.0 * cascade["draft"]["acceptance_rate"],
+                   cascade["large"]["calls"], 100.0 * cascade["large"]["acceptance_rate"],
+                   100.0 * cascade["escalation_rate"])
+    concurrency = call_stats.get("concurrency")
+    if concurrency:
+        logger.info("Adaptive concurrency: window=%d (peak %d, range %d-%d), %d increases / %d decreases",
+                   concurrency["window"], concurrency["peak"], concurrency["min"], concurrency["max"],
+                   concurrency["increases"], concurrency["decreases"])
 
 
 # --- Main Orchestration ---
@@ -86,10 +160,67 @@ def main():
         "--evaluation-mode",
         type=str,
         default="llm",
-        choices=["none", "nonllm", "llm", "hybrid"],
-        help="Evaluation strategy: none|nonllm|llm|hybrid"
+        choices=["none", "nonllm", "llm", "hybrid", "retrieval"],
+        help="Evaluation strategy: none|nonllm|llm|hybrid|retrieval (corpus-level rank gate, then hybrid)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Overlap generation, evaluation and writing; results are appended to OUTPUT_PATH as they are accepted"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted --stream run from RUN_JOURNAL_PATH (implies --stream)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        default=None,
+        choices=["prepare", "ingest"],
+        help="Offline batch mode: 'prepare' writes (and optionally submits) generation requests to BATCH_DIR; "
+             "'ingest' reads the batch output and continues with evaluation"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="all",
+        default=None,
+        choices=PROFILE_MODES,
+        help="Profile each pipeline stage: cpu (cProfile), memory (tracemalloc snapshot diffs) or all (default)"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        default=None,
+        help="Directory for profile artifacts (default: PROFILE_DIR/<timestamp>)"
+    )
+    parser.add_argument(
+        "--profile-flamegraph",
+        action="store_true",
+        help="Also sample all threads' stacks into folded-stack files for flame graphs (implies --profile)"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the selected bundles into N shards generated by local worker processes, then merge "
+             "(see generation/distributed.py for multi-host runs)"
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Select contexts in one streaming pass over the input: reservoir-sampled goldens, embeddings in "
+             "an on-disk matrix, chunk text kept only for goldens and distractors (see streaming_selection.py)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Validate the config, inputs and dependencies, then exit without loading the corpus or calling the LLM"
     )
     args = parser.parse_args()
+    if args.profile_flamegraph and args.profile is None:
+        args.profile = "all"
 
     setup_logging()
 
@@ -99,61 +230,172 @@ def main():
     logger.info("Loading configuration from %s...", args.config)
     config = load_config(args.config)
 
-    # 2. Load Data
-    all_chunks = data_loader.load_data(config)
-    if not all_chunks:
-        logger.error("No data loaded. Exiting.")
+    if args.dry_run:
+        from .preflight import preflight
+
+        errors, warnings = preflight(config, args.evaluation_mode, args.batch)
+        for message in warnings:
+            logger.warning("Dry run: %s", message)
+        for message in errors:
+            logger.error("Dry run: %s", message)
+        if errors:
+            sys.exit(1)
+        logger.info("--- Dry run passed: config, inputs and dependencies look valid ---")
         return
 
-    # 3. Validate Chunks (and build/reuse search backend)
-    valid_chunks, rejected_chunks, backend = chunk_validator.validate_chunks(all_chunks, config)
-    save_rejected(rejected_chunks, config.REJECTED_CHUNKS_PATH)
-    if not valid_chunks:
-        logger.error("No valid chunks after validation. Exiting.")
+    with RunProfiler.from_config(config, args.profile, args.profile_dir, args.profile_flamegraph) as profiler:
+        _run_pipeline(args, config, profiler)
+
+
+def _run_pipeline(args, config, profiler: RunProfiler):
+    from . import batch_mode, chunk_selector, evaluation_layer, query_generator, streaming
+
+    if args.batch and (args.stream or args.resume):
+        logger.error("--batch cannot be combined with --stream/--resume.")
         return
+    if args.shards > 1 and (args.batch or args.stream or args.resume):
+        logger.error("--shards cannot be combined with --batch/--stream/--resume (shard workers stream and journal on their own).")
+        return
+    if args.low_memory and (args.resume or args.batch == "ingest"):
+        logger.error("--low-memory cannot be combined with --resume or --batch ingest (both look up chunks in the full corpus).")
+        return
+    batch_dir = getattr(config, "BATCH_DIR", "./output/batch")
 
-    # Optional: Drop per-chunk embeddings to reduce memory when using FAISS backend
-    try:
-        be_info = backend.get_backend_info() if backend else {}
-        if be_info.get("backend") == "FAISS":
-            for c in valid_chunks:
-                # Remove external embedding copy; FAISS backend holds normalized matrix
-                c.embedding = []  # type: ignore[assignment]
-            logger.info("Dropped per-chunk embeddings to reduce memory (FAISS in use).")
-    except Exception:
-        # Best-effort; continue if anything goes wrong
-        pass
+    if args.resume and not args.stream:
+        logger.info("--resume implies --stream; results are appended to %s incrementally.", config.OUTPUT_PATH)
+        args.stream = True
+    journal = None
+    if args.stream:
+        journal_path = getattr(config, "RUN_JOURNAL_PATH", config.OUTPUT_PATH + ".journal.jsonl")
+        journal = RunJournal(journal_path, resume=args.resume)
+        journal.check_header(create_config_hash(config), args.evaluation_mode)
+
+    bundles = None
+    if args.low_memory:
+        # 2-4. Stream, validate and select in one pass; only selected chunks are materialized
+        from . import streaming_selection
+
+        with profiler.stage("select"):
+            bundles, backend = streaming_selection.select_contexts_streaming(config)
+        valid_chunks = backend.chunks() if backend is not None else []
+        if journal is not None and bundles:
+            journal.record_selection(bundles)
+    else:
+        # 2-3. Load Data, Validate Chunks (and build/reuse search backend)
+        valid_chunks, rejected_chunks, backend = load_corpus(config, profiler=profiler)
+        if not valid_chunks:
+            return
 
-    # 4. Select Contexts (reuse backend if available)
-    selector = chunk_selector.ContextSelector(valid_chunks, config, backend=backend)
-    logger.info("Using search backend: %s", selector.get_backend_info())
-    bundles = selector.select_contexts()
+    if args.batch == "ingest":
+        # 5. Join batch results (selection and prompts were fixed at prepare time)
+        with profiler.stage("ingest"):
+            client = batch_mode.create_batch_client(config)
+            output_path = batch_mode.fetch_output(batch_dir, client)
+            if output_path is None:
+                return
+            q_generator = query_generator.QueryGenerator(config, offline=True)
+            generated_queries = batch_mode.ingest_batch(batch_dir, valid_chunks, q_generator, output_path)
+        if not generated_queries:
+            logger.error("No queries ingested from batch output. Exiting.")
+            return
+        with profiler.stage("evaluate"):
+            final_dataset = evaluation_layer.evaluate_queries(generated_queries, config, args.evaluation_mode,
+                                                              backend=backend, chunks=valid_chunks)
+        if not final_dataset:
+            logger.error("No queries passed final evaluation. No dataset will be saved.")
+            return
+        with profiler.stage("save"):
+            save_dataset(final_dataset, config.OUTPUT_PATH, config)
+        logger.info("--- Pipeline Completed Successfully ---")
+        logger.info("Generated %s high-quality QA pairs.", len(final_dataset))
+        return
+
+    # 4. Select Contexts (reuse backend if available, or the journaled selection when resuming)
+    if bundles is None and args.resume:
+        bundles = journal.restore_selection(valid_chunks)
+    if bundles is None and not args.low_memory:
+        with profiler.stage("select"):
+            selector = chunk_selector.ContextSelector(valid_chunks, config, backend=backend)
+            logger.info("Using search backend: %s", selector.get_backend_info())
+            bundles = selector.select_contexts()
+        if journal is not None and bundles:
+            journal.record_selection(bundles)
     if not bundles:
         logger.error("No context bundles selected. Exiting.")
         return
 
+    if args.shards > 1:
+        # 5-7. Generate and evaluate per shard in worker processes, then dedupe into OUTPUT_PATH
+        from . import distributed
+
+        with profiler.stage("distributed"):
+            stats = distributed.run_local(bundles, config, args.config, args.evaluation_mode, args.shards,
+                                          chunks=valid_chunks)
+        if not stats["written"]:
+            logger.error("No queries passed final evaluation.")
+            return
+        logger.info("--- Pipeline Completed Successfully ---")
+        logger.info("Generated %s high-quality QA pairs.", stats["written"])
+        return
+
+    if args.batch == "prepare":
+        # 5. Serialize prompts for an offline batch job instead of calling the LLM
+        with profiler.stage("prepare"):
+            q_generator = query_generator.QueryGenerator(config, offline=True)
+            job = batch_mode.prepare_batch(bundles, q_generator, batch_dir, batch_mode.create_batch_client(config))
+        logger.info("Batch prepared in %s (%d requests, job %s). Run with --batch ingest once it completes.",
+                    batch_dir, job["requests"], job["job_id"] or "not submitted")
+        return
+
     # 5. Generate Queries (with caching)
     q_generator = query_generator.QueryGenerator(config)
-    generated_queries = q_generator.generate_queries(bundles)
+
+    if args.stream:
+        # 5-7. Generate, evaluate and save concurrently through bounded queues
+        stream_path = streaming.stream_output_path(config, config.OUTPUT_PATH)
+        if args.resume:
+            truncate_output(stream_path, journal.output_offset)
+        try:
+            with profiler.stage("stream"):
+                counters = streaming.run_streaming(
+                    bundles, q_generator, config, args.evaluation_mode, stream_path,
+                    append=args.resume, journal=journal, backend=backend, chunks=valid_chunks,
+                )
+        finally:
+            journal.close()
+        _log_llm_stats(q_generator)
+        if counters["skipped"]:
+            logger.info("Skipped %s work items already completed in the journal.", counters["skipped"])
+        if not journal.output_offset:
+            logger.error("No queries passed final evaluation.")
+            return
+        with profiler.stage("save"):
+            dataset_path = streaming.finalize_output(config, stream_path, config.OUTPUT_PATH)
+        logger.info("Final dataset saved to %s", dataset_path)
+        logger.info("--- Pipeline Completed Successfully ---")
+        logger.info("Generated %s high-quality QA pairs.",
+                    sum(1 for outcome in journal.done.values() if outcome == "accepted"))
+        return
+
+    with profiler.stage("generate"):
+        generated_queries = q_generator.generate_queries(bundles)
     if not generated_queries:
         logger.error("No queries were generated. Exiting.")
         return
     
-    # Log cache statistics
-    cache_stats = q_generator.get_cache_stats()
-    if cache_stats.get("caching") != "disabled":
-        logger.info("LLM Cache Stats: %d files, %.2f MB", 
-                   cache_stats.get("file_count", 0), 
-                   cache_stats.get("total_size_mb", 0))
+    _log_llm_stats(q_generator)
 
     # 6. Evaluate Queries (configurable)
-    final_dataset = evaluation_layer.evaluate_queries(generated_queries, config, args.evaluation_mode)
+    with profiler.stage("evaluate"):
+        final_dataset = evaluation_layer.evaluate_queries(generated_queries, config, args.evaluation_mode,
+                                                          backend=backend, chunks=valid_chunks)
     if not final_dataset:
         logger.error("No queries passed final evaluation. No dataset will be saved.")
         return
 
     # 7. Save Final Dataset
-    save_dataset(final_dataset, config.OUTPUT_PATH)
+    with profiler.stage("save"):
+        save_dataset(final_dataset, config.OUTPUT_PATH, config)
     
     logger.info("--- Pipeline Completed Successfully ---")
     logger.info("Generated %s high-quality QA pairs.", len(final_dataset))
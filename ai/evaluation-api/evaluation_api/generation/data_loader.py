@@ -6,7 +6,7 @@ import os
 from glob import glob
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-from typing import List
+from typing import Iterator, List, Tuple
 from .models import ChunkData
 from ..utils.cache_utils import SimpleCache
 
@@ -29,8 +29,7 @@ def load_data(config) -> List[ChunkData]:
     cache_enabled = getattr(config, 'CACHE_DATA_LOADING', True) and getattr(config, 'ENABLE_CACHING', True)
     
     if cache_enabled:
-        cache_dir = getattr(config, 'CACHE_DIR', './cache')
-        cache = SimpleCache(cache_dir, namespace="data_loading")
+        cache = SimpleCache.from_config(config, namespace="data_loading")
     
     if config.INPUT_TYPE == "chunks":
         return _load_from_chunks(config.INPUT_PATHS, config, cache)
@@ -87,7 +86,7 @@ def _load_from_chunks(input_paths: List[str], config, cache=None) -> List[ChunkD
                                     data = orjson.loads(line)
                                 else:
                                     data = json.loads(line)
-                                chunk_obj, dim = _to_chunkdata(data)
+                                chunk_obj, dim = to_chunkdata(data)
                                 path_chunks.append(chunk_obj)
                                 if dim is not None:
                                     dims_seen.add(dim)
@@ -100,7 +99,7 @@ def _load_from_chunks(input_paths: List[str], config, cache=None) -> List[ChunkD
                                 data = orjson.loads(f.read())
                             else:
                                 data = json.load(f)
-                            chunk_obj, dim = _to_chunkdata(data)
+                            chunk_obj, dim = to_chunkdata(data)
                             path_chunks.append(chunk_obj)
                             if dim is not None:
                                 dims_seen.add(dim)
@@ -132,7 +131,63 @@ def _load_from_chunks(input_paths: List[str], config, cache=None) -> List[ChunkD
 
     return chunks
 
-def _to_chunkdata(data: dict):
+def _chunk_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(glob(os.path.join(path, "*.jsonl")) + glob(os.path.join(path, "*.json")))
+    return [path]
+
+
+def _parse(raw: bytes) -> dict:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def iter_chunk_records(config) -> Iterator[Tuple[ChunkData, str, int]]:
+    """Streams ``(chunk, file, byte_offset)`` for every record under INPUT_PATHS without keeping them.
+
+    Only INPUT_TYPE='chunks' can be streamed; ``read_chunk_at(file, offset)`` re-reads a record.
+    """
+    if config.INPUT_TYPE != "chunks":
+        raise ValueError(f"Streaming load supports INPUT_TYPE='chunks' only, not {config.INPUT_TYPE!r}")
+    for path in config.INPUT_PATHS:
+        logger.info("Streaming pre-computed chunks from %s...", path)
+        for fp in _chunk_files(path):
+            if fp.endswith('.json'):
+                with open(fp, 'rb') as f:
+                    try:
+                        chunk_obj, _ = to_chunkdata(_parse(f.read()))
+                    except (json.JSONDecodeError, KeyError, ValueError) as e:
+                        logger.warning("Skipping malformed JSON in %s: %s", fp, e)
+                        continue
+                yield chunk_obj, fp, 0
+                continue
+            if not fp.endswith('.jsonl'):
+                logger.warning("Unsupported file type (skipped): %s", fp)
+                continue
+            offset = 0
+            with open(fp, 'rb') as f:
+                for line in f:
+                    start, offset = offset, offset + len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        chunk_obj, _ = to_chunkdata(_parse(line))
+                    except (json.JSONDecodeError, KeyError, ValueError) as e:
+                        logger.warning("Skipping malformed line in %s: %s", fp, e)
+                        continue
+                    yield chunk_obj, fp, start
+
+
+def read_chunk_at(fp: str, offset: int) -> ChunkData:
+    """Re-reads the record ``iter_chunk_records`` yielded at ``(fp, offset)``."""
+    with open(fp, 'rb') as f:
+        if fp.endswith('.json'):
+            return to_chunkdata(_parse(f.read()))[0]
+        f.seek(offset)
+        return to_chunkdata(_parse(f.readline()))[0]
+
+
+def to_chunkdata(data: dict):
+    """``(ChunkData, embedding_dim)`` for one raw chunk record (``embedding`` or ``content_vector``)."""
     doc_id = data['doc_id']
     chunk_id = data['chunk_id']
     chunk_text = data.get('chunk_text', data.get('chunk', ''))
@@ -216,7 +271,7 @@ def _load_from_azure_blob(config, cache=None) -> List[ChunkData]:
 
         try:
             obj = download_fn(blob_name)
-            c, dim = _to_chunkdata(obj)
+            c, dim = to_chunkdata(obj)
             return c, dim, None
         except (AzureError, ValueError, json.JSONDecodeError) as e:  # type: ignore[attr-defined]
             return None, None, (blob_name, str(e))
@@ -304,6 +359,8 @@ def _cache_path_chunks(path: str, chunks: List[ChunkData], cache: SimpleCache):
             cache_key = hashlib.sha256(f"{path}_{mtime}".encode()).hexdigest()[:16]
         
         cache.set(cache_key, chunks)
+        # Large single entry; persist now rather than waiting for the batch to fill
+        cache.flush()
         logger.debug("Cached %d chunks for path %s with key %s", len(chunks), path, cache_key[:8])
     except (OSError, ValueError) as e:
         logger.warning("Failed to cache chunks for path %s: %s", path, e)
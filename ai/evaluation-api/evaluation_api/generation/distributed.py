@@ -0,0 +1,490 @@
+# --- File: evaluation_api/generation/distributed.py ---
+# Sharded generation: a coordinator plans, workers generate/evaluate, a merge step dedupes.
+#
+# Everything is exchanged through a run directory on a shared filesystem; no queue or
+# broker is needed:
+#   <run_dir>/manifest.json              config path, evaluation mode, shard count and sizes, concurrent workers
+#   <run_dir>/shard-NNNNN/bundles.jsonl  the shard's selection bundles (chunk text, no embeddings)
+#   <run_dir>/shard-NNNNN/claim          created atomically (O_EXCL) by the worker that owns the shard;
+#                                        --resume renames a dead owner's claim aside before re-claiming
+#   <run_dir>/shard-NNNNN/output.jsonl   accepted records, streamed (run_streaming)
+#   <run_dir>/shard-NNNNN/journal.jsonl  run journal; a rerun with --resume continues the shard
+#   <run_dir>/shard-NNNNN/done.json      the shard's counters, written when it completes
+#   <run_dir>/merge.json                 merge statistics
+#
+# Bundles go to shard crc32(bundle_id) % N, so the partition is stable across runs and
+# hosts. With W workers running at once, each gets 1/W of the LLM rate limits and
+# concurrency (DIST_SPLIT_RATE_LIMITS). All workers share CACHE_DIR (one WAL-mode SQLite
+# file), so cached queries are reused whatever the shard count.
+#
+#   python -m evaluation_api.generation.distributed run    --config cfg.py --shards 8   # plan + local workers + merge
+#   python -m evaluation_api.generation.distributed plan   --config cfg.py --shards 8 --workers 4 --run-dir /shared/run1
+#   python -m evaluation_api.generation.distributed worker --run-dir /shared/run1      # on every host
+#   python -m evaluation_api.generation.distributed merge  --run-dir /shared/run1
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .journal import RunJournal, truncate_output
+from .models import ChunkData, SelectionBundle
+from ..utils.cache_utils import create_config_hash
+from ..utils.dataset_io import create_dataset_writer, encode_record, iter_records
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+# Corpus handed to local workers by run_local: (EmbeddingHandle, chunks without vectors, rows)
+_LOCAL_CORPUS: Optional[Tuple[Any, List[ChunkData], Optional[List[int]]]] = None
+
+# Per-process limits divided among the workers running at once
+_RATE_SETTINGS = ("LLM_REFILL_RATE", "LLM_BURST_CAPACITY", "EVAL_LLM_REFILL_RATE", "EVAL_LLM_BURST_CAPACITY")
+_CONCURRENCY_SETTINGS = ("LLM_MAX_WORKERS", "EVAL_MAX_WORKERS")
+
+
+def shard_of(bundle: SelectionBundle, num_shards: int) -> int:
+    # Stable across processes and hosts, unlike hash()
+    return zlib.crc32(bundle.bundle_id().encode("utf-8")) % num_shards
+
+
+def shard_dir(run_dir: str, shard: int) -> str:
+    return os.path.join(run_dir, f"shard-{shard:05d}")
+
+
+def _chunk_record(chunk: ChunkData) -> List[str]:
+    return [chunk.doc_id, chunk.chunk_id, chunk.chunk_text]
+
+
+def _chunk_from(record: List[str]) -> ChunkData:
+    doc_id, chunk_id, text = record
+    return ChunkData(doc_id=doc_id, chunk_id=chunk_id, chunk_text=text, embedding=[])
+
+
+def read_manifest(run_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(run_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- Coordinator ---
+def plan_shards(bundles: List[SelectionBundle], config, config_path: str, evaluation_mode: str,
+                num_shards: int, run_dir: str, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Partition ``bundles`` into ``num_shards`` bundle files under ``run_dir`` and write the manifest.
+
+    ``workers`` is how many shards will run at once (default: all of them); rate limits
+    are split by it. ``run_dir`` must not already hold a run.
+    """
+    if num_shards < 1:
+        raise ValueError("num_shards must be >= 1")
+    if os.path.exists(os.path.join(run_dir, MANIFEST_FILE)):
+        # Leftover claims/done files would make shards skip work or merge stale outputs
+        raise ValueError(f"{run_dir} already holds a run; resume it with `worker --resume` or use a new run dir")
+    os.makedirs(run_dir, exist_ok=True)
+    files = []
+    for shard in range(num_shards):
+        os.makedirs(shard_dir(run_dir, shard), exist_ok=True)
+        files.append(open(os.path.join(shard_dir(run_dir, shard), "bundles.jsonl"), "wb"))
+    sizes = [0] * num_shards
+    try:
+        for bundle in bundles:
+            shard = shard_of(bundle, num_shards)
+            files[shard].write(encode_record({
+                "golden": [_chunk_record(c) for c in bundle.golden_chunks],
+                "distractors": [_chunk_record(c) for c in bundle.distractor_chunks],
+            }))
+            sizes[shard] += 1
+    finally:
+        for f in files:
+            f.close()
+    manifest = {
+        "config_path": os.path.abspath(config_path),
+        "config_hash": create_config_hash(config),
+        "evaluation_mode": evaluation_mode,
+        "num_shards": num_shards,
+        "workers": max(1, min(int(workers or num_shards), num_shards)),
+        "bundles": sizes,
+        "created_at": time.time(),
+    }
+    tmp = os.path.join(run_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(run_dir, MANIFEST_FILE))
+    logger.info("Planned %d bundles into %d shards under %s (sizes %d-%d)",
+                sum(sizes), num_shards, run_dir, min(sizes), max(sizes))
+    return manifest
+
+
+# --- Worker ---
+def shard_config(config, shard: int, workers: int, run_dir: str):
+    """Applies the share of rate limits for one of ``workers`` concurrent workers and the shard's
+    output/journal paths to ``config``."""
+    if bool(getattr(config, "DIST_SPLIT_RATE_LIMITS", True)) and workers > 1:
+        for name in _RATE_SETTINGS:
+            value = getattr(config, name, None)
+            if value:
+                setattr(config, name, max(1, value // workers) if isinstance(value, int) else value / workers)
+        for name in _CONCURRENCY_SETTINGS:
+            value = getattr(config, name, None)
+            if value:
+                setattr(config, name, max(1, math.ceil(value / workers)))
+    directory = shard_dir(run_dir, shard)
+    config.OUTPUT_PATH = os.path.join(directory, "output.jsonl")
+    config.RUN_JOURNAL_PATH = os.path.join(directory, "journal.jsonl")
+    config.REJECTED_CHUNKS_PATH = os.path.join(directory, "rejected_chunks.jsonl")
+    return config
+
+
+def load_shard_bundles(run_dir: str, shard: int) -> List[SelectionBundle]:
+    bundles = []
+    for rec in iter_records(os.path.join(shard_dir(run_dir, shard), "bundles.jsonl")):
+        bundles.append(SelectionBundle(
+            golden_chunks=[_chunk_from(c) for c in rec["golden"]],
+            distractor_chunks=[_chunk_from(c) for c in rec["distractors"]],
+        ))
+    return bundles
+
+
+def claim_shard(run_dir: str, shard: int) -> bool:
+    """Atomically take ownership of ``shard``; False when another worker holds it."""
+    path = os.path.join(shard_dir(run_dir, shard), "claim")
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump({"host": socket.gethostname(), "pid": os.getpid(), "claimed_at": time.time()}, f)
+    return True
+
+
+def _read_claim(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # Claimed but not yet written (or truncated by a crash)
+        return {}
+
+
+def _owner_alive(owner: Dict[str, Any]) -> bool:
+    """False only when the claim's process is known to be gone (same host, pid not running)."""
+    if owner.get("host") != socket.gethostname() or not owner.get("pid"):
+        return True
+    try:
+        os.kill(int(owner["pid"]), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def take_over_shard(run_dir: str, shard: int, force: bool = False) -> bool:
+    """Atomically re-claim a shard from a dead owner; True when this process now holds it.
+
+    Without ``force`` only an owner on this host whose pid has exited is taken over; a
+    remote owner's liveness cannot be checked, so the operator vouches for it with ``force``.
+    The old claim is renamed aside first, so of several resumers exactly one wins.
+    """
+    path = os.path.join(shard_dir(run_dir, shard), "claim")
+    owner = _read_claim(path)
+    if owner is None:
+        return claim_shard(run_dir, shard)
+    if not force and _owner_alive(owner):
+        return False
+    aside = f"{path}.stale-{os.getpid()}"
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        # Another resumer moved it first
+        return False
+    if _read_claim(aside) != owner:
+        # Moved a newer claim than the one judged dead: put it back unless someone re-claimed already
+        try:
+            os.link(aside, path)
+        except FileExistsError:
+            pass
+        os.remove(aside)
+        return False
+    if not claim_shard(run_dir, shard):
+        return False
+    logger.warning("Took over shard %d from %s (pid %s)", shard, owner.get("host", "?"), owner.get("pid", "?"))
+    return True
+
+
+def shard_done(run_dir: str, shard: int) -> Optional[Dict[str, Any]]:
+    path = os.path.join(shard_dir(run_dir, shard), "done.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_shard(run_dir: str, shard: int, resume: bool = False,
+              corpus: Optional[Tuple[Any, List[ChunkData], Optional[List[int]]]] = None) -> Dict[str, Any]:
+    """Generate and evaluate one shard; returns its counters (also written to done.json).
+
+    ``corpus`` is the coordinator's corpus in ``shared_embeddings.portable`` form; without
+    it a retrieval-mode worker loads the corpus itself.
+    """
+    from . import query_generator, shared_embeddings, streaming
+    from .cli import load_config, load_corpus
+
+    manifest = read_manifest(run_dir)
+    num_shards = manifest["num_shards"]
+    mode = manifest["evaluation_mode"]
+    config = load_config(manifest["config_path"])
+    if create_config_hash(config) != manifest["config_hash"]:
+        logger.warning("Config %s changed since the run was planned; shard %d uses the current version",
+                       manifest["config_path"], shard)
+    config = shard_config(config, shard, manifest.get("workers", num_shards), run_dir)
+
+    started = time.perf_counter()
+    bundles = load_shard_bundles(run_dir, shard)
+    backend = chunks = None
+    if mode == "retrieval" and corpus is not None:
+        # The corpus-level gate searches the coordinator's shared matrix in place
+        chunks = shared_embeddings.restore(*corpus)
+    elif mode == "retrieval":
+        # The corpus-level gate searches the whole corpus, so this worker loads it too
+        chunks, _, backend = load_corpus(config)
+
+    journal = RunJournal(config.RUN_JOURNAL_PATH, resume=resume)
+    journal.check_header(manifest["config_hash"], mode)
+    if resume:
+        truncate_output(config.OUTPUT_PATH, journal.output_offset)
+    q_generator = query_generator.QueryGenerator(config)
+    try:
+        counters = streaming.run_streaming(
+            bundles, q_generator, config, mode, config.OUTPUT_PATH,
+            append=resume, journal=journal, backend=backend, chunks=chunks,
+        )
+    finally:
+        journal.close()
+    counters = {
+        "shard": shard,
+        "bundles": len(bundles),
+        **counters,
+        "host": socket.gethostname(),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "llm": q_generator.get_call_stats(),
+    }
+    with open(os.path.join(shard_dir(run_dir, shard), "done.json"), "w", encoding="utf-8") as f:
+        json.dump(counters, f, indent=2, default=str)
+    logger.info("Shard %d/%d done: %d bundles, %d accepted in %.1fs",
+                shard, num_shards, len(bundles), counters["accepted"], counters["elapsed_s"])
+    return counters
+
+
+def _init_worker(corpus):
+    """Process-pool initializer: keep the coordinator's corpus and map its shared matrix once."""
+    global _LOCAL_CORPUS
+    from . import shared_embeddings
+
+    if corpus is not None:
+        shared_embeddings.attach_all([corpus[0]])
+    _LOCAL_CORPUS = corpus
+
+
+def _worker_entry(run_dir: str, shard: int, resume: bool) -> Dict[str, Any]:
+    from .cli import setup_logging
+
+    setup_logging()
+    return run_shard(run_dir, shard, resume=resume, corpus=_LOCAL_CORPUS)
+
+
+def run_worker(run_dir: str, shards: Optional[Iterable[int]] = None, resume: bool = False) -> List[Dict[str, Any]]:
+    """Claim and run unfinished shards (all of them, or ``shards``) until none are left."""
+    num_shards = read_manifest(run_dir)["num_shards"]
+    results = []
+    for shard in (shards if shards is not None else range(num_shards)):
+        if shard_done(run_dir, shard) is not None:
+            continue
+        # --resume takes over a shard whose worker died holding the claim: a dead pid on this
+        # host, or any shard named explicitly (--shard) when its owner is on another host
+        claimed = claim_shard(run_dir, shard) or (resume and take_over_shard(run_dir, shard, force=shards is not None))
+        if not claimed:
+            continue
+        results.append(run_shard(run_dir, shard, resume=resume))
+    return results
+
+
+# --- Merge ---
+def _query_key(query: str) -> bytes:
+    return hashlib.blake2b(" ".join((query or "").lower().split()).encode("utf-8"), digest_size=12).digest()
+
+
+def _docs_key(doc_ids: Iterable[str]) -> bytes:
+    return hashlib.blake2b("\x1f".join(sorted(doc_ids or [])).encode("utf-8"), digest_size=8).digest()
+
+
+def merge_shards(run_dir: str, config, output_path: Optional[str] = None, partial: bool = False) -> Dict[str, Any]:
+    """Dedupe the shard outputs into one dataset at ``output_path`` (default OUTPUT_PATH).
+
+    Records are duplicates when their normalized query text and expected documents match;
+    one copy is kept. A query produced for different expected documents is ambiguous as
+    ground truth and dropped entirely unless DIST_MERGE_DROP_AMBIGUOUS is off (then the
+    first copy in shard order is kept).
+    """
+    manifest = read_manifest(run_dir)
+    shards = range(manifest["num_shards"])
+    missing = [s for s in shards if shard_done(run_dir, s) is None]
+    if missing and not partial:
+        raise RuntimeError(f"{len(missing)} shard(s) not finished (e.g. {missing[:5]}); rerun their workers "
+                           "or merge with partial=True")
+    outputs = [os.path.join(shard_dir(run_dir, s), "output.jsonl") for s in shards if s not in missing]
+    outputs = [p for p in outputs if os.path.exists(p)]
+
+    def records():
+        for path in outputs:
+            yield from iter_records(path)
+
+    # Pass 1: expected-document sets per query
+    docs_by_query: Dict[bytes, Any] = {}
+    for rec in records():
+        qk, dk = _query_key(rec.get("query", "")), _docs_key(rec.get("expected_doc_ids"))
+        seen = docs_by_query.get(qk)
+        if seen is None:
+            docs_by_query[qk] = dk
+        elif seen != dk and not isinstance(seen, set):
+            docs_by_query[qk] = {seen, dk}
+        elif isinstance(seen, set):
+            seen.add(dk)
+
+    # Pass 2: write one copy per (query, documents)
+    drop_ambiguous = bool(getattr(config, "DIST_MERGE_DROP_AMBIGUOUS", True))
+    written = set()
+    stats = {"input": 0, "written": 0, "duplicates": 0, "ambiguous_dropped": 0}
+    with create_dataset_writer(config, output_path or config.OUTPUT_PATH) as writer:
+        for rec in records():
+            stats["input"] += 1
+            qk = _query_key(rec.get("query", ""))
+            if isinstance(docs_by_query[qk], set):
+                if drop_ambiguous:
+                    stats["ambiguous_dropped"] += 1
+                    continue
+                key = qk  # keep the first copy of the query whatever its documents
+            else:
+                key = qk + docs_by_query[qk]
+            if key in written:
+                stats["duplicates"] += 1
+                continue
+            written.add(key)
+            writer.write(rec)
+            stats["written"] += 1
+        stats["output"] = writer.path
+    stats["shards"] = len(outputs)
+    stats["missing_shards"] = missing
+    stats["ambiguous_queries"] = sum(1 for v in docs_by_query.values() if isinstance(v, set))
+    with open(os.path.join(run_dir, "merge.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    logger.info("Merged %d shard(s): %d records in, %d written, %d duplicates, %d ambiguous dropped -> %s",
+                len(outputs), stats["input"], stats["written"], stats["duplicates"],
+                stats["ambiguous_dropped"], stats["output"])
+    return stats
+
+
+# --- Local run ---
+def run_local(bundles: List[SelectionBundle], config, config_path: str, evaluation_mode: str,
+              num_shards: int, run_dir: Optional[str] = None, workers: Optional[int] = None,
+              chunks: Optional[List[ChunkData]] = None) -> Dict[str, Any]:
+    """Plan, run every shard in local worker processes, and merge into OUTPUT_PATH.
+
+    In retrieval mode, ``chunks`` bound to a shared embedding matrix (EMBEDDING_STORE) are
+    handed to the workers, which attach to the matrix instead of loading the corpus again.
+    """
+    run_dir = run_dir or os.path.join(getattr(config, "DIST_RUN_DIR", "./output/distributed"),
+                                      time.strftime("%Y%m%d-%H%M%S"))
+    workers = min(workers or int(getattr(config, "DIST_LOCAL_WORKERS", 0) or 0) or num_shards, num_shards)
+    plan_shards(bundles, config, config_path, evaluation_mode, num_shards, run_dir, workers=workers)
+    for shard in range(num_shards):
+        if not claim_shard(run_dir, shard):
+            raise RuntimeError(f"Shard {shard} of the new run {run_dir} is already claimed")
+    corpus = None
+    if evaluation_mode == "retrieval" and chunks:
+        from . import shared_embeddings
+
+        handle, portable_chunks, rows = shared_embeddings.portable(chunks)
+        if handle is not None:
+            corpus = (handle, portable_chunks, rows)
+    # Spawned workers start clean (no inherited threads or clients), exactly like a remote host
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(corpus,)) as ex:
+        futures = [ex.submit(_worker_entry, run_dir, s, False) for s in range(num_shards)]
+        results = [f.result() for f in futures]
+    logger.info("All %d shards finished: %d generated, %d accepted",
+                num_shards, sum(r["generated"] for r in results), sum(r["accepted"] for r in results))
+    return merge_shards(run_dir, config)
+
+
+def main():
+    from .cli import load_config, load_corpus, setup_logging
+
+    parser = argparse.ArgumentParser(description="Sharded generation: coordinator, workers and merge")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "plan"):
+        p = sub.add_parser(name)
+        p.add_argument("--config", required=True, help="Path to the generation_config.py file")
+        p.add_argument("--evaluation-mode", default="llm", choices=["none", "nonllm", "llm", "hybrid", "retrieval"])
+        p.add_argument("--shards", type=int, default=None, help="Number of shards (default DIST_NUM_SHARDS)")
+        p.add_argument("--run-dir", default=None, help="Shared run directory (default DIST_RUN_DIR/<timestamp>)")
+        p.add_argument("--workers", type=int, default=None,
+                       help="Workers running at once; rate limits are split by it (default: one per shard)")
+    p = sub.add_parser("worker")
+    p.add_argument("--run-dir", required=True)
+    p.add_argument("--shard", type=int, action="append", default=None, help="Only these shards (repeatable)")
+    p.add_argument("--resume", action="store_true",
+                   help="Continue interrupted shards from their journals (a claim held on another host "
+                        "is only taken over for shards named with --shard)")
+    p = sub.add_parser("merge")
+    p.add_argument("--run-dir", required=True)
+    p.add_argument("--output", default=None, help="Merged dataset path (default OUTPUT_PATH of the run config)")
+    p.add_argument("--partial", action="store_true", help="Merge the finished shards even if some are missing")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.command == "worker":
+        run_worker(args.run_dir, args.shard, resume=args.resume)
+        return
+    if args.command == "merge":
+        config = load_config(read_manifest(args.run_dir)["config_path"])
+        print(json.dumps(merge_shards(args.run_dir, config, args.output, partial=args.partial), indent=2))
+        return
+
+    from . import chunk_selector
+
+    config = load_config(args.config)
+    shards = args.shards or int(getattr(config, "DIST_NUM_SHARDS", 4))
+    run_dir = args.run_dir or os.path.join(getattr(config, "DIST_RUN_DIR", "./output/distributed"),
+                                           time.strftime("%Y%m%d-%H%M%S"))
+    valid_chunks, _, backend = load_corpus(config)
+    if not valid_chunks:
+        sys.exit(1)
+    bundles = chunk_selector.ContextSelector(valid_chunks, config, backend=backend).select_contexts()
+    if not bundles:
+        logger.error("No context bundles selected. Exiting.")
+        sys.exit(1)
+    if args.command == "plan":
+        plan_shards(bundles, config, args.config, args.evaluation_mode, shards, run_dir, workers=args.workers)
+        logger.info("Start workers with: python -m evaluation_api.generation.distributed worker --run-dir %s", run_dir)
+        return
+    print(json.dumps(run_local(bundles, config, args.config, args.evaluation_mode, shards, run_dir,
+                               args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/generation/distributed.py ---
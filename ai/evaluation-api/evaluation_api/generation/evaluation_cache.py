@@ -0,0 +1,119 @@
+# --- File: evaluation_api/generation/evaluation_cache.py ---
+# Cache of raw evaluation artifacts (namespace "evaluation" of the shared SQLite cache).
+#
+# Only threshold-independent results are stored: the BM25/coverage metrics of the
+# non-LLM gate, and the LLM answer plus its RAGAS score. Acceptance is re-decided
+# from them on every run, so changing BM25_MIN_MARGIN, COVERAGE_* or
+# RAGAS_CONTEXT_RELEVANCE_THRESHOLD re-judges a cached dataset without any LLM call.
+
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .models import GeneratedQuery
+from ..utils.cache_utils import SimpleCache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the BM25/coverage metric computation changes
+NONLLM_METRICS_VERSION = 1
+
+
+def _hash(payload: Dict[str, Any]) -> str:
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """Per-query evaluation artifacts keyed by question, contexts, model and prompt version.
+
+    RAGAS scores are additionally tagged with the judge model that produced them.
+    """
+
+    def __init__(self, config, cache: SimpleCache):
+        self.config = config
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.nonllm_hits = 0
+        self.llm_hits = 0
+        self.answer_hits = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional["EvaluationCache"]:
+        """Cache for this run, or None when CACHE_EVALUATION / ENABLE_CACHING is off."""
+        if not (getattr(config, "CACHE_EVALUATION", True) and getattr(config, "ENABLE_CACHING", True)):
+            return None
+        try:
+            return cls(config, SimpleCache.from_config(config, namespace="evaluation"))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Evaluation cache unavailable (%s); evaluating without it.", e)
+            return None
+
+    # --- Keys ---
+    @staticmethod
+    def _contexts(q: GeneratedQuery) -> Dict[str, List[str]]:
+        return {
+            "golden": [c.chunk_text for c in q.golden_chunks],
+            "distractors": [c.chunk_text for c in getattr(q, "distractor_chunks", []) or []],
+        }
+
+    def nonllm_key(self, q: GeneratedQuery) -> str:
+        return _hash({"stage": "nonllm", "version": NONLLM_METRICS_VERSION, "question": q.query, **self._contexts(q)})
+
+    def llm_key(self, q: GeneratedQuery, model: Optional[str], prompt_version: Any) -> str:
+        return _hash({
+            "stage": "llm",
+            "question": q.query,
+            "golden": [c.chunk_text for c in q.golden_chunks],
+            "model": model,
+            "prompt_version": prompt_version,
+            "temperature": getattr(self.config, "TEMPERATURE", 0.3),
+            "max_tokens": getattr(self.config, "MAX_TOKENS", 64),
+        })
+
+    # --- Non-LLM gate ---
+    def get_nonllm(self, q: GeneratedQuery) -> Optional[Dict[str, Any]]:
+        metrics = self.cache.get(self.nonllm_key(q))
+        if metrics is not None:
+            with self._lock:
+                self.nonllm_hits += 1
+        return metrics
+
+    def set_nonllm(self, q: GeneratedQuery, metrics: Dict[str, Any]):
+        self.cache.set(self.nonllm_key(q), dict(metrics))
+
+    # --- LLM answer + RAGAS score ---
+    def get_llm(self, q: GeneratedQuery, model: Optional[str], prompt_version: Any,
+                judge_model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """``{"answer", "ragas_score"}``; ``ragas_score`` is None when only the answer was kept
+        or the score came from a different judge model (the answer is still reused)."""
+        entry = self.cache.get(self.llm_key(q, model, prompt_version))
+        if entry is not None:
+            if entry.get("judge_model") != judge_model:
+                entry = {**entry, "ragas_score": None}
+            with self._lock:
+                if entry.get("ragas_score") is not None:
+                    self.llm_hits += 1
+                else:
+                    self.answer_hits += 1
+        return entry
+
+    def set_llm(self, q: GeneratedQuery, model: Optional[str], prompt_version: Any,
+                answer: str, ragas_score: Optional[float], judge_model: Optional[str] = None):
+        self.cache.set(self.llm_key(q, model, prompt_version),
+                       {"answer": answer, "ragas_score": ragas_score, "judge_model": judge_model})
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "nonllm_hits": self.nonllm_hits,
+                "llm_hits": self.llm_hits,
+                "answer_only_hits": self.answer_hits,
+            }
+
+    def close(self):
+        self.cache.close()
+
+# --- End File: evaluation_api/generation/evaluation_cache.py ---
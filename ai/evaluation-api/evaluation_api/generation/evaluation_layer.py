@@ -1,14 +1,30 @@
 import logging
 import os
-import random
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from typing import List, Optional, Tuple, Dict, Any
 from tqdm import tqdm
 
-from .models import GeneratedQuery, ValidatedGroundTruth
+from .models import ChunkData, GeneratedQuery, ValidatedGroundTruth
+from .bm25_scorer import create_scorer, nonllm_accept, tokenize
+from .evaluation_cache import EvaluationCache
+from .ragas_scoring import RagasBatchScorer
+from .retrieval_gate import create_retrieval_gate
+from ..utils.rng import rng_stream
+from ..utils.llm_stats import LLMCallStats
+from ..utils.rate_limit import TokenBucket, llm_retry
 
 logger = logging.getLogger(__name__)
 
+ANSWER_SYSTEM_PROMPT = (
+    "You are a helpful assistant. Answer STRICTLY using the provided context. "
+    "If the answer is not present, say 'NOT_ANSWERABLE'."
+)
+# Part of the evaluation cache key: bump when the answer prompt changes
+ANSWER_PROMPT_VERSION = 1
+
 
 def _build_azure_client(config):
     try:
@@ -24,23 +40,58 @@ def _build_azure_client(config):
     if not (endpoint and api_key):
         return None
     try:
+        # Retries (including 429 Retry-After handling) are owned by _GuardedClient
         return AzureOpenAI(
             azure_endpoint=endpoint,
             api_key=api_key,
             api_version="2024-02-01",
+            max_retries=0,
         )
     except Exception:  # noqa: BLE001
         return None
 
 
+class _GuardedClient:
+    """``chat.completions.create`` facade adding the shared token bucket, retries and call stats.
+
+    One instance is shared by all evaluation threads of a run.
+    """
+
+    def __init__(self, client, config):
+        self._client = client
+        self.bucket = TokenBucket.from_config(config, prefix="EVAL_LLM")
+        self.stats = LLMCallStats("evaluation")
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+        @llm_retry(self.stats)
+        def create_with_retry(**kwargs):
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                resp = self._client.chat.completions.create(**kwargs)
+            except Exception:  # noqa: BLE001
+                self.stats.record_call(time.perf_counter() - started, ok=False)
+                raise
+            self.stats.record_call(time.perf_counter() - started, ok=True, usage=getattr(resp, "usage", None))
+            return resp
+
+        self._create_with_retry = create_with_retry
+
+    def _create(self, **kwargs):
+        from tenacity import RetryError  # type: ignore
+
+        try:
+            return self._create_with_retry(**kwargs)
+        except RetryError as e:
+            # Surface the last underlying error to the caller's existing fallback handling
+            raise e.last_attempt.exception() or e
+
+
 def _answer_with_context(client, model: str, question: str, contexts: List[str], temperature: float, max_tokens: int) -> str:
     if client is None:
         # Fallback: return truncated context as a pseudo-answer
         return (" ".join(contexts))[:256]
-    system = (
-        "You are a helpful assistant. Answer STRICTLY using the provided context. "
-        "If the answer is not present, say 'NOT_ANSWERABLE'."
-    )
+    system = ANSWER_SYSTEM_PROMPT
     user = (
         "## Context\n" + "\n---\n".join(contexts) + "\n\n" +
         "## Question\n" + question + "\n\nProvide a concise answer."
@@ -57,42 +108,26 @@ def _answer_with_context(client, model: str, question: str, contexts: List[str],
     return (resp.choices[0].message.content or "").strip()
 
 
-def _deepeval_score(question: str, answer: str, contexts: List[str]) -> Optional[float]:
-    # Import via importlib to avoid linter import errors when optional dep is missing
-    import importlib
-    try:
-        metrics_mod = importlib.import_module('deepeval.metrics.ragas')
-        tc_mod = importlib.import_module('deepeval.test_case')
-        RagasMetric = getattr(metrics_mod, 'RagasMetric')
-        LLMTestCase = getattr(tc_mod, 'LLMTestCase')
-    except ImportError:
-        return None
+_shared_ragas_scorer: Optional[RagasBatchScorer] = None
+_shared_ragas_lock = threading.Lock()
 
-    test_case = LLMTestCase(
-        input=question,
-        actual_output=answer,
-        expected_output=answer,  # We don't have separate ground-truth answers; align for now
-        retrieval_context=contexts,
-    )
-    metric = RagasMetric()
-    try:
-        result = metric.measure(test_case)
-        score = getattr(result, "score", None)
-        if score is None:
-            score = getattr(metric, "score", None)
-        return float(score) if score is not None else None
-    except Exception:  # noqa: BLE001
-        return None
+
+def _default_ragas_scorer() -> RagasBatchScorer:
+    """Process-wide scorer (one RagasMetric instance) for callers that don't pass their own."""
+    global _shared_ragas_scorer
+    with _shared_ragas_lock:
+        if _shared_ragas_scorer is None:
+            _shared_ragas_scorer = RagasBatchScorer()
+        return _shared_ragas_scorer
+
+
+def _deepeval_score(question: str, answer: str, contexts: List[str],
+                    scorer: Optional[RagasBatchScorer] = None) -> Optional[float]:
+    return (scorer or _default_ragas_scorer()).score_one((question, answer, contexts))
 
 
 def _tokenize(text: str) -> List[str]:
-    try:
-        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS  # type: ignore
-        stop = ENGLISH_STOP_WORDS
-    except Exception:  # noqa: BLE001
-        stop = set()
-    tokens = re.findall(r"[a-zA-Z0-9]+", (text or "").lower())
-    return [t for t in tokens if t not in stop]
+    return tokenize(text)
 
 
 def _bm25_nonllm_check(question: str, golden_contexts: List[str], distractor_contexts: List[str], config) -> Tuple[bool, Dict[str, Any]]:
@@ -132,13 +167,6 @@ def _bm25_nonllm_check(question: str, golden_contexts: List[str], distractor_con
         best_idx = 1 + max(range(len(docs_tok) - 1), key=lambda i: scores[i + 1], default=0)
         best_dist_cov = len(q_set.intersection(set(docs_tok[best_idx]))) / (len(q_set) or 1)
 
-    # Thresholds
-    min_margin = float(getattr(config, "BM25_MIN_MARGIN", 0.5))
-    min_golden_cov = float(getattr(config, "COVERAGE_MIN_GOLDEN", 0.6))
-    min_cov_gap = float(getattr(config, "COVERAGE_GAP_MIN", 0.2))
-
-    accept = (rank == 1) and (margin >= min_margin) and (golden_cov >= min_golden_cov) and ((golden_cov - best_dist_cov) >= min_cov_gap)
-
     metrics: Dict[str, Any] = {
         "bm25_rank": rank,
         "bm25_margin": round(margin, 4),
@@ -147,93 +175,325 @@ def _bm25_nonllm_check(question: str, golden_contexts: List[str], distractor_con
         "golden_coverage": round(golden_cov, 4),
         "best_distractor_coverage": round(best_dist_cov, 4),
     }
+    # Decided from the metrics alone so cached metrics can be re-judged under new thresholds
+    accept = nonllm_accept(metrics, config)
     return accept, metrics
 
 
+def prepare_llm(config, evaluation_mode: str) -> Tuple[Any, Optional[str]]:
+    """Build the (client, model) pair used by LLM-backed modes; (None, None) otherwise."""
+    mode = (evaluation_mode or "llm").lower()
+    if mode not in ("llm", "hybrid"):
+        return None, None
+    client = _build_azure_client(config)
+    if client is not None:
+        client = _GuardedClient(client, config)
+    return client, getattr(config, "AZURE_OPENAI_DEPLOYMENT_NAME", None)
+
+
+def log_eval_stats(client):
+    """Log call statistics of a client returned by ``prepare_llm``."""
+    stats = getattr(client, "stats", None)
+    if stats is None:
+        return
+    snap = stats.snapshot()
+    if snap["calls"]:
+        logger.info("LLM Evaluation Stats: %d calls (%d failed), %d retries (%d rate-limited), "
+                    "p95 latency %.0f ms, %.2f calls/s",
+                    snap["calls"], snap["failures"], snap["retries"], snap["rate_limited"],
+                    snap["latency_p95_ms"], snap["calls_per_sec"])
+
+
+def _pre_llm_stage(
+    q: GeneratedQuery, config, mode: str, model: Optional[str],
+    nonllm_check: Optional[Tuple[bool, Dict[str, Any]]],
+    corpus_check: Optional[Tuple[bool, Dict[str, Any]]] = None,
+) -> Tuple[bool, bool, Dict[str, Any]]:
+    """Cheap gates before any LLM work: returns (accepted, needs_llm, validation_data)."""
+    validation_data: Dict[str, Any] = {"query_type": q.query_type}
+
+    if corpus_check is not None:
+        corpus_ok, m = corpus_check
+        validation_data.update(m)
+        if not corpus_ok:
+            return False, False, validation_data
+
+    if mode in ("none",):
+        validation_data.update({"evaluation": "none"})
+        return True, False, validation_data
+
+    if mode in ("nonllm", "hybrid"):
+        if nonllm_check is not None:
+            nonllm_ok, m = nonllm_check
+        else:
+            golden_ctx = [c.chunk_text for c in q.golden_chunks]
+            distractor_ctx = [c.chunk_text for c in getattr(q, "distractor_chunks", [])]
+            nonllm_ok, m = _bm25_nonllm_check(q.query, golden_ctx, distractor_ctx, config)
+        validation_data.update({"nonllm_metrics": m})
+        if nonllm_ok:
+            validation_data.update({"evaluation": "nonllm"})
+            return True, False, validation_data
+
+    if mode in ("llm", "hybrid") and model:
+        # Optional sampling in hybrid mode
+        # Keyed per query so the escalation sample is independent of evaluation order
+        escalation_rng = rng_stream(getattr(config, "SEED", None), q.bundle_id, q.query_type, q.query, "hybrid_escalation")
+        escalate_rate = float(getattr(config, "EVAL_LLM_SAMPLE_RATE", 0.1))
+        if mode == "hybrid" and escalation_rng.random() > escalate_rate:
+            # skip LLM escalation
+            return False, False, validation_data
+        return False, True, validation_data
+
+    return False, False, validation_data
+
+
+def _answer_stage(q: GeneratedQuery, config, client, model: Optional[str]) -> Tuple[str, bool]:
+    """(answer, from_llm); the pseudo-answer fallback is never cached."""
+    golden_ctx = [c.chunk_text for c in q.golden_chunks]
+    temperature = getattr(config, "TEMPERATURE", 0.3)
+    max_tokens = getattr(config, "MAX_TOKENS", 64)
+    try:
+        return _answer_with_context(client, model, q.query, golden_ctx, temperature, max_tokens), client is not None
+    except Exception:  # noqa: BLE001
+        return (" ".join(golden_ctx))[:256], False
+
+
+def _llm_scores(
+    queries: List[GeneratedQuery], config, client, model: Optional[str],
+    ragas_scorer: Optional[RagasBatchScorer], eval_cache: Optional[EvaluationCache] = None, ex=None,
+) -> List[Optional[float]]:
+    """RAGAS scores for ``queries``: cached answers/scores are reused, the rest answered (on ``ex``) and batch scored."""
+    scorer = ragas_scorer or _default_ragas_scorer()
+    judge_model = scorer.judge_model if eval_cache is not None else None
+    entries: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+    if eval_cache is not None:
+        entries = [eval_cache.get_llm(q, model, ANSWER_PROMPT_VERSION, judge_model) for q in queries]
+
+    to_answer = [i for i, e in enumerate(entries) if e is None]
+    answers: List[Tuple[str, bool]] = [((e or {}).get("answer", ""), True) for e in entries]
+
+    def answer(i):
+        return _answer_stage(queries[i], config, client, model)
+
+    fresh = list(ex.map(answer, to_answer)) if ex is not None and len(to_answer) > 1 else [answer(i) for i in to_answer]
+    for i, ans in zip(to_answer, fresh):
+        answers[i] = ans
+
+    scores: List[Optional[float]] = [(e or {}).get("ragas_score") for e in entries]
+    to_score = [i for i, score in enumerate(scores) if score is None]
+    if to_score:
+        items = [(queries[i].query, answers[i][0], [c.chunk_text for c in queries[i].golden_chunks]) for i in to_score]
+        for i, score in zip(to_score, scorer.score_batch(items) if len(items) > 1 else [scorer.score_one(items[0])]):
+            scores[i] = score
+            if eval_cache is not None and answers[i][1]:
+                eval_cache.set_llm(queries[i], model, ANSWER_PROMPT_VERSION, answers[i][0], score, judge_model)
+    return scores
+
+
+def nonllm_checks(
+    queries: List[GeneratedQuery], config, scorer=None, eval_cache: Optional[EvaluationCache] = None,
+) -> List[Optional[Tuple[bool, Dict[str, Any]]]]:
+    """Non-LLM gate results for ``queries`` (None = let evaluate_query run the per-query check).
+
+    Cached metrics are re-judged against the current thresholds; misses go through the
+    batch ``scorer`` when there is one.
+    """
+    checks: List[Optional[Tuple[bool, Dict[str, Any]]]] = [None] * len(queries)
+    if eval_cache is not None:
+        for i, q in enumerate(queries):
+            metrics = eval_cache.get_nonllm(q)
+            if metrics is not None:
+                checks[i] = (nonllm_accept(metrics, config), metrics)
+    misses = [i for i, check in enumerate(checks) if check is None]
+    if not misses or (scorer is None and eval_cache is None):
+        return checks
+    if scorer is not None:
+        computed = scorer.check([queries[i] for i in misses], config)
+    else:
+        computed = [
+            _bm25_nonllm_check(queries[i].query, [c.chunk_text for c in queries[i].golden_chunks],
+                               [c.chunk_text for c in getattr(queries[i], "distractor_chunks", [])], config)
+            for i in misses
+        ]
+    for i, check in zip(misses, computed):
+        checks[i] = check
+        if eval_cache is not None:
+            eval_cache.set_nonllm(queries[i], check[1])
+    return checks
+
+
+def passes_nonllm_gate(query: GeneratedQuery, config, scorer=None) -> bool:
+    """Whether one query passes the non-LLM gate (BM25 rank/margin + coverage)."""
+    if scorer is not None:
+        return scorer.check([query], config)[0][0]
+    accept, _ = _bm25_nonllm_check(
+        query.query,
+        [c.chunk_text for c in query.golden_chunks],
+        [c.chunk_text for c in getattr(query, "distractor_chunks", [])],
+        config,
+    )
+    return accept
+
+
+def _apply_ragas_score(
+    validation_data: Dict[str, Any], ragas_score: Optional[float], config, mode: str, model: Optional[str]
+) -> bool:
+    validation_data.update({
+        "ragas_context_relevance": round(float(ragas_score), 3) if ragas_score is not None else None,
+        "generator_model": ("azure:" + model) if model else "unknown",
+    })
+    thr = float(getattr(config, "RAGAS_CONTEXT_RELEVANCE_THRESHOLD", 0.8))
+    if ragas_score is None or ragas_score >= thr:
+        validation_data.update({"evaluation": ("llm" if mode == "llm" else "hybrid_llm")})
+        return True
+    return False
+
+
+def _finalize(q: GeneratedQuery, accepted: bool, validation_data: Dict[str, Any]) -> Optional[ValidatedGroundTruth]:
+    if not accepted:
+        return None
+
+    expected_doc_ids = sorted(list({c.doc_id for c in q.golden_chunks}))
+    context_chunks = [
+        {"doc_id": c.doc_id, "chunk_id": c.chunk_id, "chunk": c.chunk_text}
+        for c in q.golden_chunks
+    ]
+    return ValidatedGroundTruth(
+        query=q.query,
+        expected_doc_ids=expected_doc_ids,
+        context_chunks=context_chunks,
+        validation=validation_data,
+    )
+
+
+def evaluate_query(
+    q: GeneratedQuery, config, evaluation_mode: str = "llm", client=None, model: Optional[str] = None,
+    nonllm_check: Optional[Tuple[bool, Dict[str, Any]]] = None,
+    ragas_scorer: Optional[RagasBatchScorer] = None,
+    eval_cache: Optional[EvaluationCache] = None,
+    corpus_check: Optional[Tuple[bool, Dict[str, Any]]] = None,
+) -> Optional[ValidatedGroundTruth]:
+    """Evaluate a single generated query; returns None when it is rejected.
+
+    ``nonllm_check`` is a precomputed ``(accept, metrics)`` from the batch BM25 scorer;
+    ``ragas_scorer`` is the shared RAGAS scorer (a process-wide one when omitted);
+    ``eval_cache`` reuses the answer and RAGAS score of an earlier run; ``corpus_check`` is
+    the retrieval gate result (the "retrieval" mode then continues like "hybrid").
+    """
+    mode = (evaluation_mode or "llm").lower()
+    if mode == "retrieval":
+        mode = "hybrid"
+    accepted, needs_llm, validation_data = _pre_llm_stage(q, config, mode, model, nonllm_check, corpus_check)
+    if needs_llm:
+        ragas_score = _llm_scores([q], config, client, model, ragas_scorer, eval_cache)[0]
+        accepted = _apply_ragas_score(validation_data, ragas_score, config, mode, model)
+    return _finalize(q, accepted, validation_data)
+
+
+def create_ragas_scorer(config, evaluation_mode: str) -> Optional[RagasBatchScorer]:
+    """Shared RAGAS scorer for modes that escalate to the LLM; None otherwise."""
+    if (evaluation_mode or "").lower() not in ("llm", "hybrid"):
+        return None
+    scorer = RagasBatchScorer(config)
+    if not scorer.available:
+        logger.info("deepeval not installed; LLM-evaluated queries are accepted without a RAGAS score.")
+    return scorer
+
+
+def log_scoring_stats(scorer: Optional[RagasBatchScorer]):
+    """Log RAGAS scoring throughput of a scorer returned by ``create_ragas_scorer``."""
+    if scorer is None:
+        return
+    snap = scorer.snapshot()
+    if snap["scored"]:
+        logger.info("RAGAS Scoring Stats: %d scored (%d failed) in %d batches, %d fallbacks, %.2f scores/s",
+                    snap["scored"], snap["failed"], snap["batches"], snap["fallbacks"], snap["scores_per_sec"])
+
+
 def evaluate_queries(
-    generated_queries: List[GeneratedQuery], config, evaluation_mode: str = "llm"
+    generated_queries: List[GeneratedQuery], config, evaluation_mode: str = "llm",
+    backend=None, chunks: Optional[List[ChunkData]] = None,
+    llm: Optional[Tuple[Any, Optional[str]]] = None,
 ) -> List[ValidatedGroundTruth]:
     """
     Evaluate generated queries.
+    ``llm`` is a (client, model) pair from ``prepare_llm``, so the caller can read the
+    client's call stats afterwards; built here when None.
     Modes:
-      - none:    accept all
-      - nonllm:  BM25/coverage checks only
-      - llm:     Azure OpenAI answer + Ragas/DeepEval gating
-      - hybrid:  non-LLM first; if fail, optionally escalate to LLM by sample rate
+      - none:      accept all
+      - nonllm:    BM25/coverage checks only
+      - llm:       Azure OpenAI answer + Ragas/DeepEval gating
+      - hybrid:    non-LLM first; if fail, optionally escalate to LLM by sample rate
+      - retrieval: golden doc must rank within RETRIEVAL_GATE_MAX_RANK over the whole
+                   corpus (``backend`` / ``chunks``), then hybrid on the survivors
     """
     mode = (evaluation_mode or "llm").lower()
     logger.info("Evaluating %s queries with mode=%s...", len(generated_queries), mode)
 
-    final_dataset: List[ValidatedGroundTruth] = []
+    # Corpus-level gate: all queries embedded and searched in batches
+    corpus_checks: List[Optional[Tuple[bool, Dict[str, Any]]]] = [None] * len(generated_queries)
+    gate = create_retrieval_gate(config, mode, backend=backend, chunks=chunks)
+    if mode == "retrieval":
+        mode = "hybrid"
+    if gate is not None:
+        batch_size = max(1, int(getattr(config, "RETRIEVAL_GATE_BATCH_SIZE", 1024)))
+        for start in tqdm(range(0, len(generated_queries), batch_size), desc="Corpus retrieval gate"):
+            batch = generated_queries[start:start + batch_size]
+            corpus_checks[start:start + len(batch)] = gate.check(batch)
+        logger.info("Corpus retrieval gate: %d/%d queries have their golden doc within rank %d.",
+                    sum(1 for c in corpus_checks if c and c[0]), len(generated_queries), gate.max_rank)
 
     # Prepare LLM client if needed
-    client = None
-    model = None
-    temperature = getattr(config, "TEMPERATURE", 0.3)
-    max_tokens = getattr(config, "MAX_TOKENS", 64)
-    if mode in ("llm", "hybrid"):
-        client = _build_azure_client(config)
-        model = getattr(config, "AZURE_OPENAI_DEPLOYMENT_NAME", None)
-
-    escalate_rate = float(getattr(config, "EVAL_LLM_SAMPLE_RATE", 0.1))
-
-    for q in tqdm(generated_queries, desc="Evaluating queries"):
-        question = q.query
-        golden_ctx = [c.chunk_text for c in q.golden_chunks]
-        distractor_ctx = [c.chunk_text for c in getattr(q, "distractor_chunks", [])]
-
-        accepted = False
-        validation_data: Dict[str, Any] = {"query_type": q.query_type}
-
-        if mode in ("none",):
-            accepted = True
-            validation_data.update({"evaluation": "none"})
-
-        if not accepted and mode in ("nonllm", "hybrid"):
-            nonllm_ok, m = _bm25_nonllm_check(question, golden_ctx, distractor_ctx, config)
-            validation_data.update({"nonllm_metrics": m})
-            if nonllm_ok:
-                accepted = True
-                validation_data.update({"evaluation": "nonllm"})
-
-        if not accepted and mode in ("llm", "hybrid") and model:
-            # Optional sampling in hybrid mode
-            if mode == "hybrid" and random.random() > escalate_rate:
-                # skip LLM escalation
-                pass
-            else:
-                try:
-                    answer = _answer_with_context(client, model, question, golden_ctx, temperature, max_tokens)
-                except Exception:  # noqa: BLE001
-                    answer = (" ".join(golden_ctx))[:256]
-                ragas_score = _deepeval_score(question, answer, golden_ctx)
-                validation_data.update({
-                    "ragas_context_relevance": round(float(ragas_score), 3) if ragas_score is not None else None,
-                    "generator_model": ("azure:" + model) if model else "unknown",
-                })
-                thr = float(getattr(config, "RAGAS_CONTEXT_RELEVANCE_THRESHOLD", 0.8))
-                if ragas_score is None or ragas_score >= thr:
-                    accepted = True
-                    validation_data.update({"evaluation": ("llm" if mode == "llm" else "hybrid_llm")})
-
-        if not accepted:
-            continue
-
-        expected_doc_ids = sorted(list({c.doc_id for c in q.golden_chunks}))
-        context_chunks = [
-            {"doc_id": c.doc_id, "chunk_id": c.chunk_id, "chunk": c.chunk_text}
-            for c in q.golden_chunks
-        ]
-
-        final_dataset.append(
-            ValidatedGroundTruth(
-                query=question,
-                expected_doc_ids=expected_doc_ids,
-                context_chunks=context_chunks,
-                validation=validation_data,
-            )
-        )
+    client, model = llm if llm is not None else prepare_llm(config, mode)
+
+    # Raw artifacts of earlier runs; acceptance is always re-decided with the current thresholds
+    eval_cache = EvaluationCache.from_config(config) if mode != "none" else None
+
+    # Non-LLM gate for all queries at once (sparse batch BM25), in bounded batches
+    checks: List[Optional[Tuple[bool, Dict[str, Any]]]] = [None] * len(generated_queries)
+    if mode in ("nonllm", "hybrid"):
+        scorer = create_scorer(mode)
+        batch_size = max(1, int(getattr(config, "NONLLM_BATCH_SIZE", 1024)))
+        for start in range(0, len(generated_queries), batch_size):
+            batch = generated_queries[start:start + batch_size]
+            checks[start:start + len(batch)] = nonllm_checks(batch, config, scorer, eval_cache)
+
+    # Cheap gates first; only queries that still need the LLM are answered and scored
+    stages = [
+        _pre_llm_stage(q, config, mode, model, check, corpus_check)
+        for q, check, corpus_check in zip(generated_queries, checks, corpus_checks)
+    ]
+    pending = [i for i, (_, needs_llm, _) in enumerate(stages) if needs_llm]
+    accepted = [acc for acc, _, _ in stages]
+
+    if pending:
+        ragas_scorer = create_ragas_scorer(config, mode)
+        max_workers = int(getattr(config, "EVAL_MAX_WORKERS", 8))
+        ex = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 and len(pending) > 1 else None
+        progress = tqdm(total=len(pending), desc="Evaluating queries")
+        try:
+            # Answer one scoring window concurrently, then score it with a single batch call
+            for start in range(0, len(pending), ragas_scorer.batch_size):
+                window = pending[start:start + ragas_scorer.batch_size]
+                scores = _llm_scores([generated_queries[i] for i in window], config, client, model,
+                                     ragas_scorer, eval_cache, ex)
+                for i, score in zip(window, scores):
+                    accepted[i] = _apply_ragas_score(stages[i][2], score, config, mode, model)
+                progress.update(len(window))
+        finally:
+            progress.close()
+            if ex is not None:
+                ex.shutdown()
+        log_scoring_stats(ragas_scorer)
+
+    results = [_finalize(q, acc, stage[2]) for q, acc, stage in zip(generated_queries, accepted, stages)]
+    final_dataset = [r for r in results if r is not None]
+    log_eval_stats(client)
+    if eval_cache is not None:
+        eval_cache.close()
+        snap = eval_cache.snapshot()
+        logger.info("Evaluation cache: %d non-LLM hits, %d answer+score hits, %d answer-only hits",
+                    snap["nonllm_hits"], snap["llm_hits"], snap["answer_only_hits"])
 
     logger.info("Evaluation complete. %s queries passed validation.", len(final_dataset))
     return final_dataset
-
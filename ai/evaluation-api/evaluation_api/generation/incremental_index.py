@@ -0,0 +1,386 @@
+# --- File: evaluation_api/generation/incremental_index.py ---
+# Mutable chunk index for resident corpora: upsert / delete by (doc_id, chunk_id)
+# without reloading or rebuilding anything.
+#
+#   IncrementalIndex   search-backend compatible (find_similar_chunks[_with_scores|_batch],
+#                      find_duplicates, get_backend_info) over an ID-mapped FAISS index
+#                      (IndexIDMap2 + IndexFlatIP), or an exact numpy matrix when FAISS is
+#                      missing. Every change re-runs near-duplicate detection only for the
+#                      neighbourhood it touches and returns a ChangeSet.
+#   SelectionCache     per-golden selection bundles; a ChangeSet invalidates only the
+#                      bundles it can change.
+
+import importlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .models import ChunkData, SelectionBundle
+from .shared_embeddings import stack
+
+logger = logging.getLogger(__name__)
+
+ChunkKey = Tuple[str, str]
+
+
+def chunk_key(chunk: ChunkData) -> ChunkKey:
+    return chunk.doc_id, chunk.chunk_id
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+@dataclass
+class ChangeSet:
+    """What one upsert/delete did to the index."""
+    added: List[ChunkKey] = field(default_factory=list)        # now searchable (new, replaced or re-admitted)
+    removed: List[ChunkKey] = field(default_factory=list)      # no longer searchable (deleted or replaced)
+    duplicates: List[ChunkKey] = field(default_factory=list)   # rejected as near-duplicates of an indexed chunk
+    readmitted: List[ChunkKey] = field(default_factory=list)   # former duplicates whose original was removed
+
+    def merge(self, other: "ChangeSet"):
+        self.added.extend(other.added)
+        self.removed.extend(other.removed)
+        self.duplicates.extend(other.duplicates)
+        self.readmitted.extend(other.readmitted)
+
+    @property
+    def touched(self) -> Set[ChunkKey]:
+        return set(self.added) | set(self.removed)
+
+    def summary(self) -> Dict[str, int]:
+        return {name: len(getattr(self, name)) for name in ("added", "removed", "duplicates", "readmitted")}
+
+
+class _NumpyIDIndex:
+    """Exact inner-product search over slots; deleted slots are recycled."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.size = 0                                   # slots ever used
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self._slot_of: Dict[int, int] = {}
+        self._free: List[int] = []
+
+    def _grow(self, needed: int):
+        capacity = max(needed, 2 * len(self.ids), 1024)
+        extra = capacity - len(self.ids)
+        self.matrix = np.vstack([self.matrix, np.zeros((extra, self.dim), dtype=np.float32)])
+        self.ids = np.concatenate([self.ids, np.full(extra, -1, dtype=np.int64)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        if self.size + len(ids) > len(self.ids):
+            self._grow(self.size + len(ids))
+        for vector, id_ in zip(vectors, ids):
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = self.size
+                self.size += 1
+            self.matrix[slot] = vector
+            self.ids[slot] = id_
+            self.active[slot] = True
+            self._slot_of[int(id_)] = slot
+
+    def remove_ids(self, ids: np.ndarray):
+        for id_ in ids:
+            slot = self._slot_of.pop(int(id_), None)
+            if slot is not None:
+                self.active[slot] = False
+                self._free.append(slot)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = self.size
+        sims = queries @ self.matrix[:n].T
+        sims[:, ~self.active[:n]] = -np.inf
+        out_s = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_i = np.full((len(queries), k), -1, dtype=np.int64)
+        k_eff = min(k, n)
+        if k_eff == 0:
+            return out_s, out_i
+        top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+        top_s = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_s, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        out_s[:, :k_eff] = np.take_along_axis(top_s, order, axis=1)
+        out_i[:, :k_eff] = np.where(np.isfinite(out_s[:, :k_eff]), self.ids[top], -1)
+        return out_s, out_i
+
+
+def _create_id_index(dim: int):
+    try:
+        faiss = importlib.import_module("faiss")  # type: ignore
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim)), "FAISS-IDMap"
+    except ImportError:
+        return _NumpyIDIndex(dim), "numpy-IDMap"
+
+
+class IncrementalIndex:
+    """Search backend over validated chunks that supports in-place upsert/delete.
+
+    Chunks get stable int64 ids; vectors are stored L2-normalized, so the chunks'
+    own ``embedding`` lists may be dropped once the index is built. Searches exclude
+    the probe's own document, as distractor selection expects.
+    """
+
+    def __init__(self, chunks: Sequence[ChunkData], config, dim: Optional[int] = None):
+        self.threshold = float(getattr(config, "DUPLICATE_COSINE_SIM", 0.98))
+        self.neighbors = max(1, int(getattr(config, "DEDUP_MAX_NEIGHBORS", 20)))
+        usable = [c for c in chunks if c.embedding is not None and len(c.embedding)]
+        self.dim = int(dim or (len(usable[0].embedding) if usable else getattr(config, "EMBED_DIM", 0)))
+        if not self.dim:
+            raise ValueError("IncrementalIndex needs chunk embeddings or EMBED_DIM")
+        self._index, self.kind = _create_id_index(self.dim)
+        self._lock = threading.RLock()
+        self._next_id = 0
+        self._id_of: Dict[ChunkKey, int] = {}
+        self._chunk_of: Dict[int, ChunkData] = {}
+        self._vector_of: Dict[int, np.ndarray] = {}
+        # Rejected near-duplicates: key -> (chunk, vector, key of the indexed chunk it duplicates)
+        self._duplicates: Dict[ChunkKey, Tuple[ChunkData, np.ndarray, ChunkKey]] = {}
+        if usable:
+            # Already validated by validate_chunks: index as-is
+            self._add(usable, stack(usable, normalize=True))
+
+    # --- Backend protocol ---
+    def get_backend_info(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "chunks": len(self), "duplicates": len(self._duplicates), "incremental": True}
+
+    def __len__(self) -> int:
+        return len(self._id_of)
+
+    def chunks(self) -> List[ChunkData]:
+        with self._lock:
+            return list(self._chunk_of.values())
+
+    def get(self, key: ChunkKey) -> Optional[ChunkData]:
+        with self._lock:
+            id_ = self._id_of.get(tuple(key))
+            return self._chunk_of.get(id_) if id_ is not None else None
+
+    def vector(self, key: ChunkKey) -> Optional[np.ndarray]:
+        with self._lock:
+            id_ = self._id_of.get(tuple(key))
+            return self._vector_of.get(id_) if id_ is not None else None
+
+    def _probe_vector(self, chunk: ChunkData) -> np.ndarray:
+        stored = self.vector(chunk_key(chunk))
+        if stored is not None:
+            return stored
+        return _unit(np.asarray(chunk.embedding, dtype=np.float32))
+
+    def _search(self, vectors: np.ndarray, k: int, exclude_docs: Sequence[str]) -> List[List[Tuple[ChunkData, float]]]:
+        out = []
+        with self._lock:
+            if not len(self):
+                return [[] for _ in range(len(vectors))]
+            # Over-fetch so chunks of the probe's own document can be skipped
+            fetch = min(len(self), k + 8)
+            while True:
+                sims, ids = self._index.search(np.ascontiguousarray(vectors, dtype=np.float32), fetch)
+                out = []
+                short = False
+                for row_s, row_i, doc in zip(sims, ids, exclude_docs):
+                    hits = [(self._chunk_of[int(i)], float(s)) for s, i in zip(row_s, row_i)
+                            if i >= 0 and self._chunk_of[int(i)].doc_id != doc]
+                    short |= len(hits) < k and fetch < len(self)
+                    out.append(hits[:k])
+                if not short:
+                    return out
+                fetch = min(len(self), fetch * 4)
+
+    def find_similar_chunks_with_scores(self, chunk: ChunkData, k: int) -> List[Tuple[ChunkData, float]]:
+        return self._search(self._probe_vector(chunk)[None, :], k, [chunk.doc_id])[0]
+
+    def find_similar_chunks(self, chunk: ChunkData, k: int) -> List[ChunkData]:
+        return [c for c, _ in self.find_similar_chunks_with_scores(chunk, k)]
+
+    def find_similar_chunks_batch(self, chunks: Sequence[ChunkData], k: int) -> List[List[ChunkData]]:
+        if not chunks:
+            return []
+        vectors = np.stack([self._probe_vector(c) for c in chunks])
+        return [[c for c, _ in hits] for hits in self._search(vectors, k, [c.doc_id for c in chunks])]
+
+    def find_duplicates(self, threshold: float) -> List[Tuple[int, int]]:
+        """Pairs (i, j), i < j, of positions in ``chunks()`` with cosine >= ``threshold``."""
+        with self._lock:
+            ids = list(self._chunk_of)
+            position = {id_: p for p, id_ in enumerate(ids)}
+            vectors = np.stack([self._vector_of[i] for i in ids]) if ids else np.zeros((0, self.dim), np.float32)
+            sims, found = self._index.search(vectors, min(len(ids), self.neighbors + 1)) if ids else ([], [])
+        pairs = set()
+        for p, (row_s, row_i) in enumerate(zip(sims, found)):
+            for s, i in zip(row_s, row_i):
+                q = position.get(int(i))
+                if q is not None and q != p and s >= threshold:
+                    pairs.add((min(p, q), max(p, q)))
+        return sorted(pairs)
+
+    # --- Mutations ---
+    def _add(self, chunks: Sequence[ChunkData], vectors: np.ndarray):
+        ids = np.arange(self._next_id, self._next_id + len(chunks), dtype=np.int64)
+        self._next_id += len(chunks)
+        self._index.add_with_ids(vectors, ids)
+        for chunk, vector, id_ in zip(chunks, vectors, ids):
+            id_ = int(id_)
+            self._id_of[chunk_key(chunk)] = id_
+            self._chunk_of[id_] = chunk
+            self._vector_of[id_] = vector
+
+    def _remove(self, key: ChunkKey) -> bool:
+        id_ = self._id_of.pop(key, None)
+        if id_ is None:
+            return False
+        self._index.remove_ids(np.asarray([id_], dtype=np.int64))
+        del self._chunk_of[id_]
+        del self._vector_of[id_]
+        return True
+
+    def _admit(self, chunk: ChunkData, vector: np.ndarray, changes: ChangeSet, readmit: bool = False):
+        """Index ``chunk`` unless it is a near-duplicate of an indexed chunk (indexed chunks win)."""
+        key = chunk_key(chunk)
+        if len(self):
+            sims, ids = self._index.search(vector[None, :], min(len(self), self.neighbors))
+            for s, i in zip(sims[0], ids[0]):
+                if i >= 0 and s >= self.threshold:
+                    original = chunk_key(self._chunk_of[int(i)])
+                    chunk.validation_meta["reject_reason"] = f"Near-duplicate chunk (via {self.kind})"
+                    self._duplicates[key] = (chunk, vector, original)
+                    changes.duplicates.append(key)
+                    return
+        chunk.validation_meta.pop("reject_reason", None)
+        chunk.validation_meta["status"] = "Validated"
+        self._add([chunk], vector[None, :])
+        changes.added.append(key)
+        if readmit:
+            changes.readmitted.append(key)
+
+    def _readmit_duplicates_of(self, key: ChunkKey, changes: ChangeSet):
+        # Chunks rejected as duplicates of ``key`` may be unique now; retry them in rejection order
+        orphans = [k for k, (_, _, original) in self._duplicates.items() if original == key]
+        for k in orphans:
+            chunk, vector, _ = self._duplicates.pop(k)
+            self._admit(chunk, vector, changes, readmit=True)
+
+    def upsert(self, chunks: Iterable[ChunkData]) -> ChangeSet:
+        """Insert new chunks or replace existing ones with the same (doc_id, chunk_id)."""
+        changes = ChangeSet()
+        with self._lock:
+            for chunk in chunks:
+                if not chunk.embedding or len(chunk.embedding) != self.dim:
+                    raise ValueError(f"chunk {chunk_key(chunk)} needs a {self.dim}-dim embedding")
+                key = chunk_key(chunk)
+                vector = _unit(np.asarray(chunk.embedding, dtype=np.float32))
+                self._duplicates.pop(key, None)
+                if self._remove(key):
+                    changes.removed.append(key)
+                self._admit(chunk, vector, changes)
+                if key in changes.removed:
+                    self._readmit_duplicates_of(key, changes)
+        return changes
+
+    def delete(self, keys: Iterable[ChunkKey]) -> ChangeSet:
+        changes = ChangeSet()
+        with self._lock:
+            for key in keys:
+                key = tuple(key)
+                self._duplicates.pop(key, None)
+                if self._remove(key):
+                    changes.removed.append(key)
+                    self._readmit_duplicates_of(key, changes)
+        return changes
+
+
+class SelectionCache:
+    """Selection bundles keyed by golden chunk, for one selection configuration.
+
+    A bundle is a deterministic function of its golden chunk and the index, so it
+    stays valid until a change touches one of its chunks or a newly searchable
+    chunk scores at least the bundle's ``floor`` against the golden: the lowest
+    member similarity (and GOLDEN_SIM_THRESHOLD in cluster mode), or -inf when the
+    bundle is short of distractors. Below the floor a new chunk can neither be
+    picked as a golden nor displace a chosen distractor.
+
+    Every invalidation bumps ``revision``; a bundle computed before it (``put`` with
+    an older revision) is dropped instead of being cached over the change.
+    """
+
+    def __init__(self, index: IncrementalIndex, config):
+        self.index = index
+        self.num_distractors = int(getattr(config, "NUM_DISTRACTORS", 3))
+        self.cluster = str(getattr(config, "MULTI_GOLDEN_MODE", "off")).lower() == "cluster"
+        self.golden_sim = float(getattr(config, "GOLDEN_SIM_THRESHOLD", 0.92))
+        self._bundles: Dict[ChunkKey, Tuple[SelectionBundle, float]] = {}
+        self._lock = threading.Lock()
+        self.revision = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, golden: ChunkData) -> Optional[SelectionBundle]:
+        with self._lock:
+            entry = self._bundles.get(chunk_key(golden))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def _floor(self, golden: ChunkData, bundle: SelectionBundle) -> float:
+        g = self.index.vector(chunk_key(golden))
+        members = [self.index.vector(chunk_key(c)) for c in bundle.golden_chunks[1:] + bundle.distractor_chunks]
+        if g is None or len(bundle.distractor_chunks) < self.num_distractors or any(v is None for v in members):
+            return -np.inf
+        floor = min(float(g @ v) for v in members) if members else np.inf
+        return min(floor, self.golden_sim) if self.cluster else floor
+
+    def put(self, golden: ChunkData, bundle: SelectionBundle, revision: Optional[int] = None):
+        """Cache ``bundle``; ``revision`` is the cache revision read before it was computed."""
+        floor = self._floor(golden, bundle)
+        with self._lock:
+            if revision is not None and revision != self.revision:
+                self.stale += 1
+                return
+            self._bundles[chunk_key(golden)] = (bundle, floor)
+
+    def __len__(self) -> int:
+        return len(self._bundles)
+
+    def invalidate(self, changes: ChangeSet) -> List[SelectionBundle]:
+        """Drop and return the bundles ``changes`` can affect."""
+        touched = changes.touched
+        added = [v for v in (self.index.vector(k) for k in changes.added) if v is not None]
+        with self._lock:
+            self.revision += 1
+            dropped = {
+                golden for golden, (bundle, _) in self._bundles.items()
+                if any(chunk_key(c) in touched for c in bundle.golden_chunks + bundle.distractor_chunks)
+            }
+            if added:
+                goldens = [g for g in self._bundles if g not in dropped]
+                vectors = [self.index.vector(g) for g in goldens]
+                for golden, vector in zip(goldens, vectors):
+                    if vector is None:
+                        dropped.add(golden)
+                kept = [(g, v) for g, v in zip(goldens, vectors) if v is not None]
+                if kept:
+                    sims = np.stack([v for _, v in kept]) @ np.stack(added).T
+                    floors = np.asarray([self._bundles[g][1] for g, _ in kept], dtype=np.float32)
+                    for row in np.flatnonzero((sims >= floors[:, None]).any(axis=1)):
+                        dropped.add(kept[row][0])
+            return [self._bundles.pop(g)[0] for g in dropped]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"bundles": len(self._bundles), "revision": self.revision, "hits": self.hits,
+                    "misses": self.misses, "stale": self.stale}
+
+# --- End File: evaluation_api/generation/incremental_index.py ---
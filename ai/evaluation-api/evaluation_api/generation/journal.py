@@ -0,0 +1,165 @@
+# --- File: evaluation_api/generation/journal.py ---
+# Append-only run journal that makes streaming runs resumable.
+#
+# Records (one JSON object per line):
+#   {"event": "header",    "config_hash": ..., "evaluation_mode": ...}
+#   {"event": "selection", "bundles": [{"bundle_id", "golden": [[doc_id, chunk_id], ...], "distractors": [...]}]}
+#   {"event": "plan",      "bundle_id": ..., "query_types": [...]}
+#   {"event": "done",      "item_id": "<bundle_id>:<query_type>", "outcome": "accepted|rejected", "output_offset": N}
+#
+# Work items are keyed by stable bundle/type IDs, so a rerun with --resume skips
+# everything already evaluated and truncates the output to the last journaled offset.
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .models import ChunkData, SelectionBundle
+
+logger = logging.getLogger(__name__)
+
+
+def item_id(bundle_id: str, query_type: str) -> str:
+    """Stable work item ID for one (bundle, query_type) generation task."""
+    return f"{bundle_id}:{query_type}"
+
+
+class RunJournal:
+    """Append-only JSONL journal of selection, planned work and completed items."""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.header: Dict[str, Any] = {}
+        self.selection: Optional[List[Dict[str, Any]]] = None
+        self.plans: Dict[str, List[str]] = {}
+        self.done: Dict[str, str] = {}
+        self.output_offset = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._replay()
+            logger.info("Resuming from journal %s: %d items done, output offset %d bytes",
+                        path, len(self.done), self.output_offset)
+        elif os.path.exists(path):
+            os.remove(path)
+        self._f = open(path, "a", encoding="utf-8")
+
+    def _replay(self):
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    rec = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crash; everything before it is valid
+                    break
+                valid_bytes += len(line)
+                event = rec.get("event")
+                if event == "header":
+                    self.header = rec
+                elif event == "selection":
+                    self.selection = rec.get("bundles", [])
+                elif event == "plan":
+                    self.plans[rec["bundle_id"]] = list(rec.get("query_types", []))
+                elif event == "done":
+                    self.done[rec["item_id"]] = rec.get("outcome", "")
+                    self.output_offset = max(self.output_offset, int(rec.get("output_offset", 0)))
+        if valid_bytes < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    def _append(self, rec: Dict[str, Any]):
+        with self._lock:
+            self._f.write(json.dumps(rec) + "\n")
+            self._f.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self._f.close()
+
+    # --- Header ---
+    def check_header(self, config_hash: str, evaluation_mode: str):
+        """Record run parameters, or warn when resuming with different ones."""
+        if self.header:
+            if self.header.get("config_hash") != config_hash or self.header.get("evaluation_mode") != evaluation_mode:
+                logger.warning("Resuming with a different config/evaluation mode than the journaled run "
+                               "(journal: %s/%s, now: %s/%s).",
+                               self.header.get("config_hash"), self.header.get("evaluation_mode"),
+                               config_hash, evaluation_mode)
+            return
+        self.header = {"event": "header", "config_hash": config_hash, "evaluation_mode": evaluation_mode}
+        self._append(self.header)
+
+    # --- Selection ---
+    def record_selection(self, bundles: List[SelectionBundle]):
+        self.selection = [
+            {
+                "bundle_id": b.bundle_id(),
+                "golden": [[c.doc_id, c.chunk_id] for c in b.golden_chunks],
+                "distractors": [[c.doc_id, c.chunk_id] for c in b.distractor_chunks],
+            }
+            for b in bundles
+        ]
+        self._append({"event": "selection", "bundles": self.selection})
+
+    def restore_selection(self, chunks: List[ChunkData]) -> Optional[List[SelectionBundle]]:
+        """Rebuild journaled bundles from the loaded chunks (None if nothing was journaled)."""
+        if self.selection is None:
+            return None
+        by_key: Dict[Tuple[str, str], ChunkData] = {(c.doc_id, c.chunk_id): c for c in chunks}
+        bundles: List[SelectionBundle] = []
+        missing = 0
+        for rec in self.selection:
+            try:
+                golden = [by_key[(d, c)] for d, c in rec["golden"]]
+                distractors = [by_key[(d, c)] for d, c in rec["distractors"]]
+            except KeyError:
+                missing += 1
+                continue
+            bundles.append(SelectionBundle(golden_chunks=golden, distractor_chunks=distractors))
+        if missing:
+            logger.warning("%d journaled bundles reference chunks that are no longer valid; skipped.", missing)
+        logger.info("Restored %d bundles from journal (selection skipped).", len(bundles))
+        return bundles
+
+    # --- Work items ---
+    def planned_types(self, bundle_id: str) -> Optional[List[str]]:
+        return self.plans.get(bundle_id)
+
+    def record_plan(self, bundle_id: str, query_types: List[str]):
+        self.plans[bundle_id] = list(query_types)
+        self._append({"event": "plan", "bundle_id": bundle_id, "query_types": list(query_types)})
+
+    def is_done(self, item: str) -> bool:
+        return item in self.done
+
+    def done_items(self) -> Set[str]:
+        return set(self.done)
+
+    def record_done(self, item: str, outcome: str, output_offset: int):
+        self.done[item] = outcome
+        self.output_offset = max(self.output_offset, int(output_offset))
+        self._append({"event": "done", "item_id": item, "outcome": outcome, "output_offset": int(output_offset)})
+
+
+def truncate_output(path: str, offset: int):
+    """Cut ``path`` back to ``offset`` bytes, dropping records written after the last journal entry."""
+    if not os.path.exists(path):
+        return
+    size = os.path.getsize(path)
+    if size > offset:
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+        logger.info("Truncated %s from %d to %d bytes (unjournaled tail).", path, size, offset)
+    elif size < offset:
+        logger.warning("Output %s is shorter (%d bytes) than the journaled offset (%d).", path, size, offset)
+
+# --- End File: evaluation_api/generation/journal.py ---
@@ -1,8 +1,10 @@
 # --- File: search-evaluation-api/generation/models.py ---
 # We need standardized dataclasses to pass data between modules.
 
+import hashlib
+import json
 from dataclasses import dataclass, field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 @dataclass
 class ChunkData:
@@ -14,12 +16,24 @@ class ChunkData:
     # Store validation results
     validation_meta: Dict[str, Any] = field(default_factory=dict)
 
+    def content_key(self) -> Tuple[str, str, bytes]:
+        """Cache key for values derived from the text; an upsert that edits the text changes it."""
+        return (self.doc_id, self.chunk_id, hashlib.blake2b(self.chunk_text.encode("utf-8"), digest_size=8).digest())
+
 @dataclass
 class SelectionBundle:
     """A bundle of chunks selected for generating a single query."""
     golden_chunks: List[ChunkData]
     distractor_chunks: List[ChunkData]
 
+    def bundle_id(self) -> str:
+        """Stable ID derived from the (doc_id, chunk_id) of every chunk in the bundle."""
+        key = json.dumps({
+            "golden": [[c.doc_id, c.chunk_id] for c in self.golden_chunks],
+            "distractors": [[c.doc_id, c.chunk_id] for c in self.distractor_chunks],
+        })
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
 @dataclass
 class GeneratedQuery:
     """A query generated from a bundle, before RAG evaluation."""
@@ -27,6 +41,8 @@ class GeneratedQuery:
     golden_chunks: List[ChunkData]
     query_type: str # e.g., "factual", "keyword"
     distractor_chunks: List[ChunkData]
+    # SelectionBundle.bundle_id() of the source bundle (used by the run journal)
+    bundle_id: Optional[str] = None
 
 @dataclass
 class ValidatedGroundTruth:
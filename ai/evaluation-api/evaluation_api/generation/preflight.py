@@ -0,0 +1,176 @@
+# --- File: evaluation_api/generation/preflight.py ---
+# Configuration and input checks for ``cli --dry-run``.
+#
+# Runs before anything heavy is imported: optional dependencies are looked up with
+# importlib.util.find_spec (located, not imported) and only the first few records of
+# each input file are parsed. Returns (errors, warnings); errors would fail the run.
+
+import importlib.util
+import json
+import logging
+import os
+from glob import glob
+from typing import List, Optional, Tuple
+
+from . import data_loader
+
+logger = logging.getLogger(__name__)
+
+_LLM_MODES = ("llm", "hybrid", "retrieval")
+
+
+def _installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _writable(path: str) -> bool:
+    """True when ``path`` (a file to be written) can be created: its nearest existing ancestor is writable."""
+    parent = os.path.dirname(os.path.abspath(path))
+    while not os.path.exists(parent):
+        parent = os.path.dirname(parent)
+    return os.access(parent, os.W_OK)
+
+
+def _input_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(glob(os.path.join(path, "*.jsonl")) + glob(os.path.join(path, "*.json")))
+    return [path]
+
+
+def _sample_records(path: str, limit: int) -> List[dict]:
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.load(f)]
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+                if len(records) >= limit:
+                    break
+    return records
+
+
+def check_inputs(config, errors: List[str], warnings: List[str], sample_records: int = 5):
+    input_type = getattr(config, "INPUT_TYPE", None)
+    if input_type == "azure_blob_chunks":
+        account_url = os.getenv("AZURE_BLOB_ACCOUNT_URL", getattr(config, "BLOB_ACCOUNT_URL", ""))
+        if not account_url or not getattr(config, "BLOB_CONTAINER", None):
+            errors.append("BLOB_ACCOUNT_URL/AZURE_BLOB_ACCOUNT_URL and BLOB_CONTAINER must be set for azure_blob_chunks")
+        if not (_installed("azure.storage") and _installed("azure.identity")):
+            errors.append("INPUT_TYPE=azure_blob_chunks needs azure-storage-blob and azure-identity")
+        return
+    if input_type != "chunks":
+        errors.append(f"INPUT_TYPE={input_type!r} is not supported; use 'chunks' or 'azure_blob_chunks'")
+        return
+
+    paths = getattr(config, "INPUT_PATHS", None) or []
+    if not paths:
+        errors.append("INPUT_PATHS is empty")
+    expected_dim = getattr(config, "EMBED_DIM", None)
+    dims = set()
+    total_files = 0
+    for path in paths:
+        if not os.path.exists(path):
+            errors.append(f"Input path does not exist: {path}")
+            continue
+        files = _input_files(path)
+        if not files:
+            errors.append(f"No .json/.jsonl files in input directory: {path}")
+            continue
+        unsupported = [f for f in files if not f.endswith((".json", ".jsonl"))]
+        if unsupported:
+            warnings.append(f"Unsupported input files will be skipped: {unsupported[:3]}")
+        total_files += len(files)
+        # Parse a few records of the first file of each path with the loader's own converter
+        try:
+            for record in _sample_records(files[0], sample_records):
+                _, dim = data_loader.to_chunkdata(record)
+                dims.add(dim)
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"Malformed chunk record in {files[0]}: {e!r}")
+    if len(dims) > 1:
+        errors.append(f"Inconsistent embedding dimensions in sampled records: {sorted(dims)}")
+    elif dims and expected_dim is not None and dims != {expected_dim}:
+        errors.append(f"Embedding dimension mismatch: data={next(iter(dims))}, EMBED_DIM={expected_dim}")
+    logger.info("Dry run: %d input file(s) under %d path(s); sampled embedding dims %s",
+                total_files, len(paths), sorted(dims) or "-")
+
+
+def check_settings(config, errors: List[str], warnings: List[str]):
+    for name in ("OUTPUT_PATH", "REJECTED_CHUNKS_PATH", "NUM_DISTRACTORS", "QUERY_TYPES"):
+        if not getattr(config, name, None):
+            errors.append(f"{name} is not set")
+    if getattr(config, "MIN_TOKEN_LENGTH", 0) > getattr(config, "MAX_TOKEN_LENGTH", float("inf")):
+        errors.append("MIN_TOKEN_LENGTH is greater than MAX_TOKEN_LENGTH")
+    if not 0.0 < float(getattr(config, "DUPLICATE_COSINE_SIM", 0.98)) <= 1.0:
+        errors.append("DUPLICATE_COSINE_SIM must be in (0, 1]")
+    if getattr(config, "MIN_QUERY_TYPES_PER_BUNDLE", 1) > getattr(config, "MAX_QUERY_TYPES_PER_BUNDLE", 1 << 30):
+        errors.append("MIN_QUERY_TYPES_PER_BUNDLE is greater than MAX_QUERY_TYPES_PER_BUNDLE")
+    mode = str(getattr(config, "MULTI_GOLDEN_MODE", "off")).lower()
+    if mode not in ("off", "cluster"):
+        errors.append(f"MULTI_GOLDEN_MODE={mode!r}; expected 'off' or 'cluster'")
+
+    fmt = str(getattr(config, "OUTPUT_FORMAT", "jsonl")).lower()
+    compression = str(getattr(config, "OUTPUT_COMPRESSION", "none")).lower()
+    if fmt not in ("jsonl", "parquet"):
+        errors.append(f"OUTPUT_FORMAT={fmt!r}; expected jsonl or parquet")
+    elif fmt == "parquet" and not _installed("pyarrow"):
+        errors.append("OUTPUT_FORMAT=parquet needs pyarrow")
+    if compression not in ("none", "gzip", "zstd"):
+        errors.append(f"OUTPUT_COMPRESSION={compression!r}; expected none, gzip or zstd")
+    elif compression == "zstd" and not _installed("zstandard"):
+        errors.append("OUTPUT_COMPRESSION=zstd needs zstandard")
+    for name in ("OUTPUT_PATH", "REJECTED_CHUNKS_PATH"):
+        path = getattr(config, name, None)
+        if path and not _writable(path):
+            errors.append(f"{name} is not writable: {path}")
+
+
+def check_dependencies(config, evaluation_mode: str, batch: Optional[str], errors: List[str], warnings: List[str]):
+    for module in ("numpy", "tqdm"):
+        if not _installed(module):
+            errors.append(f"Required package {module} is not installed")
+    if str(getattr(config, "SEARCH_BACKEND", "faiss")).lower() == "faiss" and not _installed("faiss"):
+        warnings.append("SEARCH_BACKEND=faiss but faiss is not installed; dedup falls back to O(n^2) "
+                        "and aborts above DEDUP_LARGE_GUARD_N chunks")
+    if not _installed("tenacity"):
+        warnings.append("tenacity is not installed; LLM calls will not be retried")
+
+    # Query generation needs the LLM unless the batch service produces the completions
+    needs_llm = batch is None or (batch == "prepare" and getattr(config, "BATCH_BACKEND", "none") == "azure")
+    if evaluation_mode in _LLM_MODES and batch != "prepare":
+        needs_llm = True
+        if not _installed("deepeval"):
+            warnings.append(f"--evaluation-mode {evaluation_mode} scores with deepeval, which is not installed")
+    if evaluation_mode in ("nonllm", "hybrid", "retrieval") and not (_installed("scipy") or _installed("rank_bm25")):
+        warnings.append("Neither scipy nor rank_bm25 is installed; the BM25 gate cannot score queries")
+    if evaluation_mode == "retrieval" and getattr(config, "RETRIEVAL_GATE_EMBEDDER", "") == "sentence-transformers" \
+            and not _installed("sentence_transformers"):
+        errors.append("--evaluation-mode retrieval needs sentence-transformers (or set RETRIEVAL_GATE_EMBEDDER)")
+    if needs_llm:
+        if not _installed("openai"):
+            errors.append("The openai package is not installed")
+        if not getattr(config, "AZURE_OPENAI_ENDPOINT", ""):
+            errors.append("AZURE_OPENAI_ENDPOINT is not set")
+        if not getattr(config, "AZURE_OPENAI_DEPLOYMENT_NAME", ""):
+            errors.append("AZURE_OPENAI_DEPLOYMENT_NAME is not set")
+        if not (os.environ.get("AZURE_OPENAI_KEY") or os.environ.get("AZURE_OPENAI_API_KEY")
+                or os.environ.get("OPENAI_API_KEY")):
+            errors.append("Azure OpenAI key not set (AZURE_OPENAI_KEY, AZURE_OPENAI_API_KEY or OPENAI_API_KEY)")
+
+
+def preflight(config, evaluation_mode: str = "llm", batch: Optional[str] = None,
+              sample_records: int = 5) -> Tuple[List[str], List[str]]:
+    """Validates config, inputs and dependencies without loading the corpus; returns (errors, warnings)."""
+    errors: List[str] = []
+    warnings: List[str] = []
+    check_settings(config, errors, warnings)
+    check_inputs(config, errors, warnings, sample_records=sample_records)
+    check_dependencies(config, evaluation_mode, batch, errors, warnings)
+    return errors, warnings
+
+# --- End File: evaluation_api/generation/preflight.py ---
@@ -0,0 +1,235 @@
+# --- File: evaluation_api/generation/prompt_budget.py ---
+# Token-budgeted context assembly for generation prompts.
+#
+# Chunk token counts come from a BPE tokenizer (tiktoken, if installed) and are
+# cached per chunk text (ChunkData.content_key), up to ``max_cached_chunks`` chunks. When a bundle exceeds the per-query-type input budget,
+# distractors are trimmed first (down to PROMPT_MIN_DISTRACTOR_TOKENS), then
+# goldens are reduced to their most salient sentences, kept in original order.
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import ChunkData, SelectionBundle
+from ..utils.llm_stats import percentile
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w{3,}")
+
+
+class TokenCounter:
+    """Counts BPE tokens with tiktoken, falling back to a ~4 chars/token estimate."""
+
+    def __init__(self, encoding_name: str = "o200k_base", max_cached_chunks: int = 50000):
+        self.encoding_name = encoding_name
+        self.max_cached_chunks = max(1, int(max_cached_chunks))
+        self._enc = None
+        try:
+            import tiktoken  # type: ignore
+            self._enc = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logger.info("tiktoken unavailable (%s); estimating prompt tokens from character counts.", e)
+        self._chunk_counts: Dict[Tuple[str, str, bytes], int] = {}
+        self._sentences: Dict[Tuple[str, str, bytes], List[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self._enc is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._enc is not None:
+            return len(self._enc.encode_ordinary(text))
+        return max(1, math.ceil(len(text) / 4))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the leading ``max_tokens`` tokens of ``text``."""
+        if max_tokens <= 0:
+            return ""
+        if self._enc is not None:
+            ids = self._enc.encode_ordinary(text)
+            return text if len(ids) <= max_tokens else self._enc.decode(ids[:max_tokens])
+        return text[: max_tokens * 4]
+
+    def _store(self, cache: Dict, key, value):
+        with self._lock:
+            # A long-lived process sees an open-ended stream of chunks: start over when full
+            if len(cache) >= self.max_cached_chunks:
+                cache.clear()
+            cache[key] = value
+
+    def count_chunk(self, chunk: ChunkData) -> int:
+        """Token count of ``chunk.chunk_text``, computed once per chunk."""
+        key = chunk.content_key()
+        n = self._chunk_counts.get(key)
+        if n is None:
+            n = self.count(chunk.chunk_text)
+            self._store(self._chunk_counts, key, n)
+        return n
+
+    def chunk_sentences(self, chunk: ChunkData) -> List[Tuple[str, int]]:
+        """(sentence, token_count) pairs for ``chunk``, computed once per chunk."""
+        key = chunk.content_key()
+        sents = self._sentences.get(key)
+        if sents is None:
+            parts = [s.strip() for s in _SENTENCE_SPLIT.split(chunk.chunk_text) if s and s.strip()]
+            sents = [(s, self.count(s)) for s in parts]
+            self._store(self._sentences, key, sents)
+        return sents
+
+
+def _water_fill(sizes: List[int], budget: int) -> List[int]:
+    """Split ``budget`` across items: small items keep their size, large ones share the rest equally."""
+    alloc = [0] * len(sizes)
+    remaining = max(0, budget)
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for pos, i in enumerate(order):
+        share = remaining // (len(sizes) - pos)
+        alloc[i] = min(sizes[i], share)
+        remaining -= alloc[i]
+    return alloc
+
+
+class PromptBudgeter:
+    """Fits golden and distractor contexts into a per-query-type token budget."""
+
+    def __init__(self, config, counter: Optional[TokenCounter] = None):
+        self.enabled = bool(getattr(config, "PROMPT_BUDGET_ENABLED", True))
+        self.default_budget = int(getattr(config, "PROMPT_INPUT_TOKEN_BUDGET", 1500))
+        self.type_budgets = dict(getattr(config, "PROMPT_TYPE_INPUT_BUDGETS", {}) or {})
+        self.min_distractor_tokens = int(getattr(config, "PROMPT_MIN_DISTRACTOR_TOKENS", 96))
+        self.min_chunk_tokens = int(getattr(config, "PROMPT_MIN_CHUNK_TOKENS", 32))
+        self.counter = counter or TokenCounter(getattr(config, "PROMPT_TOKENIZER_ENCODING", "o200k_base"))
+        self._lock = threading.Lock()
+        self._prompt_tokens: List[int] = []
+        self._context_tokens_before = 0
+        self._context_tokens_after = 0
+        self._trimmed = 0
+
+    def budget_for(self, query_type: Optional[str]) -> int:
+        """Input budget for ``query_type``; None means the shared PROMPT_INPUT_TOKEN_BUDGET."""
+        if query_type is None:
+            return self.default_budget
+        return int(self.type_budgets.get(query_type, self.default_budget))
+
+    # --- Assembly ---
+    def fit(self, bundle: SelectionBundle, query_type: Optional[str], overhead_tokens: int) -> Tuple[List[str], List[str]]:
+        """Return (golden_texts, distractor_texts) whose total fits the budget minus ``overhead_tokens``."""
+        golden = bundle.golden_chunks
+        distractors = bundle.distractor_chunks
+        g_sizes = [self.counter.count_chunk(c) for c in golden]
+        d_sizes = [self.counter.count_chunk(c) for c in distractors]
+        total = sum(g_sizes) + sum(d_sizes)
+        available = max(0, self.budget_for(query_type) - overhead_tokens)
+
+        if not self.enabled or total <= available:
+            self._record_context(total, total)
+            return [c.chunk_text for c in golden], [c.chunk_text for c in distractors]
+
+        # 1. Distractors give way first, but keep a floor so the prompt can still contrast them
+        d_floor = min(sum(d_sizes), self.min_distractor_tokens)
+        d_budget = max(d_floor, available - sum(g_sizes))
+        d_texts = self._trim_distractors(distractors, d_sizes, d_budget)
+        d_used = sum(self.counter.count(t) for t in d_texts)
+
+        # 2. Goldens get the rest, reduced to their most salient sentences
+        g_budget = max(self.min_chunk_tokens * len(golden), available - d_used)
+        g_alloc = _water_fill(g_sizes, g_budget)
+        distractor_vocab = set()
+        for t in d_texts:
+            distractor_vocab.update(w.lower() for w in _WORD.findall(t))
+        g_texts = [
+            c.chunk_text if alloc >= size else self._salient_excerpt(c, alloc, distractor_vocab)
+            for c, size, alloc in zip(golden, g_sizes, g_alloc)
+        ]
+
+        after = sum(self.counter.count(t) for t in g_texts) + d_used
+        with self._lock:
+            self._trimmed += 1
+        self._record_context(total, after)
+        return g_texts, d_texts
+
+    def _trim_distractors(self, chunks: List[ChunkData], sizes: List[int], budget: int) -> List[str]:
+        # Drop trailing distractors until each kept one can get a useful share
+        keep = len(chunks)
+        while keep > 1 and budget // keep < self.min_chunk_tokens:
+            keep -= 1
+        alloc = _water_fill(sizes[:keep], budget)
+        out = []
+        for c, size, a in zip(chunks[:keep], sizes[:keep], alloc):
+            if a <= 0:
+                continue
+            out.append(c.chunk_text if a >= size else self.counter.truncate(c.chunk_text, a))
+        return out
+
+    def _salient_excerpt(self, chunk: ChunkData, max_tokens: int, distractor_vocab: set) -> str:
+        """Highest-scoring sentences of ``chunk`` within ``max_tokens``, in original order.
+
+        Sentences score by their rare terms (IDF over the chunk's sentences), discounting
+        terms the distractors share, so the excerpt keeps what makes the golden distinguishable.
+        """
+        sents = self.counter.chunk_sentences(chunk)
+        if not sents:
+            return self.counter.truncate(chunk.chunk_text, max_tokens)
+        sent_terms = [{w.lower() for w in _WORD.findall(sent)} for sent, _ in sents]
+        sf = Counter(w for terms in sent_terms for w in terms)
+        n_sents = len(sents)
+        weights = {
+            w: math.log((n_sents + 1) / (n + 0.5)) * (0.2 if w in distractor_vocab else 1.0)
+            for w, n in sf.items()
+        }
+
+        scored = []
+        for idx, ((_, n_tok), terms) in enumerate(zip(sents, sent_terms)):
+            score = sum(weights.get(w, 0.0) for w in terms) / math.sqrt(max(1, n_tok))
+            scored.append((score, idx))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+
+        chosen, used = [], 0
+        for _, idx in scored:
+            n_tok = sents[idx][1]
+            if used + n_tok <= max_tokens:
+                chosen.append(idx)
+                used += n_tok
+        if not chosen:
+            # Even the best sentence is too long: keep its head
+            return self.counter.truncate(sents[scored[0][1]][0], max_tokens)
+        chosen.sort()
+        return " ".join(sents[i][0] for i in chosen)
+
+    # --- Stats ---
+    def _record_context(self, before: int, after: int):
+        with self._lock:
+            self._context_tokens_before += before
+            self._context_tokens_after += after
+
+    def record_prompt(self, prompt: str) -> int:
+        n = self.counter.count(prompt)
+        with self._lock:
+            self._prompt_tokens.append(n)
+        return n
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Prompt token distribution and context savings for the run report."""
+        with self._lock:
+            tokens = list(self._prompt_tokens)
+            before, after, trimmed = self._context_tokens_before, self._context_tokens_after, self._trimmed
+        return {
+            "prompts": len(tokens),
+            "trimmed_prompts": trimmed,
+            "tokenizer": self.counter.encoding_name if self.counter.exact else "approx",
+            "prompt_tokens_mean": round(sum(tokens) / len(tokens), 1) if tokens else 0.0,
+            "prompt_tokens_p50": percentile(tokens, 50) if tokens else 0,
+            "prompt_tokens_p95": percentile(tokens, 95) if tokens else 0,
+            "prompt_tokens_max": max(tokens) if tokens else 0,
+            "context_tokens_saved_pct": round(100.0 * (before - after) / before, 1) if before else 0.0,
+        }
+
+# --- End File: evaluation_api/generation/prompt_budget.py ---
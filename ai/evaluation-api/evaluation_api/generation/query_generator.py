@@ -3,37 +3,85 @@
 
 import logging
 import os
-import random
 import re
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 import threading
 import time
 from tqdm import tqdm
 
 from .models import SelectionBundle, GeneratedQuery
+from .prompt_budget import PromptBudgeter
+from .journal import item_id
+from .bm25_scorer import create_scorer
+from .evaluation_layer import passes_nonllm_gate
 from ..utils.cache_utils import SimpleCache, create_prompt_cache_key, create_config_hash
+from ..utils.llm_stats import LLMCallStats
+from ..utils.rate_limit import TokenBucket, llm_retry
+from ..utils.concurrency import AIMDController
+from ..utils.rng import rng_stream
 
 logger = logging.getLogger(__name__)
 
+# Invariant instructions sent as the system message; together with the bundle
+# context that opens the user message it forms the provider-cacheable prefix.
+GENERATION_SYSTEM_PROMPT = (
+    "You are a search query generation expert. For each task you write ONE search query "
+    "that is answerable ONLY by the Golden Context and NOT answerable by the Distractor Context. "
+    "Follow the task's constraints and guidance. "
+    "Output ONLY the query, no quotes, no explanations."
+)
+
 class QueryGenerator:
-    def __init__(self, config):
+    def __init__(self, config, offline: bool = False):
         """
         Initialize Azure OpenAI client and caching system.
+        With ``offline=True`` no client is created (prompt building / batch ingest only).
         """
         self.config = config
         self.client = None
+        self.stats = LLMCallStats("generation")
+        self.budgeter = PromptBudgeter(config)
+        # Bundle contexts are fitted once and shared by every query type of the bundle
+        self.cache_friendly_prompts = bool(getattr(config, "PROMPT_CACHE_FRIENDLY", True))
+        self._context_lock = threading.Lock()
+        self._bundle_contexts: "OrderedDict[Tuple, str]" = OrderedDict()
+
+        # Model cascade: drafts from a small deployment, escalation to the main one
+        self.draft_model = None
+        if getattr(config, "GENERATION_CASCADE", False):
+            self.draft_model = getattr(config, "AZURE_OPENAI_DRAFT_DEPLOYMENT_NAME", "") or None
+            if self.draft_model is None:
+                logger.warning("GENERATION_CASCADE is on but AZURE_OPENAI_DRAFT_DEPLOYMENT_NAME is not set; cascade disabled.")
+        # Per-tier stats count each query once, however many attempts its retries took
+        self.tier_stats: Dict[str, LLMCallStats] = {}
+        self._tier_accepted: Dict[str, int] = {}
+        self._last_usage = threading.local()
+        if self.draft_model:
+            self.tier_stats = {"draft": LLMCallStats("generation_draft"), "large": LLMCallStats("generation_large")}
+            self._tier_accepted = {"draft": 0, "large": 0}
+            self.gate_scorer = create_scorer("nonllm")
+            logger.info("Model cascade enabled: drafts from %s, escalations to %s.",
+                        self.draft_model, getattr(config, "AZURE_OPENAI_DEPLOYMENT_NAME", None))
+        # Adaptive in-flight window; LLM_MAX_WORKERS becomes its ceiling
+        self.concurrency = (
+            AIMDController.from_config(config)
+            if getattr(config, "LLM_ADAPTIVE_CONCURRENCY", False) else None
+        )
         
         # Initialize caching if enabled
         self.cache_enabled = getattr(config, 'CACHE_LLM_QUERIES', True) and getattr(config, 'ENABLE_CACHING', True)
         if self.cache_enabled:
-            cache_dir = getattr(config, 'CACHE_DIR', './cache')
-            self.cache = SimpleCache(cache_dir, namespace="llm_queries")
+            self.cache = SimpleCache.from_config(config, namespace="llm_queries")
             self.config_hash = create_config_hash(config)
-            logger.info("LLM query caching enabled: %s", self.cache.cache_dir)
+            logger.info("LLM query caching enabled: %s", self.cache.db_path)
         else:
             self.cache = None
             logger.info("LLM query caching disabled")
+        if offline:
+            logger.info("QueryGenerator initialized offline (no Azure OpenAI client).")
+            return
         try:
             from openai import AzureOpenAI  # type: ignore
             endpoint = getattr(self.config, "AZURE_OPENAI_ENDPOINT", None)
@@ -49,10 +97,12 @@ class QueryGenerator:
                 logger.error("Azure OpenAI key not set. Please set AZURE_OPENAI_KEY (or AZURE_OPENAI_API_KEY/OPENAI_API_KEY) in .env.")
                 raise RuntimeError("Missing Azure OpenAI API key")
 
+            # Retries (including 429 Retry-After handling) are owned by generate_queries
             self.client = AzureOpenAI(
                 azure_endpoint=endpoint,
                 api_key=api_key,
-                api_version="2024-02-01"
+                api_version="2024-02-01",
+                max_retries=0,
             )
             logger.info("QueryGenerator initialized with Azure OpenAI endpoint.")
         except ImportError:
@@ -61,37 +111,32 @@ class QueryGenerator:
 
     def generate_queries(self, bundles: List[SelectionBundle]) -> List[GeneratedQuery]:
         """Generates multiple query types for each bundle."""
+        tasks = list(self.plan_tasks(bundles))
+        # Completion order depends on scheduling; return results in plan order
+        order = {item_id(b.bundle_id(), qt): i for i, (b, qt) in reversed(list(enumerate(tasks)))}
+        results = sorted(self.iter_queries(bundles, tasks=tasks),
+                         key=lambda q: order.get(item_id(q.bundle_id, q.query_type), len(order)))
+        logger.info("Generated %s queries.", len(results))
+        return results
+
+    def iter_queries(
+        self,
+        bundles: Iterable[SelectionBundle],
+        max_inflight: Optional[int] = None,
+        tasks: Optional[Iterable[Tuple[SelectionBundle, str]]] = None,
+    ) -> Iterator[GeneratedQuery]:
+        """Yield generated queries as they complete.
+
+        At most ``max_inflight`` (default 2x LLM_MAX_WORKERS) tasks are queued at once,
+        so memory stays bounded when the consumer is slower than the LLM.
+        ``tasks`` overrides the (bundle, query_type) plan, e.g. when resuming a run.
+        """
         if self.client is None:
             raise RuntimeError("Azure OpenAI client not initialized")
 
         max_workers = int(getattr(self.config, "LLM_MAX_WORKERS", 16))
-        burst_capacity = int(getattr(self.config, "LLM_BURST_CAPACITY", 50))
-        refill_rate = float(getattr(self.config, "LLM_REFILL_RATE", 10.0))
-
-        # Enhanced token bucket with burst capacity
-        rate_limit_lock = threading.Lock()
-        token_bucket = {"tokens": burst_capacity, "last_refill": time.time()}
-
-        def acquire_token():
-            nonlocal token_bucket
-            while True:
-                with rate_limit_lock:
-                    now = time.time()
-                    # Refill tokens based on time elapsed
-                    elapsed = now - token_bucket["last_refill"]
-                    token_bucket["tokens"] = min(
-                        burst_capacity, 
-                        token_bucket["tokens"] + (elapsed * refill_rate)
-                    )
-                    token_bucket["last_refill"] = now
-                    
-                    if token_bucket["tokens"] >= 1.0:
-                        token_bucket["tokens"] -= 1.0
-                        return
-                
-                # Adaptive sleep based on token deficit
-                sleep_time = max(0.01, (1.0 - token_bucket["tokens"]) / refill_rate)
-                time.sleep(min(sleep_time, 0.1))
+        # Burst-capable token bucket shared by the worker threads
+        bucket = TokenBucket.from_config(self.config)
 
         def process(bundle: SelectionBundle, raw_query_type: str):
             query_type = self._normalize_query_type(raw_query_type)
@@ -106,95 +151,195 @@ class QueryGenerator:
             # If not cached, generate new query
             if query_text is None:
                 prompt, max_tokens_override = self._build_prompt(bundle, query_type)
-                # Rate limit and call LLM with retry
-                from tenacity import retry, stop_after_attempt, wait_exponential_jitter  # type: ignore
-
-                @retry(stop=stop_after_attempt(5), wait=wait_exponential_jitter(initial=0.2, max=6.0))
-                def call():
-                    acquire_token()
-                    return self._call_llm(prompt, max_tokens_override=max_tokens_override)
+                # Rate limit and call LLM with retry (honouring Retry-After on 429s)
+                @llm_retry(self.stats)
+                def call(tier: Optional[str] = None):
+                    bucket.acquire()
+                    if self.concurrency is None:
+                        return self._call_llm(prompt, max_tokens_override=max_tokens_override, tier=tier)
+                    with self.concurrency.slot():
+                        return self._call_llm(prompt, max_tokens_override=max_tokens_override, tier=tier)
 
                 try:
-                    query_text = call()
+                    if self.draft_model:
+                        query_text = self._cascade(bundle, query_type, call)
+                    else:
+                        query_text = call()
                     # Cache the result if enabled
                     if self.cache_enabled and self.cache and query_text:
                         self._cache_query(bundle, query_type, query_text)
-                except (RuntimeError, ValueError, TimeoutError) as e:
-                    # Handle specific Azure OpenAI errors
+                except Exception as e:  # noqa: BLE001
+                    # Non-transient errors fail fast; transient ones end in RetryError once retries run out
                     logger.warning("LLM call failed after retries: %s", e)
                     return None
             
             if query_text:
-                cleaned = self._postprocess_query(query_text, query_type, bundle)
-                return GeneratedQuery(
-                    query=cleaned,
-                    golden_chunks=bundle.golden_chunks,
-                    query_type=query_type,
-                    distractor_chunks=bundle.distractor_chunks,
-                )
+                return self.build_query(bundle, query_type, query_text)
             return None
 
-        tasks = []
+        if tasks is None:
+            tasks = self.plan_tasks(bundles)
+
+        window = max(1, int(max_inflight or max_workers * 2))
+        task_iter = iter(tasks)
+        # Prefix warm-up: a bundle's first request goes out alone and its siblings follow
+        # back to back once it completes, so they reuse the provider's cached prompt prefix
+        warmup = self.cache_friendly_prompts and bool(getattr(self.config, "PROMPT_PREFIX_WARMUP", True))
+        released: Deque[Tuple[SelectionBundle, str]] = deque()
+        held: Dict[str, List[Tuple[SelectionBundle, str]]] = {}
+        leaders: Dict[Future, str] = {}
+        warmed: Set[str] = set()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex, tqdm(desc="Generating queries") as pbar:
+            pending = set()
+
+            def submit_next() -> bool:
+                while True:
+                    if released:
+                        bundle, qt = released.popleft()
+                    else:
+                        nxt = next(task_iter, None)
+                        if nxt is None:
+                            return False
+                        bundle, qt = nxt
+                        if warmup:
+                            # Requests share a cached prefix when bundle and input budget match
+                            bid = f"{bundle.bundle_id()}:{self.budgeter.budget_for(qt)}"
+                            if bid in held:
+                                held[bid].append((bundle, qt))
+                                continue
+                            if bid not in warmed:
+                                held[bid] = []
+                                fut = ex.submit(process, bundle, qt)
+                                leaders[fut] = bid
+                                pending.add(fut)
+                                return True
+                    pending.add(ex.submit(process, bundle, qt))
+                    return True
+
+            for _ in range(window):
+                if not submit_next():
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    bid = leaders.pop(fut, None)
+                    if bid is not None:
+                        warmed.add(bid)
+                        released.extend(held.pop(bid, []))
+                for _ in range(len(done)):
+                    if not submit_next():
+                        break
+                for fut in done:
+                    pbar.update(1)
+                    res = fut.result()
+                    if res is not None:
+                        yield res
+
+    def _cascade(self, bundle: SelectionBundle, query_type: str, call) -> Optional[str]:
+        """Draft on the small deployment; regenerate on the large one only if the draft fails the non-LLM gate."""
+        try:
+            draft = self._tier_call("draft", call)
+        except Exception as e:  # noqa: BLE001
+            logger.debug("Draft generation failed, escalating: %s", e)
+            draft = None
+        if draft and self._passes_gate(bundle, query_type, draft):
+            self._record_tier_accept("draft")
+            return draft
+        final = self._tier_call("large", call)
+        if final and self._passes_gate(bundle, query_type, final):
+            self._record_tier_accept("large")
+        return final
+
+    def _tier_call(self, tier: str, call) -> str:
+        """Run ``call(tier)`` (retries included) and record it once in the tier's stats."""
+        tier_stats = self.tier_stats[tier]
+        self._last_usage.value = None
+        started = time.perf_counter()
+        try:
+            text = call(tier)
+        except Exception:
+            tier_stats.record_call(time.perf_counter() - started, ok=False)
+            raise
+        tier_stats.record_call(time.perf_counter() - started, ok=True, usage=self._last_usage.value)
+        return text
+
+    def _passes_gate(self, bundle: SelectionBundle, query_type: str, query_text: str) -> bool:
+        query = self._postprocess_query(query_text, query_type, bundle)
+        if not query:
+            return False
+        candidate = GeneratedQuery(query=query, golden_chunks=bundle.golden_chunks, query_type=query_type,
+                                   distractor_chunks=bundle.distractor_chunks)
+        return passes_nonllm_gate(candidate, self.config, self.gate_scorer)
+
+    def _record_tier_accept(self, tier: str):
+        with self._context_lock:
+            self._tier_accepted[tier] += 1
+
+    def build_query(self, bundle: SelectionBundle, query_type: str, query_text: str) -> GeneratedQuery:
+        """Postprocess raw LLM output for ``query_type`` into a GeneratedQuery."""
+        cleaned = self._postprocess_query(query_text, query_type, bundle)
+        return GeneratedQuery(
+            query=cleaned,
+            golden_chunks=bundle.golden_chunks,
+            query_type=query_type,
+            distractor_chunks=bundle.distractor_chunks,
+            bundle_id=bundle.bundle_id(),
+        )
+
+    def sample_types_for_bundle(self, bundle: SelectionBundle) -> List[str]:
+        """Pick the query types to generate for ``bundle`` per QUERY_SAMPLING_MODE."""
         # Determine query type sampling mode
         sampling_mode = str(getattr(self.config, "QUERY_SAMPLING_MODE", "all_per_bundle")).lower()
         type_weights = getattr(self.config, "QUERY_TYPE_WEIGHTS", {}) or {}
         all_types = list(getattr(self.config, "QUERY_TYPES", []))
 
-        def sample_types_for_bundle() -> List[str]:
-            if sampling_mode == "all_per_bundle" or not all_types:
-                return all_types
-            min_q = int(getattr(self.config, "MIN_QUERY_TYPES_PER_BUNDLE", 1))
-            max_q = int(getattr(self.config, "MAX_QUERY_TYPES_PER_BUNDLE", max(1, len(all_types))))
-            if max_q < min_q:
-                max_q = min_q
-            k = max(1, min(random.randint(min_q, max_q), len(all_types)))
-            # Weighted sampling without replacement
-            weights = [float(type_weights.get(t, 1.0)) for t in all_types]
-            # Normalize
-            total_w = sum(weights)
-            probs = [w / total_w if total_w > 0 else 1.0 / len(all_types) for w in weights]
-            chosen = []
-            pool = all_types[:]
-            pool_probs = probs[:]
-            for _ in range(k):
-                # pick one based on current probs
-                r = random.random()
-                acc = 0.0
-                idx = 0
-                for i, p in enumerate(pool_probs):
-                    acc += p
-                    if r <= acc:
-                        idx = i
-                        break
-                chosen.append(pool[idx])
-                # remove and renormalize
-                del pool[idx]
-                del pool_probs[idx]
-                s = sum(pool_probs)
-                pool_probs = [p / s for p in pool_probs] if s > 0 else []
-                if not pool:
+        if sampling_mode == "all_per_bundle" or not all_types:
+            return all_types
+        min_q = int(getattr(self.config, "MIN_QUERY_TYPES_PER_BUNDLE", 1))
+        max_q = int(getattr(self.config, "MAX_QUERY_TYPES_PER_BUNDLE", max(1, len(all_types))))
+        if max_q < min_q:
+            max_q = min_q
+        # Per-bundle stream: the plan does not depend on which bundles were processed before
+        rng = rng_stream(getattr(self.config, "SEED", None), bundle.bundle_id(), "query_types")
+        k = max(1, min(rng.randint(min_q, max_q), len(all_types)))
+        # Weighted sampling without replacement
+        weights = [float(type_weights.get(t, 1.0)) for t in all_types]
+        # Normalize
+        total_w = sum(weights)
+        probs = [w / total_w if total_w > 0 else 1.0 / len(all_types) for w in weights]
+        chosen = []
+        pool = all_types[:]
+        pool_probs = probs[:]
+        for _ in range(k):
+            # pick one based on current probs
+            r = rng.random()
+            acc = 0.0
+            idx = 0
+            for i, p in enumerate(pool_probs):
+                acc += p
+                if r <= acc:
+                    idx = i
                     break
-            return chosen
-
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            for bundle in bundles:
-                selected_types = sample_types_for_bundle()
-                for qt in selected_types:
-                    tasks.append(ex.submit(process, bundle, qt))
-            results = []
-            for fut in tqdm(as_completed(tasks), total=len(tasks), desc="Generating queries"):
-                res = fut.result()
-                if res is not None:
-                    results.append(res)
-        logger.info("Generated %s queries.", len(results))
-        return results
+            chosen.append(pool[idx])
+            # remove and renormalize
+            del pool[idx]
+            del pool_probs[idx]
+            s = sum(pool_probs)
+            pool_probs = [p / s for p in pool_probs] if s > 0 else []
+            if not pool:
+                break
+        return chosen
+
+    def plan_tasks(self, bundles: Iterable[SelectionBundle]) -> Iterator[Tuple[SelectionBundle, str]]:
+        """Yield the (bundle, query_type) work items for ``bundles``."""
+        for bundle in bundles:
+            for qt in self.sample_types_for_bundle(bundle):
+                yield bundle, self._normalize_query_type(qt)
 
     def _build_prompt(self, bundle: SelectionBundle, query_type: str) -> Tuple[str, int]:
         """Construct a type-specific, distractor-aware prompt and return (prompt, max_tokens)."""
 
-        golden_context = "\n---\n".join([c.chunk_text for c in bundle.golden_chunks])
-        distractor_context = "\n---\n".join([c.chunk_text for c in bundle.distractor_chunks])
-
         # Per-type constraints and guidance
         constraints: List[str] = [
             "Answerable ONLY by the Golden Context.",
@@ -264,49 +409,96 @@ class QueryGenerator:
 
         constraints_text = "\n- ".join(["Constraints:"] + constraints)
 
-        plural = "Contexts" if len(bundle.golden_chunks) > 1 else "Context"
-        prompt = (
-            f"You are a search query generation expert.\n\n"
+        task = (
             f"Task: Generate ONE {query_type} query.\n"
             f"{constraints_text}\n\n"
             f"Guidance: {guidance}\n\n"
-            f"Golden {plural}:\n{golden_context}\n\n"
-            f"Distractor Context:\n{distractor_context}\n\n"
             f"Output ONLY the query, no quotes, no explanations."
         )
+        # Bundle context first, task last: the prefix is identical for every type of a bundle
+        # that shares an input budget
+        prompt = f"{self._bundle_context(bundle, query_type, task)}\n\n{task}"
+        self.budgeter.record_prompt(GENERATION_SYSTEM_PROMPT + prompt)
         return prompt, max_tokens_for_type
 
-    def _call_llm(self, prompt: str, max_tokens_override: int = None) -> str:
-        """Optimized Azure OpenAI chat.completions call with timeout and error handling."""
+    def _bundle_context(self, bundle: SelectionBundle, query_type: str, task: str) -> str:
+        """Golden/distractor context block for ``bundle``, fitted to the type's input token budget.
+
+        With PROMPT_CACHE_FRIENDLY the block is fitted once per (bundle, budget) independently
+        of the task text and reused, so all types with the same budget send the same prefix.
+        """
+        if self.cache_friendly_prompts:
+            # Keyed on the chunk texts too: an upsert can edit a chunk and keep its IDs
+            context_key = (bundle.bundle_id(), self.budgeter.budget_for(query_type),
+                           tuple(c.content_key() for c in bundle.golden_chunks + bundle.distractor_chunks))
+            with self._context_lock:
+                cached = self._bundle_contexts.get(context_key)
+                if cached is not None:
+                    self._bundle_contexts.move_to_end(context_key)
+                    return cached
+            # Reserve room for the largest type-specific task section
+            overhead = self.budgeter.counter.count(GENERATION_SYSTEM_PROMPT) + 192
+        else:
+            overhead = self.budgeter.counter.count(GENERATION_SYSTEM_PROMPT + task) + 16
+        golden_texts, distractor_texts = self.budgeter.fit(bundle, query_type, overhead)
+
+        plural = "Contexts" if len(bundle.golden_chunks) > 1 else "Context"
+        golden_context = "\n---\n".join(golden_texts)
+        distractor_context = "\n---\n".join(distractor_texts)
+        context = f"Golden {plural}:\n{golden_context}\n\nDistractor Context:\n{distractor_context}"
+        if self.cache_friendly_prompts:
+            with self._context_lock:
+                self._bundle_contexts[context_key] = context
+                while len(self._bundle_contexts) > 1024:
+                    self._bundle_contexts.popitem(last=False)
+        return context
+
+    def _call_llm(self, prompt: str, max_tokens_override: int = None, tier: Optional[str] = None) -> str:
+        """Optimized Azure OpenAI chat.completions call with timeout and error handling.
+
+        ``tier="draft"`` targets the cascade's draft deployment; anything else the main one.
+        """
         if self.client is None:
             raise RuntimeError("Azure OpenAI client not initialized")
-        model = getattr(self.config, "AZURE_OPENAI_DEPLOYMENT_NAME", None)
-        if not model:
-            raise RuntimeError("AZURE_OPENAI_DEPLOYMENT_NAME not set in config")
-        
-        # Optimized parameters for faster generation
-        temperature = getattr(self.config, "TEMPERATURE", 0.5)
-        max_tokens = int(max_tokens_override or getattr(self.config, "MAX_TOKENS", 32))
         timeout_seconds = getattr(self.config, "LLM_TIMEOUT_SECONDS", 15)
+        model = self.draft_model if tier == "draft" else None
 
+        started = time.perf_counter()
         try:
             response = self.client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
+                **self._request_body(prompt, max_tokens_override, model=model),
                 timeout=timeout_seconds,
-                # Additional optimizations
-                top_p=0.9,  # Slightly reduce randomness for faster generation
-                frequency_penalty=0.1,  # Encourage variety
-                presence_penalty=0.1
             )
+            usage = getattr(response, "usage", None)
+            self.stats.record_call(time.perf_counter() - started, ok=True, usage=usage)
+            self._last_usage.value = usage
             return (response.choices[0].message.content or "").strip()
-        except (RuntimeError, ValueError, TimeoutError) as e:
+        except Exception as e:  # noqa: BLE001
+            self.stats.record_call(time.perf_counter() - started, ok=False)
             # Log but don't fail the entire batch
             logger.warning("LLM call failed: %s", str(e)[:100])
             raise
 
+    def _request_body(self, prompt: str, max_tokens_override: int = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """chat.completions request body for a prompt (shared by interactive and batch calls)."""
+        model = model or getattr(self.config, "AZURE_OPENAI_DEPLOYMENT_NAME", None)
+        if not model:
+            raise RuntimeError("AZURE_OPENAI_DEPLOYMENT_NAME not set in config")
+        # Optimized parameters for faster generation
+        return {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": getattr(self.config, "TEMPERATURE", 0.5),
+            "max_tokens": int(max_tokens_override or getattr(self.config, "MAX_TOKENS", 32)),
+            # Additional optimizations
+            "top_p": 0.9,  # Slightly reduce randomness for faster generation
+            "frequency_penalty": 0.1,  # Encourage variety
+            "presence_penalty": 0.1,
+        }
+
     def _normalize_query_type(self, qt: str) -> str:
         """Normalize user-provided/legacy query type aliases to canonical names."""
         mapping = {
@@ -360,9 +552,10 @@ class QueryGenerator:
             if not re.search(r"\d|\b[a-z]{2,}[^a-z\s][a-z]*\b", text, flags=re.I):
                 words = re.findall(r"[A-Za-z]+", text)
                 if words:
-                    w = random.choice(words)
+                    rng = rng_stream(getattr(self.config, "SEED", None), bundle.bundle_id(), "misspellings", text)
+                    w = rng.choice(words)
                     if len(w) > 3:
-                        i = random.randrange(1, len(w)-1)
+                        i = rng.randrange(1, len(w)-1)
                         typo = w[:i] + w[i+1] + w[i] + w[i+2:]
                     else:
                         typo = w[:-1]
@@ -385,12 +578,8 @@ class QueryGenerator:
         # Final cleanup
         return text.strip()
 
-    def _get_cached_query(self, bundle: SelectionBundle, query_type: str) -> str:
-        """Try to get a cached query for this bundle and query type."""
-        if not self.cache:
-            return None
-            
-        # Create cache key from bundle content and config
+    def _query_cache_key(self, bundle: SelectionBundle, query_type: str) -> str:
+        """Cache key from bundle content, query type and config."""
         golden_text = " ".join([c.chunk_text for c in bundle.golden_chunks])
         distractor_texts = [c.chunk_text for c in bundle.distractor_chunks]
         
@@ -403,9 +592,14 @@ class QueryGenerator:
         )
         
         # Add config hash to ensure cache invalidation on config changes
-        full_cache_key = f"{cache_key}_{self.config_hash}"
+        return f"{cache_key}_{self.config_hash}"
+
+    def _get_cached_query(self, bundle: SelectionBundle, query_type: str) -> str:
+        """Try to get a cached query for this bundle and query type."""
+        if not self.cache:
+            return None
         
-        cached_result = self.cache.get(full_cache_key)
+        cached_result = self.cache.get(self._query_cache_key(bundle, query_type))
         if cached_result:
             logger.debug("Cache hit for query type %s", query_type)
             return cached_result
@@ -416,25 +610,50 @@ class QueryGenerator:
         """Cache a generated query for future use."""
         if not self.cache:
             return
-            
-        # Create same cache key as _get_cached_query
-        golden_text = " ".join([c.chunk_text for c in bundle.golden_chunks])
-        distractor_texts = [c.chunk_text for c in bundle.distractor_chunks]
-        
-        temperature = getattr(self.config, "TEMPERATURE", 0.5)
-        max_tokens = getattr(self.config, "MAX_TOKENS", 32)
         
-        cache_key = create_prompt_cache_key(
-            golden_text, distractor_texts, query_type, 
-            temperature, max_tokens
-        )
-        
-        # Add config hash to ensure cache invalidation on config changes
-        full_cache_key = f"{cache_key}_{self.config_hash}"
-        
-        self.cache.set(full_cache_key, query_text)
+        cache_key = self._query_cache_key(bundle, query_type)
+        self.cache.set(cache_key, query_text)
         logger.debug("Cached query for type %s with key %s", query_type, cache_key[:8])
+
+    def invalidate_bundle(self, bundle: SelectionBundle) -> int:
+        """Drop the cached queries of every configured query type for ``bundle``."""
+        if not (self.cache_enabled and self.cache):
+            return 0
+        types = {self._normalize_query_type(qt) for qt in getattr(self.config, "QUERY_TYPES", []) or []}
+        for query_type in types:
+            self.cache.delete(self._query_cache_key(bundle, query_type))
+        return len(types)
     
+    def get_call_stats(self):
+        """Get LLM call counters, latency percentiles and the concurrency window for the run report."""
+        stats = self.stats.snapshot()
+        if self.concurrency is not None:
+            stats["concurrency"] = self.concurrency.snapshot()
+        if self.tier_stats:
+            with self._context_lock:
+                accepted = dict(self._tier_accepted)
+            cascade: Dict[str, Any] = {}
+            for tier, tier_stats in self.tier_stats.items():
+                snap = tier_stats.snapshot()
+                ok_calls = snap["calls"] - snap["failures"]
+                cascade[tier] = {
+                    "calls": snap["calls"],
+                    "failures": snap["failures"],
+                    "accepted": accepted[tier],
+                    "acceptance_rate": round(accepted[tier] / ok_calls, 4) if ok_calls else 0.0,
+                    "prompt_tokens": snap["prompt_tokens"],
+                    "completion_tokens": snap["completion_tokens"],
+                    "latency_p95_ms": snap["latency_p95_ms"],
+                }
+            drafts = cascade["draft"]["calls"]
+            cascade["escalation_rate"] = round(cascade["large"]["calls"] / drafts, 4) if drafts else 0.0
+            stats["cascade"] = cascade
+        return stats
+
+    def get_prompt_stats(self):
+        """Get the prompt token distribution and context trimming savings."""
+        return self.budgeter.snapshot()
+
     def get_cache_stats(self):
         """Get cache statistics for monitoring."""
         if not self.cache:
@@ -0,0 +1,206 @@
+# --- File: evaluation_api/generation/ragas_scoring.py ---
+# Batched RAGAS context-relevance scoring through DeepEval.
+#
+# One RagasMetric instance is configured for the whole run. A window of test cases is
+# scored concurrently with the metric's async API (``a_measure``, on a shallow copy of
+# the metric per test case so their score/reason state stays separate), or with
+# ``deepeval.evaluate`` when the metric has no async path; any batch failure falls
+# back to scoring the window one test case at a time. Per-query scoring also measures
+# on a copy, so concurrent callers (streaming workers, server jobs) do not wait on each other.
+
+import asyncio
+import copy
+import importlib
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (question, answer, contexts)
+ScoreItem = Tuple[str, str, List[str]]
+
+
+@lru_cache(maxsize=1)
+def _deepeval_classes() -> Optional[Tuple[Any, Any]]:
+    """(RagasMetric, LLMTestCase), imported once; None when deepeval is not installed."""
+    try:
+        metrics_mod = importlib.import_module("deepeval.metrics.ragas")
+        tc_mod = importlib.import_module("deepeval.test_case")
+        return getattr(metrics_mod, "RagasMetric"), getattr(tc_mod, "LLMTestCase")
+    except ImportError:
+        return None
+
+
+def _score_of(obj: Any) -> Optional[float]:
+    score = getattr(obj, "score", None)
+    return float(score) if score is not None else None
+
+
+class RagasBatchScorer:
+    """Scores (question, answer, contexts) items with a single shared RagasMetric."""
+
+    def __init__(self, config=None, metric: Any = None, test_case_cls: Any = None):
+        classes = _deepeval_classes() if (metric is None or test_case_cls is None) else None
+        self.available = bool(classes) or (metric is not None and test_case_cls is not None)
+        self._metric = metric
+        self._test_case_cls = test_case_cls or (classes[1] if classes else None)
+        self._metric_cls = classes[0] if classes else None
+        # Judge LLM for the metric ("" = deepeval's default model)
+        self._judge_model = str(getattr(config, "RAGAS_JUDGE_MODEL", "") or "")
+        self.batch_size = max(1, int(getattr(config, "EVAL_SCORE_BATCH_SIZE", 32)))
+        self.concurrency = max(1, int(getattr(config, "EVAL_SCORE_CONCURRENCY", 8)))
+        # Guards the lazy metric construction; scoring itself runs on per-call copies
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.scored = 0
+        self.failed = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.elapsed_s = 0.0
+
+    @property
+    def metric(self):
+        with self._lock:
+            if self._metric is None and self._metric_cls is not None:
+                self._metric = self._metric_cls(model=self._judge_model) if self._judge_model else self._metric_cls()
+            return self._metric
+
+    @property
+    def judge_model(self) -> Optional[str]:
+        """Name of the LLM that produces the scores (part of the evaluation cache key)."""
+        if self._judge_model:
+            return self._judge_model
+        if not self.available:
+            return None
+        name = getattr(self.metric, "evaluation_model", None)
+        return str(name) if name is not None else type(self.metric).__name__
+
+    def _test_case(self, item: ScoreItem):
+        question, answer, contexts = item
+        return self._test_case_cls(
+            input=question,
+            actual_output=answer,
+            expected_output=answer,  # We don't have separate ground-truth answers; align for now
+            retrieval_context=contexts,
+        )
+
+    # --- Scoring ---
+    def score_one(self, item: ScoreItem) -> Optional[float]:
+        """Per-query path (also the batch fallback)."""
+        if not self.available:
+            return None
+        started = time.perf_counter()
+        try:
+            # measure() stores score/reason on the metric, so concurrent callers each use a copy
+            metric = copy.copy(self.metric)
+            result = metric.measure(self._test_case(item))
+            score = _score_of(result)
+            if score is None:
+                score = _score_of(metric)
+        except Exception:  # noqa: BLE001
+            score = None
+        self._record(1, 0 if score is not None else 1, time.perf_counter() - started)
+        return score
+
+    def score_batch(self, items: Sequence[ScoreItem]) -> List[Optional[float]]:
+        """Scores for ``items`` in order, EVAL_SCORE_BATCH_SIZE test cases at a time."""
+        if not self.available:
+            return [None] * len(items)
+        scores: List[Optional[float]] = []
+        for start in range(0, len(items), self.batch_size):
+            window = list(items[start:start + self.batch_size])
+            started = time.perf_counter()
+            try:
+                window_scores = self._score_window(window)
+                self._record(len(window), sum(1 for s in window_scores if s is None),
+                             time.perf_counter() - started, batch=True)
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Batch RAGAS scoring failed (%s); scoring %d queries individually.",
+                               str(e)[:100], len(window))
+                with self._stats_lock:
+                    self.fallbacks += 1
+                window_scores = [self.score_one(item) for item in window]
+            scores.extend(window_scores)
+        return scores
+
+    def _score_window(self, window: List[ScoreItem]) -> List[Optional[float]]:
+        metric = self.metric
+        cases = [self._test_case(item) for item in window]
+        if hasattr(metric, "a_measure"):
+            return _run_async(self._a_measure_all(metric, cases))
+        # Bulk API: one evaluate() call for the window
+        deepeval = importlib.import_module("deepeval")
+        result = deepeval.evaluate(test_cases=cases, metrics=[metric])
+        test_results = list(getattr(result, "test_results", result) or [])
+        if len(test_results) != len(cases):
+            raise RuntimeError(f"evaluate() returned {len(test_results)} results for {len(cases)} test cases")
+        out: List[Optional[float]] = []
+        for tr in test_results:
+            metrics_data = getattr(tr, "metrics_data", None) or []
+            out.append(_score_of(metrics_data[0]) if metrics_data else None)
+        return out
+
+    async def _a_measure_all(self, metric, cases) -> List[Optional[float]]:
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(tc):
+            async with sem:
+                try:
+                    # a_measure stores score/reason on the metric, so each case gets its own copy
+                    case_metric = copy.copy(metric)
+                    res = await case_metric.a_measure(tc)
+                    if isinstance(res, (int, float)):
+                        return float(res)
+                    score = _score_of(res)
+                    return score if score is not None else _score_of(case_metric)
+                except Exception:  # noqa: BLE001
+                    return None
+
+        return list(await asyncio.gather(*(one(tc) for tc in cases)))
+
+    # --- Stats ---
+    def _record(self, n: int, failed: int, elapsed: float, batch: bool = False):
+        with self._stats_lock:
+            self.scored += n
+            self.failed += failed
+            self.elapsed_s += elapsed
+            if batch:
+                self.batches += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "scored": self.scored,
+                "failed": self.failed,
+                "batches": self.batches,
+                "fallbacks": self.fallbacks,
+                "elapsed_s": round(self.elapsed_s, 3),
+                "scores_per_sec": round(self.scored / self.elapsed_s, 3) if self.elapsed_s > 0 else 0.0,
+            }
+
+
+def _run_async(coro):
+    """Run ``coro`` to completion, also from threads that already have a running loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result: Dict[str, Any] = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:  # noqa: BLE001
+            result["error"] = e
+
+    t = threading.Thread(target=runner)
+    t.start()
+    t.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+# --- End File: evaluation_api/generation/ragas_scoring.py ---
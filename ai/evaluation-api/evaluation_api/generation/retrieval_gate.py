@@ -0,0 +1,207 @@
+# --- File: evaluation_api/generation/retrieval_gate.py ---
+# Corpus-level retrieval gate for the "retrieval" evaluation mode.
+#
+# The BM25 gate only contrasts a query with its bundle's distractors. This gate embeds
+# every generated query in batch with a local embedder, runs one top-k search over the
+# whole corpus and rejects queries whose golden document is not within rank
+# RETRIEVAL_GATE_MAX_RANK. Survivors continue through the hybrid checks, so ambiguous
+# queries are dropped before any LLM evaluation is paid for.
+
+import importlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import ChunkData, GeneratedQuery
+from .shared_embeddings import stack
+
+logger = logging.getLogger(__name__)
+
+# (doc_id, chunk_id) hits of one query, best first
+Hits = List[Tuple[str, str]]
+
+
+# --- Embedders ---
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model; must produce vectors in the corpus embedding space."""
+
+    def __init__(self, model_name: str, batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer  # type: ignore
+
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(list(texts), batch_size=self.batch_size, show_progress_bar=False),
+            dtype=np.float32,
+        )
+
+
+class _CallableEmbedder:
+    def __init__(self, fn: Callable[[List[str]], Any]):
+        self.fn = fn
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.fn(list(texts)), dtype=np.float32)
+
+
+def create_embedder(config) -> Optional[Any]:
+    """Embedder named by RETRIEVAL_GATE_EMBEDDER: "sentence-transformers" or "package.module:factory".
+
+    A factory is called with the config and returns either an object with ``embed(texts)``
+    or a plain ``texts -> vectors`` callable.
+    """
+    spec = getattr(config, "RETRIEVAL_GATE_EMBEDDER", "sentence-transformers") or ""
+    batch_size = int(getattr(config, "RETRIEVAL_GATE_EMBED_BATCH_SIZE", 64))
+    try:
+        if spec == "sentence-transformers":
+            return SentenceTransformerEmbedder(getattr(config, "RETRIEVAL_GATE_EMBED_MODEL", ""), batch_size)
+        module_name, _, attr = spec.partition(":")
+        embedder = getattr(importlib.import_module(module_name), attr)(config)
+        return embedder if hasattr(embedder, "embed") else _CallableEmbedder(embedder)
+    except Exception as e:  # noqa: BLE001
+        logger.error("Could not load retrieval gate embedder %r: %s", spec, e)
+        return None
+
+
+# --- Corpus search ---
+class DenseCorpusIndex:
+    """Exact cosine top-k over chunk embeddings, one matrix product per block of queries."""
+
+    def __init__(self, chunks: Sequence[ChunkData], block_size: int = 256):
+        usable = [c for c in chunks if c.embedding is not None and len(c.embedding)]
+        self.ids = [(c.doc_id, c.chunk_id) for c in usable]
+        # A view of the shared matrix when the chunks are bound to one
+        self.matrix = stack(usable, normalize=True)
+        self.block_size = block_size
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1]) if len(self.ids) else 0
+
+    def search(self, vectors: np.ndarray, k: int) -> List[Hits]:
+        k = min(k, len(self.ids))
+        out: List[Hits] = []
+        vectors = _normalize(vectors)
+        for start in range(0, len(vectors), self.block_size):
+            sims = vectors[start:start + self.block_size] @ self.matrix.T
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            # argpartition is unordered; sort the k candidates (ties by corpus position)
+            order = np.lexsort((top, -top_sims), axis=1)
+            for row in np.take_along_axis(top, order, axis=1):
+                out.append([self.ids[i] for i in row])
+        return out
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class CorpusRetrievalGate:
+    """Rejects queries whose golden document ranks below RETRIEVAL_GATE_MAX_RANK in the full corpus.
+
+    Search goes through, in order of preference: the search backend's batched
+    ``find_similar_chunks_batch``, an exact in-process index over chunk embeddings (when
+    the chunks still carry them), or the backend's per-query ``find_similar_chunks``.
+    """
+
+    def __init__(self, config, embedder, backend=None, chunks: Optional[Sequence[ChunkData]] = None):
+        self.embedder = embedder
+        self.backend = backend
+        self.max_rank = max(1, int(getattr(config, "RETRIEVAL_GATE_MAX_RANK", 5)))
+        # Ranks are per document, so fetch extra chunks in case one doc owns several hits
+        self.k = self.max_rank * max(1, int(getattr(config, "RETRIEVAL_GATE_OVERFETCH", 3)))
+        self.max_workers = max(1, int(getattr(config, "EVAL_MAX_WORKERS", 8)))
+        # Corpus embedding size for backend searches (the in-process index knows its own)
+        chunk_dim = len(chunks[0].embedding) if chunks and chunks[0].embedding is not None else 0
+        self.backend_dim = int(getattr(backend, "dim", 0) or chunk_dim or getattr(config, "EMBED_DIM", 0) or 0)
+        self.index: Optional[DenseCorpusIndex] = None
+        if not hasattr(backend, "find_similar_chunks_batch") and chunks:
+            index = DenseCorpusIndex(chunks)
+            if len(index):
+                self.index = index
+
+    @property
+    def available(self) -> bool:
+        return self.embedder is not None and (
+            self.index is not None
+            or hasattr(self.backend, "find_similar_chunks_batch")
+            or hasattr(self.backend, "find_similar_chunks")
+        )
+
+    def _search(self, vectors: np.ndarray) -> List[Hits]:
+        if hasattr(self.backend, "find_similar_chunks_batch"):
+            _check_dim(vectors, self.backend_dim)
+            probes = [_probe(v) for v in vectors]
+            return [[(c.doc_id, c.chunk_id) for c in hits]
+                    for hits in self.backend.find_similar_chunks_batch(probes, self.k)]
+        if self.index is not None:
+            _check_dim(vectors, self.index.dim)
+            return self.index.search(vectors, self.k)
+        _check_dim(vectors, self.backend_dim)
+
+        def one(v):
+            return [(c.doc_id, c.chunk_id) for c in self.backend.find_similar_chunks(_probe(v), self.k)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            return list(ex.map(one, vectors))
+
+    def check(self, queries: Sequence[GeneratedQuery]) -> List[Tuple[bool, Dict[str, Any]]]:
+        """``(accept, metrics)`` per query; ``corpus_rank`` is None when no golden doc was retrieved."""
+        if not queries:
+            return []
+        vectors = self.embedder.embed([q.query for q in queries])
+        results = []
+        for q, hits in zip(queries, self._search(vectors)):
+            golden_docs = {c.doc_id for c in q.golden_chunks}
+            rank = _doc_rank(hits, golden_docs)
+            results.append((rank is not None and rank <= self.max_rank, {
+                "corpus_rank": rank,
+                "corpus_max_rank": self.max_rank,
+            }))
+        return results
+
+
+def _check_dim(vectors: np.ndarray, dim: int):
+    # A mismatched embedder would otherwise fail deep in the backend or silently rank nonsense
+    if dim and vectors.shape[1] != dim:
+        raise ValueError(f"query embeddings have dim {vectors.shape[1]}, corpus has {dim}")
+
+
+def _probe(vector: np.ndarray) -> ChunkData:
+    # The backend API searches by chunk; the probe has no id of its own to exclude
+    return ChunkData(doc_id="", chunk_id="", chunk_text="", embedding=vector.tolist())
+
+
+def _doc_rank(hits: Hits, golden_docs: set) -> Optional[int]:
+    """1-based rank of the first golden document among the distinct documents in ``hits``."""
+    seen = set()
+    for doc_id, _ in hits:
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        if doc_id in golden_docs:
+            return len(seen)
+    return None
+
+
+def create_retrieval_gate(config, evaluation_mode: str, backend=None,
+                          chunks: Optional[Sequence[ChunkData]] = None) -> Optional[CorpusRetrievalGate]:
+    """Gate for the "retrieval" mode; None for other modes or when it cannot be built."""
+    if (evaluation_mode or "").lower() != "retrieval":
+        return None
+    gate = CorpusRetrievalGate(config, create_embedder(config), backend=backend, chunks=chunks)
+    if not gate.available:
+        logger.warning("Corpus retrieval gate unavailable (no embedder or searchable corpus); skipping it.")
+        return None
+    return gate
+
+# --- End File: evaluation_api/generation/retrieval_gate.py ---
@@ -0,0 +1,277 @@
+# --- File: evaluation_api/generation/shared_embeddings.py ---
+# One copy of the corpus embedding matrix for every process that needs it.
+#
+# ``SharedEmbeddingMatrix.from_chunks`` copies the chunks' embedding lists into one
+# L2-normalized float32 (rows, dim) matrix, backed by multiprocessing.shared_memory
+# (EMBEDDING_STORE=shm) or a memory-mapped file under EMBEDDING_STORE_DIR
+# (EMBEDDING_STORE=memmap, also usable across hosts on a shared filesystem), and rebinds
+# every ``chunk.embedding`` to its read-only row view. The per-chunk lists are freed.
+#
+# Other processes attach through an ``EmbeddingHandle`` (a few picklable fields) without
+# copying the vectors:
+#   ProcessPoolExecutor(initializer=shared_embeddings.attach_all, initargs=([handle],))
+#   handle, stripped, rows = shared_embeddings.portable(chunks)   # pickles ids/text + row numbers
+#   chunks = shared_embeddings.restore(handle, stripped, rows)    # in the worker, zero-copy
+# ``stack(chunks)`` returns the chunks' vectors as one matrix: a view when they are
+# consecutive rows of a shared matrix, a copy otherwise.
+
+import atexit
+import dataclasses
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import uuid
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import ChunkData
+
+logger = logging.getLogger(__name__)
+
+BACKINGS = ("shm", "memmap")
+
+_DTYPE = np.float32
+
+# Matrices created or attached by this process, by handle name
+_LIVE: Dict[str, "SharedEmbeddingMatrix"] = {}
+_LIVE_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class EmbeddingHandle:
+    """Everything another process needs to attach to a shared matrix."""
+    backing: str  # "shm" or "memmap"
+    name: str  # shared memory block name, or the memmap file path
+    rows: int
+    dim: int
+    normalized: bool = True
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(_DTYPE)
+
+
+class _SharedArray(np.ndarray):
+    """Array over a SharedMemory block that keeps the block mapped while any view exists.
+
+    numpy only keeps a reference to ``shm.buf``, and SharedMemory unmaps on close/GC, so
+    the block is pinned here (as np.memmap pins its mmap). Views handed out are plain
+    ndarrays whose base is this array.
+    """
+    _shm: Optional[shared_memory.SharedMemory] = None
+
+
+def _shared_array(shm: shared_memory.SharedMemory, shape: Tuple[int, int]) -> np.ndarray:
+    array = _SharedArray(shape, dtype=_DTYPE, buffer=shm.buf)
+    array._shm = shm
+    return array
+
+
+def _open_shm(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None:
+        # A process outside the creator's tree has its own resource tracker, which would
+        # unlink the block when this process exits (pool workers share the creator's)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")  # noqa: SLF001
+    return shm
+
+
+class SharedEmbeddingMatrix:
+    """Float32 (rows, dim) matrix in shared memory or a memory-mapped file.
+
+    The creating process owns the storage and unlinks it on ``unlink()`` or at exit;
+    existing mappings (row views, attached processes) stay valid after the unlink.
+    """
+
+    def __init__(self, handle: EmbeddingHandle, array: np.ndarray,
+                 shm: Optional[shared_memory.SharedMemory] = None, owner: bool = False):
+        self.handle = handle
+        self.array = array
+        self.owner = owner
+        self._shm = shm
+        self._address = array.__array_interface__["data"][0]
+        self._readonly = array.view(np.ndarray)
+        self._readonly.flags.writeable = False
+        with _LIVE_LOCK:
+            _LIVE[handle.name] = self
+
+    @classmethod
+    def create(cls, rows: int, dim: int, backing: str = "shm", directory: str = "./cache/embeddings",
+               normalized: bool = True) -> "SharedEmbeddingMatrix":
+        if backing not in BACKINGS:
+            raise ValueError(f"Unknown embedding store {backing!r}; expected one of {BACKINGS}")
+        if rows < 1 or dim < 1:
+            raise ValueError("A shared embedding matrix needs at least one row and one dimension")
+        if backing == "shm":
+            shm = shared_memory.SharedMemory(create=True, size=rows * dim * np.dtype(_DTYPE).itemsize)
+            array = _shared_array(shm, (rows, dim))
+            return cls(EmbeddingHandle("shm", shm.name, rows, dim, normalized), array, shm, owner=True)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.abspath(os.path.join(directory, f"embeddings-{os.getpid()}-{uuid.uuid4().hex[:8]}.f32"))
+        array = np.memmap(path, dtype=_DTYPE, mode="w+", shape=(rows, dim))
+        return cls(EmbeddingHandle("memmap", path, rows, dim, normalized), array, owner=True)
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[ChunkData], config=None, backing: Optional[str] = None,
+                    directory: Optional[str] = None, normalize: bool = True) -> Optional["SharedEmbeddingMatrix"]:
+        """Copies the chunks' vectors into a new matrix and binds each chunk to its row.
+
+        Chunks without an embedding are left as they are; returns None when no chunk has one.
+        """
+        usable = [c for c in chunks if c.embedding is not None and len(c.embedding)]
+        if not usable:
+            return None
+        matrix = cls.create(
+            len(usable), len(usable[0].embedding),
+            backing=backing or str(getattr(config, "EMBEDDING_STORE", "shm")).lower(),
+            directory=directory or getattr(config, "EMBEDDING_STORE_DIR", "./cache/embeddings"),
+            normalized=normalize,
+        )
+        for i, chunk in enumerate(usable):
+            matrix.array[i] = chunk.embedding
+        if normalize:
+            matrix.array /= np.maximum(np.linalg.norm(matrix.array, axis=1, keepdims=True), 1e-12)
+        matrix.bind(usable)
+        logger.info("Embedding matrix (%d x %d, %.1f MiB) placed in %s %s", matrix.handle.rows, matrix.handle.dim,
+                    matrix.array.nbytes / 2**20, matrix.handle.backing, matrix.handle.name)
+        return matrix
+
+    @classmethod
+    def attach(cls, handle: EmbeddingHandle) -> "SharedEmbeddingMatrix":
+        """Maps an existing matrix read-only; cached per process."""
+        with _LIVE_LOCK:
+            existing = _LIVE.get(handle.name)
+        if existing is not None:
+            return existing
+        shape = (handle.rows, handle.dim)
+        if handle.backing == "shm":
+            shm = _open_shm(handle.name)
+            array = _shared_array(shm, shape)
+            array.flags.writeable = False
+            return cls(handle, array, shm)
+        return cls(handle, np.memmap(handle.name, dtype=_DTYPE, mode="r", shape=shape))
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.array.nbytes)
+
+    def bind(self, chunks: Sequence[ChunkData], rows: Optional[Sequence[int]] = None):
+        """Points each ``chunk.embedding`` at its read-only row (``rows`` defaults to 0..n-1)."""
+        for i, chunk in enumerate(chunks):
+            chunk.embedding = self._readonly[i if rows is None else rows[i]]  # type: ignore[assignment]
+
+    def row_of(self, vector) -> Optional[int]:
+        """Row number when ``vector`` is a row view of this matrix, else None."""
+        if not isinstance(vector, np.ndarray) or vector.ndim != 1:
+            return None
+        offset = vector.__array_interface__["data"][0] - self._address
+        stride = self.array.strides[0]
+        if offset < 0 or offset >= self.nbytes or offset % stride:
+            return None
+        return offset // stride
+
+    def unlink(self):
+        """Removes the shared block or file (owner only); mapped views remain usable."""
+        if not self.owner:
+            return
+        self.owner = False
+        try:
+            if self._shm is not None:
+                self._shm.unlink()
+            else:
+                os.remove(self.handle.name)
+        except FileNotFoundError:
+            pass
+        with _LIVE_LOCK:
+            _LIVE.pop(self.handle.name, None)
+        logger.debug("Unlinked shared embedding matrix %s", self.handle.name)
+
+
+def attach(handle: EmbeddingHandle) -> SharedEmbeddingMatrix:
+    return SharedEmbeddingMatrix.attach(handle)
+
+
+def attach_all(handles: Sequence[EmbeddingHandle]):
+    """Process-pool initializer: map the matrices once per worker."""
+    for handle in handles:
+        attach(handle)
+
+
+def matrix_of(chunks: Sequence[ChunkData]) -> Optional[Tuple[SharedEmbeddingMatrix, np.ndarray]]:
+    """``(matrix, rows)`` when every chunk is bound to a row of the same shared matrix."""
+    if not len(chunks) or not isinstance(chunks[0].embedding, np.ndarray):
+        return None
+    with _LIVE_LOCK:
+        live = list(_LIVE.values())
+    matrix = next((m for m in live if m.row_of(chunks[0].embedding) is not None), None)
+    if matrix is None:
+        return None
+    rows = np.empty(len(chunks), dtype=np.int64)
+    for i, chunk in enumerate(chunks):
+        row = matrix.row_of(chunk.embedding)
+        if row is None:
+            return None
+        rows[i] = row
+    return matrix, rows
+
+
+def stack(chunks: Sequence[ChunkData], normalize: bool = False) -> np.ndarray:
+    """The chunks' vectors as one (n, dim) float32 matrix; zero-copy for consecutive shared rows."""
+    shared = matrix_of(chunks)
+    if shared is None:
+        vectors = np.asarray([c.embedding for c in chunks], dtype=_DTYPE)
+        return _unit(vectors) if normalize and len(vectors) else vectors
+    matrix, rows = shared
+    if rows[-1] - rows[0] + 1 == len(rows) and (len(rows) == 1 or bool((np.diff(rows) == 1).all())):
+        vectors = matrix._readonly[rows[0]:rows[-1] + 1]  # noqa: SLF001
+    else:
+        vectors = np.asarray(matrix.array[rows]).view(np.ndarray)
+    return _unit(vectors) if normalize and not matrix.handle.normalized else vectors
+
+
+def portable(chunks: Sequence[ChunkData]) -> Tuple[Optional[EmbeddingHandle], List[ChunkData], Optional[List[int]]]:
+    """Picklable form of ``chunks``: vectors replaced by their row numbers in a shared matrix.
+
+    Chunks that are not all bound to one shared matrix are returned unchanged (handle None).
+    """
+    shared = matrix_of(chunks)
+    if shared is None:
+        return None, list(chunks), None
+    matrix, rows = shared
+    return matrix.handle, [dataclasses.replace(c, embedding=[]) for c in chunks], rows.tolist()
+
+
+def restore(handle: Optional[EmbeddingHandle], chunks: List[ChunkData],
+            rows: Optional[List[int]]) -> List[ChunkData]:
+    """Inverse of ``portable`` in the receiving process: binds the chunks to the attached rows."""
+    if handle is not None:
+        attach(handle).bind(chunks, rows)
+    return chunks
+
+
+def release(chunks: Sequence[ChunkData]) -> bool:
+    """Unlinks the shared matrix the chunks are bound to when this process owns it."""
+    shared = matrix_of(chunks[:1])
+    if shared is None or not shared[0].owner:
+        return False
+    shared[0].unlink()
+    return True
+
+
+@atexit.register
+def _unlink_owned():
+    with _LIVE_LOCK:
+        owned = [m for m in _LIVE.values() if m.owner]
+    for matrix in owned:
+        matrix.unlink()
+
+# --- End File: evaluation_api/generation/shared_embeddings.py ---
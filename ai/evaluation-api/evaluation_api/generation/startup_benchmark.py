@@ -0,0 +1,127 @@
+# --- File: evaluation_api/generation/startup_benchmark.py ---
+# Import-time benchmark for the CLI entry points.
+# Imports each module in a fresh interpreter (python -X importtime), reports the median
+# wall time and the slowest imports, and fails when a module exceeds the startup budget
+# or pulls in a heavy dependency that should only load when a stage runs.
+#
+# Example:
+#   python -m evaluation_api.generation.startup_benchmark --budget-ms 300 --repeat 5
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger("generation.startup_benchmark")
+
+_PACKAGE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# The service (evaluation_api.api) preloads its stages on purpose and is not budgeted
+DEFAULT_MODULES = ["evaluation_api.generation.cli", "evaluation_api.generation.preflight"]
+
+# Must not be imported by merely importing a CLI module (they load when their stage runs)
+HEAVY_MODULES = [
+    "numpy", "scipy", "sklearn", "tqdm", "faiss", "openai", "httpx", "azure", "ragas", "deepeval",
+    "sentence_transformers", "torch", "pandas", "pyarrow", "tenacity", "rank_bm25", "tiktoken",
+]
+
+_MARKER = "--- startup_benchmark import ---"
+
+_PROBE = (
+    "import importlib, json, sys, time\n"
+    f"sys.stderr.write({_MARKER!r} + '\\n'); sys.stderr.flush()\n"
+    "t = time.perf_counter(); importlib.import_module(sys.argv[1]); t = time.perf_counter() - t\n"
+    "heavy = sorted(m for m in json.loads(sys.argv[2]) if m in sys.modules)\n"
+    "print(json.dumps({'import_s': t, 'heavy': heavy}))\n"
+)
+
+
+def _parse_importtime(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """Slowest imports by cumulative time from ``-X importtime`` output (interpreter startup excluded)."""
+    rows = []
+    for line in stderr.partition(_MARKER)[2].splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            rows.append({"module": parts[2].strip(), "self_ms": int(parts[0]) / 1000.0,
+                         "cumulative_ms": int(parts[1]) / 1000.0})
+        except ValueError:
+            continue  # header line
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+def measure(module: str, repeat: int = 5, top: int = 10) -> Dict[str, Any]:
+    """Median import time of ``module`` over ``repeat`` fresh interpreters."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_PACKAGE_ROOT, os.environ.get("PYTHONPATH")])))
+    import_s, process_s = [], []
+    heavy: List[str] = []
+    slowest: List[Dict[str, Any]] = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE, module, json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, env=env, cwd=_PACKAGE_ROOT,
+        )
+        process_s.append(time.perf_counter() - started)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        import_s.append(result["import_s"])
+        heavy = result["heavy"]
+        slowest = _parse_importtime(proc.stderr, top)
+    return {
+        "module": module,
+        "import_ms_median": round(1000 * statistics.median(import_s), 1),
+        "import_ms_max": round(1000 * max(import_s), 1),
+        "process_ms_median": round(1000 * statistics.median(process_s), 1),
+        "heavy_modules_loaded": heavy,
+        "slowest_imports": slowest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI import time against a startup budget")
+    parser.add_argument("--module", action="append", default=None,
+                        help=f"Module to import (repeatable; default: {', '.join(DEFAULT_MODULES)})")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "300")),
+                        help="Maximum median import time per module")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to report")
+    parser.add_argument("--allow-heavy", action="store_true", help="Do not fail when heavy dependencies are imported")
+    parser.add_argument("--report", type=str, default="", help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] [%(name)s] - %(message)s")
+    results = [measure(m, args.repeat, args.top) for m in (args.module or DEFAULT_MODULES)]
+    failures = []
+    for r in results:
+        logger.info("%s: median %.1f ms (max %.1f ms, process %.1f ms), budget %.0f ms",
+                    r["module"], r["import_ms_median"], r["import_ms_max"], r["process_ms_median"], args.budget_ms)
+        for row in r["slowest_imports"]:
+            logger.info("    %8.1f ms  %s", row["cumulative_ms"], row["module"])
+        if r["import_ms_median"] > args.budget_ms:
+            failures.append(f"{r['module']} imports in {r['import_ms_median']} ms (budget {args.budget_ms:.0f} ms)")
+        if r["heavy_modules_loaded"] and not args.allow_heavy:
+            failures.append(f"{r['module']} eagerly imports {', '.join(r['heavy_modules_loaded'])}")
+
+    report = {"budget_ms": args.budget_ms, "results": results, "failures": failures}
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({"budget_ms": args.budget_ms, "failures": failures,
+                      "import_ms": {r["module"]: r["import_ms_median"] for r in results}}, indent=2))
+    for failure in failures:
+        logger.error("Startup budget exceeded: %s", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/generation/startup_benchmark.py ---
@@ -0,0 +1,286 @@
+# --- File: evaluation_api/generation/streaming.py ---
+# Streaming orchestration: generation, evaluation and output writing overlap.
+#
+#   QueryGenerator.iter_queries ──► [bounded queue] ──► N evaluation workers
+#                                                            │
+#                                                            ▼
+#                                   [bounded queue] ──► JSONL writer (appends as accepted)
+#
+# Only a bounded number of queries is held in memory at any time, and every
+# accepted record is on disk as soon as it has been evaluated. Records are appended
+# as plain JSONL; when OUTPUT_FORMAT / OUTPUT_COMPRESSION / OUTPUT_SHARD_MAX_MB ask
+# for another layout, finalize_output re-encodes the file once the run completes.
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import evaluation_layer
+from .bm25_scorer import create_scorer
+from .evaluation_cache import EvaluationCache
+from .retrieval_gate import create_retrieval_gate
+from .journal import RunJournal, item_id
+from .models import ChunkData, GeneratedQuery, SelectionBundle, ValidatedGroundTruth
+from ..utils.dataset_io import create_dataset_writer, encode_record, iter_shard, plain_jsonl_output
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a queue's input
+_DONE = object()
+
+
+class IncrementalJsonlWriter:
+    """Appends records to a JSONL file, flushing every ``flush_every`` records."""
+
+    def __init__(self, path: str, append: bool = False, flush_every: int = 1):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self.count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "ab" if append else "wb")
+        self.offset = self._f.tell()
+
+    def write(self, item: ValidatedGroundTruth) -> int:
+        """Write one record and return the byte offset just past it (possibly still buffered)."""
+        self._f.write(encode_record(item.to_dict()))
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._f.flush()
+        self.offset = self._f.tell()
+        return self.offset
+
+    def flush(self) -> int:
+        """Push buffered records to the OS and return the offset that is now in the file."""
+        self._f.flush()
+        return self.offset
+
+    def close(self):
+        if not self._f.closed:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_output_path(config, output_path: str) -> str:
+    """File run_streaming appends to: ``output_path`` itself, or a JSONL staging file next to it."""
+    return output_path if plain_jsonl_output(config) else output_path + ".stream.jsonl"
+
+
+def finalize_output(config, stream_path: str, output_path: str) -> str:
+    """Write the streamed records at ``output_path`` in the configured layout; returns the dataset path.
+
+    A plain JSONL layout is already final. The staging file is kept, since the run
+    journal's offsets point into it.
+    """
+    if plain_jsonl_output(config):
+        return stream_path
+    with create_dataset_writer(config, output_path) as writer:
+        writer.write_all(iter_shard(stream_path))
+    logger.info("Streamed dataset re-encoded to %s (%d records)", writer.path, writer.records)
+    return writer.path
+
+
+def run_streaming(
+    bundles: Iterable[SelectionBundle],
+    q_generator,
+    config,
+    evaluation_mode: str,
+    output_path: str,
+    append: bool = False,
+    journal: Optional[RunJournal] = None,
+    backend=None,
+    chunks: Optional[List[ChunkData]] = None,
+    llm: Optional[Tuple[Any, Optional[str]]] = None,
+    retrieval_gate=None,
+    on_record: Optional[Callable[[ValidatedGroundTruth], None]] = None,
+) -> Dict[str, Any]:
+    """Run generation → evaluation → writing concurrently and return run counters.
+
+    Queue sizes and evaluation parallelism come from STREAM_QUEUE_SIZE and
+    STREAM_EVAL_WORKERS; each worker gates up to STREAM_EVAL_BATCH_SIZE queued queries
+    at once. With a ``journal``, work items already journaled as done are skipped and
+    every evaluated item is journaled after its record is written.
+    ``backend`` / ``chunks`` are the corpus searched by the "retrieval" mode gate.
+    A long-lived caller can pass its resident ``llm`` (from ``prepare_llm``) and
+    ``retrieval_gate``; ``on_record`` is called after each accepted record is written.
+    """
+    queue_size = max(1, int(getattr(config, "STREAM_QUEUE_SIZE", 256)))
+    num_eval_workers = max(1, int(getattr(config, "STREAM_EVAL_WORKERS", 4)))
+    flush_every = max(1, int(getattr(config, "STREAM_FLUSH_EVERY", 1)))
+    eval_batch_size = max(1, int(getattr(config, "STREAM_EVAL_BATCH_SIZE", 16)))
+
+    generated_q: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    evaluated_q: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    counters = {"generated": 0, "evaluated": 0, "accepted": 0, "skipped": len(journal.done) if journal else 0}
+    counters_lock = threading.Lock()
+
+    gate = retrieval_gate
+    if gate is None:
+        gate = create_retrieval_gate(config, evaluation_mode, backend=backend, chunks=chunks)
+    if (evaluation_mode or "").lower() == "retrieval":
+        # Corpus gate per query, then the hybrid checks
+        evaluation_mode = "hybrid"
+    client, model = llm if llm is not None else evaluation_layer.prepare_llm(config, evaluation_mode)
+    # Shared across evaluator threads so every chunk is tokenized once
+    scorer = create_scorer(evaluation_mode)
+    ragas_scorer = evaluation_layer.create_ragas_scorer(config, evaluation_mode)
+    eval_cache = EvaluationCache.from_config(config) if (evaluation_mode or "").lower() != "none" else None
+
+    def put(q: "queue.Queue[Any]", item) -> bool:
+        # Blocking put that gives up once another stage has failed
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            tasks = _journaled_tasks(bundles, q_generator, journal) if journal is not None else None
+            for gq in q_generator.iter_queries(bundles, max_inflight=queue_size, tasks=tasks):
+                with counters_lock:
+                    counters["generated"] += 1
+                if not put(generated_q, gq):
+                    break
+        except Exception as e:  # noqa: BLE001
+            logger.error("Query generation failed in streaming mode: %s", e)
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(num_eval_workers):
+                put(generated_q, _DONE)
+
+    def next_batch() -> Tuple[List[GeneratedQuery], bool]:
+        # Block for one query, then take whatever else is already queued (up to eval_batch_size)
+        batch: List[GeneratedQuery] = []
+        while not stop.is_set():
+            try:
+                item = generated_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+            break
+        while batch and len(batch) < eval_batch_size:
+            try:
+                item = generated_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, stop.is_set()
+
+    def evaluate():
+        try:
+            finished = False
+            while not finished:
+                batch, finished = next_batch()
+                if not batch:
+                    continue
+                # Corpus and non-LLM gates score the micro-batch together
+                corpus_checks = gate.check(batch) if gate is not None else [None] * len(batch)
+                checks = [None] * len(batch)
+                if (evaluation_mode or "").lower() in ("nonllm", "hybrid"):
+                    checks = evaluation_layer.nonllm_checks(batch, config, scorer, eval_cache)
+                for gq, check, corpus_check in zip(batch, checks, corpus_checks):
+                    result = evaluation_layer.evaluate_query(gq, config, evaluation_mode, client=client, model=model,
+                                                             nonllm_check=check, ragas_scorer=ragas_scorer,
+                                                             eval_cache=eval_cache, corpus_check=corpus_check)
+                    with counters_lock:
+                        counters["evaluated"] += 1
+                    if not put(evaluated_q, (gq, result)):
+                        return
+        except Exception as e:  # noqa: BLE001
+            logger.error("Evaluation worker failed in streaming mode: %s", e)
+            errors.append(e)
+            stop.set()
+        finally:
+            put(evaluated_q, _DONE)
+
+    started = time.perf_counter()
+    producer = threading.Thread(target=produce, name="stream-generate", daemon=True)
+    workers = [
+        threading.Thread(target=evaluate, name=f"stream-evaluate-{i}", daemon=True)
+        for i in range(num_eval_workers)
+    ]
+    producer.start()
+    for w in workers:
+        w.start()
+
+    # Writer runs on the calling thread; the evaluation cache is closed however the run ends
+    failed = True
+    try:
+        finished_workers = 0
+        with IncrementalJsonlWriter(output_path, append=append, flush_every=flush_every) as writer:
+            while finished_workers < num_eval_workers:
+                try:
+                    item = evaluated_q.get(timeout=0.5)
+                except queue.Empty:
+                    if stop.is_set() and not any(w.is_alive() for w in workers):
+                        break
+                    continue
+                if item is _DONE:
+                    finished_workers += 1
+                    continue
+                gq, result = item
+                if result is not None:
+                    writer.write(result)
+                    with counters_lock:
+                        counters["accepted"] += 1
+                    if on_record is not None:
+                        on_record(result)
+                if journal is not None and gq.bundle_id:
+                    # Journal only offsets that are already in the file so a crash never loses a record
+                    journal.record_done(item_id(gq.bundle_id, gq.query_type),
+                                        "accepted" if result is not None else "rejected", writer.flush())
+        failed = False
+    finally:
+        if failed:
+            stop.set()
+        producer.join()
+        for w in workers:
+            w.join()
+        if eval_cache is not None:
+            eval_cache.close()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - started
+    counters["elapsed_s"] = round(elapsed, 3)
+    counters["accepted_per_sec"] = round(counters["accepted"] / elapsed, 3) if elapsed > 0 else 0.0
+    logger.info("Streaming run complete: %s generated, %s evaluated, %s accepted -> %s",
+                counters["generated"], counters["evaluated"], counters["accepted"], output_path)
+    evaluation_layer.log_eval_stats(client)
+    evaluation_layer.log_scoring_stats(ragas_scorer)
+    return counters
+
+def _journaled_tasks(
+    bundles: Iterable[SelectionBundle], q_generator, journal: RunJournal
+) -> Iterator[Tuple[SelectionBundle, str]]:
+    """Plan (bundle, query_type) tasks, reusing journaled plans and skipping finished items."""
+    for bundle in bundles:
+        bid = bundle.bundle_id()
+        types = journal.planned_types(bid)
+        if types is None:
+            types = [qt for _, qt in q_generator.plan_tasks([bundle])]
+            journal.record_plan(bid, types)
+        for qt in types:
+            if not journal.is_done(item_id(bid, qt)):
+                yield bundle, qt
+
+# --- End File: evaluation_api/generation/streaming.py ---
@@ -0,0 +1,309 @@
+# --- File: evaluation_api/generation/streaming_selection.py ---
+# Low-memory context selection (cli --low-memory).
+#
+# ContextSelector.select_contexts needs every validated ChunkData in RAM to sample a few
+# dozen goldens. This path reads the input once instead:
+#   1. data_loader.iter_chunk_records streams the records; the token-length heuristics
+#      run per record, goldens are reservoir-sampled on the fly (one chunk per document,
+#      or SELECTION target chunks overall) and L2-normalized embeddings are appended to a
+#      float32 matrix file under SELECTION_STREAM_DIR. Only a document code and the
+#      record's (file, byte offset) are kept per chunk.
+#   2. DiskMatrixIndex searches that memory-mapped matrix exactly, in blocks of
+#      SELECTION_STREAM_BLOCK_ROWS rows, for all goldens in one pass.
+#   3. Chunk text is re-read (data_loader.read_chunk_at) only for the sampled goldens and
+#      the neighbours returned to the selector.
+#
+# Differences from the in-memory path: the sample depends on input order rather than on
+# sorted ids (it is still seeded by SEED), and near-duplicate removal is limited to the
+# neighbourhoods that are searched: hits at or above DUPLICATE_COSINE_SIM of a golden are
+# skipped, as validation would have dropped one of the pair.
+
+import logging
+import os
+import uuid
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import data_loader
+from .chunk_selector import ContextSelector, target_bundles
+from .models import ChunkData, SelectionBundle
+from .shared_embeddings import EmbeddingHandle, SharedEmbeddingMatrix
+from ..utils.dataset_io import create_dataset_writer
+from ..utils.rng import rng_stream
+
+logger = logging.getLogger(__name__)
+
+# Rows normalized and written per chunk of the input stream
+_WRITE_BATCH = 4096
+
+Hit = Tuple[int, float]
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class DiskMatrixIndex:
+    """Exact cosine search over an on-disk embedding matrix (search-backend protocol).
+
+    Like the other backends, searches for a corpus chunk exclude the chunk's own document.
+    Hit chunks are materialized from the input files on first use and kept.
+    """
+
+    def __init__(self, matrix: SharedEmbeddingMatrix, doc_codes: np.ndarray, doc_names: List[str],
+                 files: List[str], file_index: np.ndarray, offsets: np.ndarray, config):
+        self.matrix = matrix
+        self.doc_codes = doc_codes
+        self.files = files
+        self.file_index = file_index
+        self.offsets = offsets
+        self.block_rows = max(1, int(getattr(config, "SELECTION_STREAM_BLOCK_ROWS", 16384)))
+        self.dup_threshold = float(getattr(config, "DUPLICATE_COSINE_SIM", 0.98))
+        # Extra neighbours fetched so that skipped near-duplicates do not shorten the result
+        self.margin = max(0, int(getattr(config, "DEDUP_MAX_NEIGHBORS", 20)))
+        self.skipped_duplicates = 0
+        self._doc_code_of = {name: code for code, name in enumerate(doc_names)}
+        self._chunks: Dict[int, ChunkData] = {}
+        self._hits: Dict[int, Tuple[int, List[Hit]]] = {}
+
+    def __len__(self) -> int:
+        return self.matrix.handle.rows
+
+    def get_backend_info(self) -> Dict[str, Any]:
+        return {"backend": "DiskMatrix", "chunks": len(self), "materialized": len(self._chunks),
+                "path": self.matrix.handle.name}
+
+    def chunk(self, row: int) -> ChunkData:
+        """The chunk stored at ``row``, read from its input file the first time."""
+        chunk = self._chunks.get(row)
+        if chunk is None:
+            chunk = data_loader.read_chunk_at(self.files[self.file_index[row]], int(self.offsets[row]))
+            chunk.validation_meta['status'] = "Validated"
+            self.matrix.bind([chunk], [row])
+            self._chunks[row] = chunk
+        return chunk
+
+    def chunks(self) -> List[ChunkData]:
+        """Materialized chunks (goldens and returned neighbours)."""
+        return list(self._chunks.values())
+
+    # --- Search ---
+    def _scan(self, probes: np.ndarray, exclude: np.ndarray, k: int) -> List[List[Hit]]:
+        """Top-``k`` rows per probe in one pass over the matrix; ``exclude`` holds doc codes (-1: none)."""
+        n = len(self)
+        k = min(k, n)
+        best_sims = np.empty((len(probes), 0), dtype=np.float32)
+        best_rows = np.empty((len(probes), 0), dtype=np.int64)
+        for start in range(0, n, self.block_rows):
+            block = np.asarray(self.matrix.array[start:start + self.block_rows])
+            sims = probes @ block.T
+            sims[self.doc_codes[start:start + len(block)][None, :] == exclude[:, None]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block), dtype=np.int64), sims.shape)
+            sims = np.concatenate([best_sims, sims], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if sims.shape[1] > k:
+                top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims, rows = np.take_along_axis(sims, top, axis=1), np.take_along_axis(rows, top, axis=1)
+            best_sims, best_rows = sims, rows
+        out = []
+        for sims, rows in zip(best_sims, best_rows):
+            # Best first; ties by corpus position
+            order = np.lexsort((rows, -sims))
+            out.append([(int(rows[i]), float(sims[i])) for i in order if np.isfinite(sims[i])])
+        return out
+
+    def _probe(self, chunk: ChunkData) -> Tuple[Optional[int], np.ndarray, int]:
+        row = self.matrix.row_of(chunk.embedding)
+        vector = np.asarray(self.matrix.array[row]) if row is not None else _unit(np.asarray(chunk.embedding, np.float32))
+        return row, vector, self._doc_code_of.get(chunk.doc_id, -1)
+
+    def prefetch(self, chunks: Sequence[ChunkData], k: int):
+        """Searches for all ``chunks`` in a single pass and caches the neighbours of corpus rows."""
+        probes = [self._probe(c) for c in chunks]
+        probes = [p for p in probes if p[0] is not None and self._hits.get(p[0], (0, None))[0] < k + self.margin]
+        if not probes:
+            return
+        fetch = k + self.margin
+        hits = self._scan(np.stack([v for _, v, _ in probes]), np.array([d for _, _, d in probes]), fetch)
+        for (row, _, _), row_hits in zip(probes, hits):
+            self._hits[row] = (fetch, row_hits)
+
+    def _neighbours(self, chunk: ChunkData, k: int) -> List[Hit]:
+        row, vector, doc = self._probe(chunk)
+        if row is None:
+            # External probe (e.g. a query vector): nothing to exclude, no duplicate filter
+            return self._scan(vector[None, :], np.array([-1]), k)[0]
+        fetched, hits = self._hits.get(row, (0, None))
+        if hits is None or fetched < k + self.margin:
+            self.prefetch([chunk], k)
+            hits = self._hits[row][1]
+        kept = []
+        for hit in hits:
+            if hit[1] >= self.dup_threshold:
+                self.skipped_duplicates += 1
+                continue
+            kept.append(hit)
+            if len(kept) >= k:
+                break
+        return kept
+
+    def find_similar_chunks_with_scores(self, chunk: ChunkData, k: int) -> List[Tuple[ChunkData, float]]:
+        return [(self.chunk(row), sim) for row, sim in self._neighbours(chunk, k)]
+
+    def find_similar_chunks(self, chunk: ChunkData, k: int) -> List[ChunkData]:
+        return [self.chunk(row) for row, _ in self._neighbours(chunk, k)]
+
+    def find_similar_chunks_batch(self, chunks: Sequence[ChunkData], k: int) -> List[List[ChunkData]]:
+        external = [i for i, c in enumerate(chunks) if self.matrix.row_of(c.embedding) is None]
+        results: List[Optional[List[ChunkData]]] = [None] * len(chunks)
+        if external:
+            vectors = _unit(np.asarray([chunks[i].embedding for i in external], dtype=np.float32))
+            for i, hits in zip(external, self._scan(vectors, np.full(len(external), -1), k)):
+                results[i] = [self.chunk(row) for row, _ in hits]
+        return [r if r is not None else self.find_similar_chunks(c, k) for c, r in zip(chunks, results)]
+
+
+def _write_rows(out, pending: List[List[float]]):
+    out.write(_unit(np.asarray(pending, dtype=np.float32)).tobytes())
+    pending.clear()
+
+
+def stream_corpus(config, target: Optional[int], per_document: bool, rng,
+                  rejected=None) -> Tuple[Optional[DiskMatrixIndex], List[int]]:
+    """One pass over the input: returns the disk index and the reservoir-sampled golden rows.
+
+    ``per_document`` keeps one uniformly drawn chunk per document (documents are sampled
+    afterwards); otherwise ``target`` chunks are drawn by Algorithm R, or a
+    SELECTION_SAMPLE_RATE share of all chunks when ``target`` is None. Chunks rejected by
+    length are written to ``rejected`` (a dataset writer) when given.
+    """
+    min_len, max_len = config.MIN_TOKEN_LENGTH, config.MAX_TOKEN_LENGTH
+    expected_dim = getattr(config, "EMBED_DIM", None)
+    directory = getattr(config, "SELECTION_STREAM_DIR", "./cache/selection")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.abspath(os.path.join(directory, f"corpus-{os.getpid()}-{uuid.uuid4().hex[:8]}.f32"))
+
+    doc_names: List[str] = []
+    doc_code_of: Dict[str, int] = {}
+    files: List[str] = []
+    file_code_of: Dict[str, int] = {}
+    doc_codes, file_index, offsets = array("i"), array("i"), array("q")
+    doc_counts, doc_picks = array("q"), array("q")
+    reservoir: List[int] = []
+    pending: List[List[float]] = []
+    rows = num_rejected = 0
+    dim = None
+    try:
+        with open(path, "wb") as out:
+            for chunk, fp, offset in data_loader.iter_chunk_records(config):
+                len_tokens = len(chunk.chunk_text.split())
+                if not (min_len <= len_tokens <= max_len):
+                    num_rejected += 1
+                    if rejected is not None:
+                        rejected.write({"doc_id": chunk.doc_id, "chunk_id": chunk.chunk_id,
+                                        "chunk_text": chunk.chunk_text,
+                                        "reject_reason": f"Token length ({len_tokens}) out of bounds."})
+                    continue
+                if dim is None:
+                    dim = len(chunk.embedding)
+                    if expected_dim is not None and dim != expected_dim:
+                        raise ValueError(f"Embedding dimension mismatch: data={dim}, config={expected_dim}")
+                elif len(chunk.embedding) != dim:
+                    raise ValueError("Inconsistent embedding dimensions across loaded chunks.")
+
+                row = rows
+                rows += 1
+                code = doc_code_of.get(chunk.doc_id)
+                if code is None:
+                    code = doc_code_of[chunk.doc_id] = len(doc_names)
+                    doc_names.append(chunk.doc_id)
+                    doc_counts.append(0)
+                    doc_picks.append(-1)
+                if fp not in file_code_of:
+                    file_code_of[fp] = len(files)
+                    files.append(fp)
+                doc_codes.append(code)
+                file_index.append(file_code_of[fp])
+                offsets.append(offset)
+
+                if per_document:
+                    # Reservoir of one per document: the c-th chunk replaces the pick with probability 1/c
+                    doc_counts[code] += 1
+                    if rng.randrange(doc_counts[code]) == 0:
+                        doc_picks[code] = row
+                elif target is not None:
+                    # Algorithm R over all chunks
+                    if len(reservoir) < target:
+                        reservoir.append(row)
+                    else:
+                        j = rng.randrange(rows)
+                        if j < target:
+                            reservoir[j] = row
+
+                pending.append(chunk.embedding)
+                if len(pending) >= _WRITE_BATCH:
+                    _write_rows(out, pending)
+            if pending:
+                _write_rows(out, pending)
+    except BaseException:
+        # A failed pass (bad dimensions, unreadable input, interrupt) leaves no half-written file
+        os.remove(path)
+        raise
+
+    logger.info("Streamed %d valid chunks from %d documents (%d rejected by length) into %s",
+                rows, len(doc_names), num_rejected, path)
+    if not rows:
+        os.remove(path)
+        return None, []
+    matrix = SharedEmbeddingMatrix(
+        EmbeddingHandle("memmap", path, rows, dim, normalized=True),
+        np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim)),
+        owner=True,
+    )
+    index = DiskMatrixIndex(matrix, np.frombuffer(doc_codes, dtype=np.int32), doc_names, files,
+                            np.frombuffer(file_index, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64), config)
+
+    sample_rate = float(getattr(config, "SELECTION_SAMPLE_RATE", 0.1))
+    if per_document:
+        doc_ids = sorted(doc_names)
+        num_docs = min(target, len(doc_ids)) if target is not None else \
+            max(1, min(int(len(doc_ids) * sample_rate), len(doc_ids)))
+        golden_rows = [doc_picks[doc_code_of[d]] for d in rng.sample(doc_ids, num_docs)]
+    elif target is not None:
+        golden_rows = reservoir
+    else:
+        golden_rows = rng.sample(range(rows), max(1, min(int(rows * sample_rate), rows)))
+    return index, golden_rows
+
+
+def select_contexts_streaming(config) -> Tuple[List[SelectionBundle], Optional[DiskMatrixIndex]]:
+    """Selection bundles from one streaming pass over the input; returns (bundles, index)."""
+    seed = getattr(config, "SEED", None)
+    rng = rng_stream(seed, "selection")
+    sample_mode = getattr(config, "SELECTION_SAMPLE_MODE", "chunks").lower()
+    per_document = sample_mode == "documents" or bool(getattr(config, "SELECTOR_DEDUP_DOCS", True))
+
+    with create_dataset_writer(config, config.REJECTED_CHUNKS_PATH) as rejected:
+        index, golden_rows = stream_corpus(config, target_bundles(config), per_document, rng, rejected)
+    if index is None:
+        logger.error("No valid chunks streamed. Exiting.")
+        return [], None
+
+    goldens = [index.chunk(row) for row in golden_rows]
+    num_distractors = int(config.NUM_DISTRACTORS)
+    cluster = str(getattr(config, "MULTI_GOLDEN_MODE", "off")).lower() == "cluster"
+    # One pass over the matrix for every golden (cluster mode draws from a larger pool)
+    index.prefetch(goldens, max(20, num_distractors * 4) if cluster else num_distractors)
+
+    selector = ContextSelector(goldens, config, backend=index)
+    logger.info("Attempting to select %s contexts (mode=%s, streaming) using %s backend...",
+                len(goldens), sample_mode, index.get_backend_info()["backend"])
+    bundles = selector.build_bundles(goldens)
+    logger.info("Low-memory selection: %d of %d chunks materialized, %d near-duplicate neighbours skipped",
+                len(index.chunks()), len(index), index.skipped_duplicates)
+    return bundles, index
+
+# --- End File: evaluation_api/generation/streaming_selection.py ---
@@ -0,0 +1,330 @@
+# --- File: evaluation_api/metrics/metrics_evaluator.py ---
+# Search metrics for a ground-truth dataset produced by the generation pipeline.
+#
+# Joins ground truth (query, expected_doc_ids, validation.query_type) with a search run
+# (query -> ranked doc ids) and computes NDCG@k, MRR@k, MAP@k, Recall@k and
+# Precision@k for every k at once: relevance is laid out as a padded
+# (queries x max_k) matrix and every metric is a cumulative sum over its columns.
+#
+# Example:
+#   python -m evaluation_api.metrics.metrics_evaluator --ground-truth output/synthetic_ground_truth.jsonl \
+#       --run output/search_run.jsonl --k 1 5 10 100 --output output/metrics.json
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.dataset_io import gc_paused, read_records
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAMES = ("ndcg", "mrr", "map", "recall", "precision")
+
+
+@dataclass
+class GroundTruth:
+    """Columnar ground truth: one row per query, relevant docs as (row, doc_code) pairs."""
+    queries: List[str]
+    query_types: List[str]
+    rel_rows: np.ndarray      # int64, row of each relevant (query, doc) pair
+    rel_docs: np.ndarray      # int64, doc code of each pair (codes index ``doc_vocab``)
+    doc_vocab: Dict[str, int]
+
+    @property
+    def num_relevant(self) -> np.ndarray:
+        return np.bincount(self.rel_rows, minlength=len(self.queries))
+
+
+@dataclass
+class SearchRun:
+    """Flattened ranked results: ``docs[i]`` was returned at ``ranks[i]`` (0-based) for ``rows[i]``."""
+    rows: np.ndarray
+    ranks: np.ndarray
+    docs: np.ndarray          # doc codes of the ground-truth vocabulary, -1 = not a relevant doc anywhere
+
+
+# --- Loading ---
+def _gt_fields(record: Dict[str, Any]) -> Tuple[str, List[str], str]:
+    validation = record.get("validation") or {}
+    return record["query"], list(record.get("expected_doc_ids") or []), str(validation.get("query_type", "unknown"))
+
+
+def build_ground_truth(rows: Iterable[Tuple[str, List[str], str]]) -> GroundTruth:
+    """GroundTruth from ``(query, expected_doc_ids, query_type)`` tuples."""
+    doc_vocab: Dict[str, int] = {}
+    queries, query_types, rel_rows, rel_docs = [], [], [], []
+    seen_queries: Dict[str, int] = {}
+    with gc_paused():
+        for query, expected, query_type in rows:
+            if query in seen_queries:
+                # Same query text twice: merge the relevant docs into the first row
+                row = seen_queries[query]
+            else:
+                row = seen_queries[query] = len(queries)
+                queries.append(query)
+                query_types.append(query_type)
+            for doc in dict.fromkeys(expected):
+                rel_rows.append(row)
+                rel_docs.append(doc_vocab.setdefault(doc, len(doc_vocab)))
+    # Duplicate (row, doc) pairs can only come from merged rows; keep one
+    pairs = np.unique(np.stack([np.asarray(rel_rows, dtype=np.int64), np.asarray(rel_docs, dtype=np.int64)]), axis=1) \
+        if rel_rows else np.zeros((2, 0), dtype=np.int64)
+    return GroundTruth(queries, query_types, pairs[0], pairs[1], doc_vocab)
+
+
+def load_ground_truth(path: str, max_workers: int = 8) -> GroundTruth:
+    """Read only query / expected_doc_ids / query_type (context text is dropped while reading)."""
+    return build_ground_truth(read_records(path, transform=_gt_fields, max_workers=max_workers))
+
+
+def _run_fields(query_field: str, docs_field: str):
+    def extract(record: Dict[str, Any]) -> Tuple[str, List[str]]:
+        docs = record.get(docs_field) or []
+        # Results may be plain doc ids or {"doc_id": ...} objects
+        if docs and isinstance(docs[0], dict):
+            docs = [d["doc_id"] for d in docs]
+        return record[query_field], docs
+    return extract
+
+
+def build_run(records: Iterable[Tuple[str, List[str]]], gt: GroundTruth, max_k: int) -> Tuple[SearchRun, int]:
+    """Map ``(query, ranked_doc_ids)`` pairs onto ground-truth rows; also returns the unmatched count."""
+    row_of = {q: i for i, q in enumerate(gt.queries)}
+    rows: List[int] = []
+    lengths: List[int] = []
+    flat: List[str] = []
+    unmatched = 0
+    with gc_paused():
+        for query, docs in records:
+            row = row_of.get(query)
+            if row is None:
+                unmatched += 1
+                continue
+            docs = docs[:max_k]
+            rows.append(row)
+            lengths.append(len(docs))
+            flat.extend(docs)
+
+    lengths_arr = np.asarray(lengths, dtype=np.int64)
+    starts = np.cumsum(lengths_arr) - lengths_arr
+    run_rows = np.repeat(np.asarray(rows, dtype=np.int64), lengths_arr)
+    ranks = np.arange(len(flat), dtype=np.int64) - np.repeat(starts, lengths_arr)
+    # Docs that are nobody's relevant doc never need a code
+    docs = np.fromiter(map(gt.doc_vocab.get, flat, itertools.repeat(-1)), dtype=np.int64, count=len(flat))
+    return SearchRun(run_rows, ranks, docs), unmatched
+
+
+def load_run(
+    path: str, gt: GroundTruth, max_k: int, query_field: str = "query", docs_field: str = "doc_ids",
+    max_workers: int = 8,
+) -> SearchRun:
+    """Read a JSONL search run and map it onto ground-truth rows (top ``max_k`` results per query)."""
+    records = read_records(path, transform=_run_fields(query_field, docs_field), max_workers=max_workers)
+    run, unmatched = build_run(records, gt, max_k)
+    if unmatched:
+        logger.warning("%d run queries are not in the ground truth and were ignored.", unmatched)
+    return run
+
+
+# --- Metrics ---
+def relevance_matrix(gt: GroundTruth, run: SearchRun, rows: np.ndarray, max_k: int) -> np.ndarray:
+    """Binary (len(rows) x max_k) relevance of the ranked results of ``rows``."""
+    n_docs = max(1, len(gt.doc_vocab))
+    rel_keys = np.sort(gt.rel_rows * n_docs + gt.rel_docs)
+    local = np.full(len(gt.queries), -1, dtype=np.int64)
+    local[rows] = np.arange(len(rows))
+
+    sel = (local[run.rows] >= 0) & (run.docs >= 0)
+    r_rows, r_ranks, r_docs = run.rows[sel], run.ranks[sel], run.docs[sel]
+    keys = r_rows * n_docs + r_docs
+    pos = np.searchsorted(rel_keys, keys)
+    hit = (pos < len(rel_keys)) & (rel_keys[np.minimum(pos, len(rel_keys) - 1)] == keys)
+    keys, h_rows, h_ranks = keys[hit], r_rows[hit], r_ranks[hit]
+
+    # A doc returned twice for the same query only counts at its best rank
+    order = np.lexsort((h_ranks, keys))
+    first = np.ones(len(keys), dtype=bool)
+    first[order[1:]] = keys[order[1:]] != keys[order[:-1]]
+
+    rel = np.zeros((len(rows), max_k), dtype=np.float32)
+    rel[local[h_rows[first]], h_ranks[first]] = 1.0
+    return rel
+
+
+def per_query_metrics(rel: np.ndarray, num_relevant: np.ndarray, ks: Sequence[int]) -> Dict[str, np.ndarray]:
+    """Per-query metric columns ``"<metric>@<k>"`` from a binary relevance matrix."""
+    n, max_k = rel.shape
+    positions = np.arange(1, max_k + 1, dtype=np.float32)
+    discounts = 1.0 / np.log2(positions + 1.0)
+    n_rel = num_relevant.astype(np.float32)
+
+    hits = np.cumsum(rel, axis=1)
+    dcg = np.cumsum(rel * discounts, axis=1)
+    ideal = np.cumsum(discounts)
+    precision_at = hits / positions
+    ap_sum = np.cumsum(precision_at * rel, axis=1)
+    any_hit = rel.any(axis=1)
+    first_rank = np.where(any_hit, rel.argmax(axis=1) + 1, max_k + 1)
+
+    out: Dict[str, np.ndarray] = {}
+    safe_rel = np.maximum(n_rel, 1.0)
+    for k in ks:
+        col = k - 1
+        idcg = ideal[np.minimum(num_relevant, k).clip(min=1) - 1]
+        out[f"ndcg@{k}"] = dcg[:, col] / idcg
+        out[f"mrr@{k}"] = np.where(first_rank <= k, 1.0 / first_rank, 0.0).astype(np.float32)
+        out[f"map@{k}"] = ap_sum[:, col] / np.minimum(safe_rel, k)
+        out[f"recall@{k}"] = hits[:, col] / safe_rel
+        out[f"precision@{k}"] = hits[:, col] / k
+    return out
+
+
+class MetricSums:
+    """Running per-query-type metric sums; ``add`` any number of (ground truth, run) parts, then ``report``.
+
+    Parts must cover disjoint queries (e.g. hash partitions), so the means equal a single pass.
+    """
+
+    def __init__(self, ks: Sequence[int], block_size: int = 200_000):
+        self.ks = sorted({int(k) for k in ks if int(k) > 0})
+        self.max_k = max(self.ks)
+        self.block_size = block_size
+        self.names = [f"{m}@{k}" for m in METRIC_NAMES for k in self.ks]
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self.without_relevant = 0
+
+    def add(self, gt: GroundTruth, run: SearchRun):
+        num_relevant = gt.num_relevant
+        rows = np.flatnonzero(num_relevant > 0)
+        self.without_relevant += int(len(gt.queries) - len(rows))
+
+        type_names = sorted(set(gt.query_types))
+        type_index = {t: j for j, t in enumerate(type_names)}
+        all_codes = np.fromiter((type_index[t] for t in gt.query_types), dtype=np.int64, count=len(gt.query_types))
+        type_codes = all_codes[rows]
+        totals = np.zeros((len(self.names), len(type_names)), dtype=np.float64)
+
+        # Bounded blocks keep the dense matrices small for millions of queries
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            rel = relevance_matrix(gt, run, block, self.max_k)
+            metrics = per_query_metrics(rel, num_relevant[block], self.ks)
+            codes = type_codes[start:start + self.block_size]
+            for i, name in enumerate(self.names):
+                totals[i] += np.bincount(codes, weights=metrics[name], minlength=len(type_names))
+
+        counts = np.bincount(type_codes, minlength=len(type_names))
+        for j, t in enumerate(type_names):
+            if counts[j]:
+                self.sums[t] = self.sums.get(t, 0.0) + totals[:, j]
+                self.counts[t] = self.counts.get(t, 0) + int(counts[j])
+
+    def report(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        overall_sums = sum(self.sums.values(), np.zeros(len(self.names)))
+        overall = {name: round(float(overall_sums[i] / max(1, total)), 6) for i, name in enumerate(self.names)}
+        by_type = {
+            str(t): {"queries": self.counts[t],
+                     **{name: round(float(self.sums[t][i] / self.counts[t]), 6) for i, name in enumerate(self.names)}}
+            for t in sorted(self.counts)
+        }
+        return {
+            "queries": total,
+            "queries_without_relevant_docs": self.without_relevant,
+            "k": self.ks,
+            "overall": overall,
+            "by_query_type": by_type,
+        }
+
+
+def evaluate(
+    gt: GroundTruth, run: SearchRun, ks: Sequence[int], block_size: int = 200_000,
+) -> Dict[str, Any]:
+    """Mean metrics overall and per query type. Queries without relevant docs are skipped."""
+    sums = MetricSums(ks, block_size=block_size)
+    sums.add(gt, run)
+    return sums.report()
+
+
+def evaluate_files(config, ground_truth_path: str, run_path: str, ks: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+    """Load both files and compute the report (settings from metrics_config)."""
+    ks = list(ks or getattr(config, "METRICS_K", [1, 3, 5, 10, 20, 100]))
+    workers = int(getattr(config, "METRICS_READ_WORKERS", 8))
+    started = time.perf_counter()
+    gt = load_ground_truth(ground_truth_path, max_workers=workers)
+    run = load_run(
+        run_path, gt, max(ks),
+        query_field=getattr(config, "RUN_QUERY_FIELD", "query"),
+        docs_field=getattr(config, "RUN_DOCS_FIELD", "doc_ids"),
+        max_workers=workers,
+    )
+    loaded = time.perf_counter()
+    report = evaluate(gt, run, ks, block_size=int(getattr(config, "METRICS_BLOCK_SIZE", 200_000)))
+    report["timing_s"] = {"load": round(loaded - started, 3), "metrics": round(time.perf_counter() - loaded, 3)}
+    return report
+
+
+def evaluate_run_files(
+    config, ground_truth_path: str, run_paths: Sequence[str], ks: Optional[Sequence[int]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """In-memory reports for several runs against one ground truth, loaded once."""
+    ks = list(ks or getattr(config, "METRICS_K", [1, 3, 5, 10, 20, 100]))
+    workers = int(getattr(config, "METRICS_READ_WORKERS", 8))
+    gt = load_ground_truth(ground_truth_path, max_workers=workers)
+    reports = {}
+    for path in run_paths:
+        run = load_run(
+            path, gt, max(ks),
+            query_field=getattr(config, "RUN_QUERY_FIELD", "query"),
+            docs_field=getattr(config, "RUN_DOCS_FIELD", "doc_ids"),
+            max_workers=workers,
+        )
+        reports[path] = evaluate(gt, run, ks, block_size=int(getattr(config, "METRICS_BLOCK_SIZE", 200_000)))
+        del run
+    return reports
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    from ..configs import metrics_config
+
+    parser = argparse.ArgumentParser(description="Search metrics (NDCG/MRR/MAP/Recall@k) for a ground-truth dataset")
+    parser.add_argument("--ground-truth", type=str, default=metrics_config.GROUND_TRUTH_PATH)
+    parser.add_argument("--run", type=str, nargs="+", default=[metrics_config.RUN_PATH],
+                        help="JSONL search run(s): {query, doc_ids}")
+    parser.add_argument("--k", type=int, nargs="+", default=None, help="Cutoffs (default: METRICS_K)")
+    parser.add_argument("--stream", action="store_true", default=metrics_config.METRICS_STREAMING,
+                        help="Out-of-core hash join for runs that do not fit in memory")
+    parser.add_argument("--output", type=str, default=metrics_config.METRICS_OUTPUT_PATH)
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] [%(name)s] - %(message)s")
+    if args.stream:
+        from .streaming_evaluator import evaluate_runs_streaming
+
+        reports = evaluate_runs_streaming(metrics_config, args.ground_truth, args.run, args.k)
+    elif len(args.run) == 1:
+        reports = {args.run[0]: evaluate_files(metrics_config, args.ground_truth, args.run[0], args.k)}
+    else:
+        reports = evaluate_run_files(metrics_config, args.ground_truth, args.run, args.k)
+
+    # A single run keeps the flat report layout
+    result = next(iter(reports.values())) if len(reports) == 1 else reports
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        logger.info("Metrics report written to %s", args.output)
+    print(json.dumps({run: {"queries": r["queries"], "overall": r["overall"]} for run, r in reports.items()}, indent=2))
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/metrics/metrics_evaluator.py ---
@@ -0,0 +1,142 @@
+# --- File: evaluation_api/metrics/streaming_evaluator.py ---
+# Out-of-core search metrics: an on-disk hash join of ground truth and search runs.
+#
+# Run files from offline A/B tests (1M queries x top-100 with scores) do not fit in
+# memory. Both inputs are streamed once into METRICS_STREAM_PARTITIONS bucket files
+# keyed by a stable hash of the query text, keeping only query / doc ids / query type
+# (scores, contexts and results beyond max(k) are dropped). Each bucket pair is then
+# joined and scored with the in-memory evaluator and folded into one MetricSums, so
+# memory is bounded by a single bucket, not by the run.
+#
+# The ground truth is partitioned once and shared by every run file; run files are
+# partitioned and scored in parallel worker processes.
+#
+# Example:
+#   python -m evaluation_api.metrics.metrics_evaluator --stream --ground-truth output/synthetic_ground_truth.jsonl \
+#       --run runs/bm25.jsonl.gz runs/dense.jsonl.gz --output output/metrics.json
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .metrics_evaluator import MetricSums, build_ground_truth, build_run, _gt_fields, _run_fields
+from ..utils.dataset_io import _loads, encode_record, iter_records
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket_of(query: str, partitions: int) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(query.encode("utf-8")) % partitions
+
+
+def _bucket_path(directory: str, bucket: int) -> str:
+    return os.path.join(directory, f"bucket-{bucket:05d}.jsonl")
+
+
+def partition_records(records: Iterator[list], directory: str, partitions: int) -> int:
+    """Append compact ``[query, ...]`` records to their hash bucket files; returns the record count."""
+    os.makedirs(directory, exist_ok=True)
+    files = [open(_bucket_path(directory, b), "wb", buffering=1 << 20) for b in range(partitions)]
+    count = 0
+    try:
+        for record in records:
+            files[_bucket_of(record[0], partitions)].write(encode_record(record))
+            count += 1
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+
+def _iter_bucket(directory: str, bucket: int) -> Iterator[list]:
+    with open(_bucket_path(directory, bucket), "rb") as f:
+        for line in f:
+            yield _loads(line)
+
+
+def partition_ground_truth(path: str, directory: str, partitions: int) -> int:
+    return partition_records((list(_gt_fields(r)) for r in iter_records(path)), directory, partitions)
+
+
+def partition_run(path: str, directory: str, partitions: int, max_k: int,
+                  query_field: str = "query", docs_field: str = "doc_ids") -> int:
+    extract = _run_fields(query_field, docs_field)
+
+    def compact():
+        for r in iter_records(path):
+            query, docs = extract(r)
+            yield [query, docs[:max_k]]
+
+    return partition_records(compact(), directory, partitions)
+
+
+def evaluate_partitions(gt_dir: str, run_dir: str, partitions: int, ks: Sequence[int],
+                        block_size: int = 200_000) -> Dict[str, Any]:
+    """Join bucket pairs one at a time and accumulate the metric sums."""
+    sums = MetricSums(ks, block_size=block_size)
+    unmatched = 0
+    for bucket in range(partitions):
+        gt = build_ground_truth(_iter_bucket(gt_dir, bucket))
+        run, missing = build_run(_iter_bucket(run_dir, bucket), gt, sums.max_k)
+        unmatched += missing
+        sums.add(gt, run)
+    if unmatched:
+        logger.warning("%d run queries are not in the ground truth and were ignored.", unmatched)
+    report = sums.report()
+    report["unmatched_run_queries"] = unmatched
+    return report
+
+
+def _evaluate_run(run_path: str, gt_dir: str, work_dir: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker: partition one run file next to the shared ground-truth buckets and score it."""
+    started = time.perf_counter()
+    run_dir = tempfile.mkdtemp(prefix="run-", dir=work_dir)
+    try:
+        partition_run(run_path, run_dir, settings["partitions"], max(settings["ks"]),
+                      settings["query_field"], settings["docs_field"])
+        partitioned = time.perf_counter()
+        report = evaluate_partitions(gt_dir, run_dir, settings["partitions"], settings["ks"], settings["block_size"])
+        report["timing_s"] = {"partition": round(partitioned - started, 3),
+                              "metrics": round(time.perf_counter() - partitioned, 3)}
+        return report
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def evaluate_runs_streaming(
+    config, ground_truth_path: str, run_paths: List[str], ks: Optional[Sequence[int]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Report per run file; the ground truth is partitioned once and shared by all runs."""
+    settings = {
+        "ks": sorted({int(k) for k in (ks or getattr(config, "METRICS_K", [1, 3, 5, 10, 20, 100])) if int(k) > 0}),
+        "partitions": max(1, int(getattr(config, "METRICS_STREAM_PARTITIONS", 64))),
+        "block_size": int(getattr(config, "METRICS_BLOCK_SIZE", 200_000)),
+        "query_field": getattr(config, "RUN_QUERY_FIELD", "query"),
+        "docs_field": getattr(config, "RUN_DOCS_FIELD", "doc_ids"),
+    }
+    workers = max(1, min(int(getattr(config, "METRICS_STREAM_WORKERS", 4)), len(run_paths)))
+    work_dir = tempfile.mkdtemp(prefix="metrics-", dir=getattr(config, "METRICS_TMP_DIR", None) or None)
+    try:
+        gt_dir = os.path.join(work_dir, "ground_truth")
+        started = time.perf_counter()
+        count = partition_ground_truth(ground_truth_path, gt_dir, settings["partitions"])
+        logger.info("Partitioned %d ground-truth queries into %d buckets in %.1fs",
+                    count, settings["partitions"], time.perf_counter() - started)
+
+        if workers == 1:
+            reports = [_evaluate_run(p, gt_dir, work_dir, settings) for p in run_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                futures = [ex.submit(_evaluate_run, p, gt_dir, work_dir, settings) for p in run_paths]
+                reports = [f.result() for f in futures]
+        return dict(zip(run_paths, reports))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# --- End File: evaluation_api/metrics/streaming_evaluator.py ---
@@ -0,0 +1,276 @@
+# --- File: evaluation_api/server/jobs.py ---
+# Job queue of the generation service.
+#
+# Jobs run on a bounded thread pool (SERVER_MAX_WORKERS) behind a bounded queue
+# (SERVER_MAX_QUEUED). Every job appends its results to <SERVER_OUTPUT_DIR>/<job_id>.jsonl
+# as they are produced; readers follow that file (``Job.iter_output``), so streaming
+# a large job never holds its results in memory.
+#
+#   generate: corpus + clients from the ResidentRegistry -> selection -> run_streaming
+#   metrics:  resident ground truth -> one report line per run file
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from .registry import ResidentRegistry, job_config
+from ..generation import chunk_selector, streaming
+from ..metrics import metrics_evaluator
+from ..utils.dataset_io import encode_record
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ("generate", "metrics")
+EVALUATION_MODES = ("none", "nonllm", "llm", "hybrid", "retrieval")
+_FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class QueueFullError(RuntimeError):
+    """Raised by ``JobManager.submit`` when SERVER_MAX_QUEUED jobs are already waiting."""
+
+
+class Job:
+    """One generation or metrics job and its progress."""
+
+    def __init__(self, kind: str, params: Dict[str, Any], output_dir: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.output_path = os.path.join(output_dir, f"{self.id}.jsonl")
+        self.status = "queued"
+        self.records = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.timing: Dict[str, float] = {}
+        self.future: Optional[Future] = None
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        with self._cond:
+            self.status = status
+            self.error = error
+            if status == "running":
+                self.started_at = time.time()
+            elif status in _FINISHED:
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def record_written(self, *_):
+        with self._cond:
+            self.records += 1
+            self._cond.notify_all()
+
+    def iter_output(self, offset: int = 0, follow: bool = True, poll_s: float = 1.0) -> Iterator[bytes]:
+        """Complete JSONL lines of the job output from byte ``offset``; with ``follow``, until the job ends."""
+        while True:
+            with self._cond:
+                done = self.finished
+            if os.path.exists(self.output_path):
+                with open(self.output_path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        offset += len(line)
+                        if not line.endswith(b"\n"):
+                            # Still being written; re-read it whole next time
+                            offset -= len(line)
+                            break
+                        yield line
+            if done or not follow:
+                return
+            with self._cond:
+                if not self.finished:
+                    self._cond.wait(timeout=poll_s)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "params": self.params,
+                "records": self.records,
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "timing_s": dict(self.timing),
+                "output_path": self.output_path,
+            }
+
+
+class JobManager:
+    """Accepts jobs, runs them on a bounded worker pool and keeps recent job history."""
+
+    def __init__(self, registry: ResidentRegistry, base_config, metrics_config, server_config=None):
+        self.registry = registry
+        self.base_config = base_config
+        self.metrics_config = metrics_config
+        self.max_queued = max(0, int(getattr(server_config, "SERVER_MAX_QUEUED", 32)))
+        self.max_finished = max(1, int(getattr(server_config, "SERVER_MAX_FINISHED_JOBS", 1000)))
+        self.output_dir = getattr(server_config, "SERVER_OUTPUT_DIR", "./output/jobs")
+        self.max_workers = max(1, int(getattr(server_config, "SERVER_MAX_WORKERS", 2)))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    # --- Submission ---
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Job:
+        params = dict(params or {})
+        self._validate(kind, params)
+        job = Job(kind, params, self.output_dir)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs already queued (SERVER_MAX_QUEUED={self.max_queued})")
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job)
+        logger.info("Job %s (%s) queued", job.id, kind)
+        return job
+
+    @staticmethod
+    def _validate(kind: str, params: Dict[str, Any]):
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}; expected one of {JOB_KINDS}")
+        overrides = params.get("overrides") or {}
+        if not isinstance(overrides, dict) or not all(isinstance(k, str) and k.isupper() for k in overrides):
+            raise ValueError("overrides must map UPPERCASE setting names to values")
+        if kind == "generate":
+            mode = params.setdefault("evaluation_mode", "llm")
+            if mode not in EVALUATION_MODES:
+                raise ValueError(f"Unknown evaluation_mode {mode!r}; expected one of {EVALUATION_MODES}")
+        else:
+            runs = params.get("runs")
+            if not params.get("ground_truth") or not runs or not isinstance(runs, list):
+                raise ValueError("metrics jobs need ground_truth and a list of runs")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [{"job_id": j.id, "kind": j.kind, "status": j.status, "records": j.records} for j in jobs]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job; running jobs are not interrupted."""
+        job = self.get(job_id)
+        if job is None or job.future is None or not job.future.cancel():
+            return False
+        job.set_status("cancelled")
+        self._forget_finished()
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {s: statuses.count(s) for s in ("queued", "running") + _FINISHED}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    # --- Execution ---
+    def _run(self, job: Job):
+        job.set_status("running")
+        started = time.perf_counter()
+        try:
+            if job.kind == "generate":
+                job.result = self._run_generation(job)
+            else:
+                job.result = self._run_metrics(job)
+            job.timing["total"] = round(time.perf_counter() - started, 3)
+            job.set_status("succeeded")
+            logger.info("Job %s succeeded in %.2fs (%d records)", job.id, job.timing["total"], job.records)
+        except Exception as e:  # noqa: BLE001
+            job.timing["total"] = round(time.perf_counter() - started, 3)
+            logger.error("Job %s failed: %s", job.id, e)
+            job.set_status("failed", error=str(e))
+        finally:
+            self._forget_finished()
+
+    def _run_generation(self, job: Job) -> Dict[str, Any]:
+        config = job_config(self.base_config, job.params.get("overrides"))
+        mode = job.params["evaluation_mode"]
+        started = time.perf_counter()
+        corpus, corpus_resident = self.registry.corpus(config)
+        clients, clients_resident = self.registry.resident_clients(config, mode)
+        gate = corpus.retrieval_gate(config) if mode == "retrieval" else None
+        job.timing["startup"] = round(time.perf_counter() - started, 3)
+
+        selected = time.perf_counter()
+        selector = chunk_selector.ContextSelector(corpus.chunks, config, backend=corpus.backend,
+                                                  bundle_cache=corpus.selection_cache(config))
+        bundles = selector.select_contexts()
+        job.timing["selection"] = round(time.perf_counter() - selected, 3)
+        if not bundles:
+            raise ValueError("No context bundles selected")
+
+        counters = streaming.run_streaming(
+            bundles, clients.q_generator, config, mode, job.output_path,
+            backend=corpus.backend, chunks=corpus.chunks, llm=clients.eval_llm,
+            retrieval_gate=gate, on_record=job.record_written,
+        )
+        return {
+            # Job.iter_output keeps serving the JSONL; this is the same records in the OUTPUT_* layout
+            "dataset": streaming.finalize_output(config, job.output_path, job.output_path),
+            "corpus": corpus.fingerprint,
+            "corpus_resident": corpus_resident,
+            "clients_resident": clients_resident,
+            "bundles": len(bundles),
+            **counters,
+        }
+
+    def _run_metrics(self, job: Job) -> Dict[str, Any]:
+        config = job_config(self.metrics_config, job.params.get("overrides"))
+        ks = job.params.get("k") or getattr(config, "METRICS_K", [1, 3, 5, 10, 20, 100])
+        runs = [str(r) for r in job.params["runs"]]
+        started = time.perf_counter()
+        with open(job.output_path, "wb") as out:
+            if job.params.get("stream"):
+                from ..metrics.streaming_evaluator import evaluate_runs_streaming
+
+                gt_resident = False
+                reports = evaluate_runs_streaming(config, job.params["ground_truth"], runs, ks)
+                for run_path in runs:
+                    out.write(encode_record({"run": run_path, **reports[run_path]}))
+                    out.flush()
+                    job.record_written()
+            else:
+                workers = int(getattr(config, "METRICS_READ_WORKERS", 8))
+                gt, gt_resident = self.registry.ground_truth(job.params["ground_truth"], max_workers=workers)
+                job.timing["startup"] = round(time.perf_counter() - started, 3)
+                for run_path in runs:
+                    run = metrics_evaluator.load_run(
+                        run_path, gt, max(ks),
+                        query_field=getattr(config, "RUN_QUERY_FIELD", "query"),
+                        docs_field=getattr(config, "RUN_DOCS_FIELD", "doc_ids"),
+                        max_workers=workers,
+                    )
+                    report = metrics_evaluator.evaluate(gt, run, ks,
+                                                        block_size=int(getattr(config, "METRICS_BLOCK_SIZE", 200_000)))
+                    out.write(encode_record({"run": run_path, **report}))
+                    out.flush()
+                    job.record_written()
+        return {"runs": len(runs), "ground_truth_resident": gt_resident}
+
+    def _forget_finished(self):
+        with self._lock:
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+# --- End File: evaluation_api/server/jobs.py ---
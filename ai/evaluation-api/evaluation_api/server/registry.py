@@ -0,0 +1,344 @@
+# --- File: evaluation_api/server/registry.py ---
+# Resident state of the generation service.
+#
+# A CLI run pays for load_data, chunk validation (which builds the search backend),
+# the retrieval-gate embedder and the LLM clients on every invocation. The service
+# keeps them in bounded LRU maps instead:
+#   - corpora:       keyed by corpus fingerprint (input settings + input file sizes/mtimes)
+#   - ground truths: keyed by path, size and mtime (metrics jobs)
+#   - clients:       query generator and evaluation LLM, keyed by the job's effective config
+# Concurrent jobs asking for the same missing corpus wait for a single load.
+#
+# With SERVER_INCREMENTAL_INDEX a resident corpus is searched through an IncrementalIndex,
+# so chunks can be upserted/deleted in place (``ResidentCorpus.apply``); only the cached
+# selections and queries that depend on the changed neighbourhood are invalidated.
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import types
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..generation import evaluation_layer
+from ..generation.cli import load_corpus
+from ..generation.data_loader import to_chunkdata
+from ..generation.incremental_index import ChangeSet, IncrementalIndex, SelectionCache
+from ..generation.models import ChunkData
+from ..generation.query_generator import QueryGenerator
+from ..generation.retrieval_gate import create_retrieval_gate
+from ..generation.shared_embeddings import release
+from ..metrics.metrics_evaluator import GroundTruth, load_ground_truth
+
+logger = logging.getLogger(__name__)
+
+# Settings that change which chunks are loaded, which survive validation, or the backend built over them
+_CORPUS_FIELD_PREFIXES = (
+    "INPUT_", "BLOB_", "EMBED_DIM", "MIN_TOKEN_LENGTH", "MAX_TOKEN_LENGTH", "DUPLICATE_", "DEDUP_",
+    "USE_BACKEND_DUPLICATE_DETECTION", "SEARCH_BACKEND", "USE_IVF", "IVF_", "AZURE_SEARCH_",
+)
+
+
+# --- Configs and fingerprints ---
+def config_values(config) -> Dict[str, Any]:
+    """UPPERCASE settings of a config module or namespace."""
+    return {
+        name: value for name, value in vars(config).items()
+        if name.isupper() and not isinstance(value, types.ModuleType) and not callable(value)
+    }
+
+
+def job_config(base, overrides: Optional[Dict[str, Any]] = None):
+    """Copy of ``base`` with per-job overrides (UPPERCASE setting names only)."""
+    values = config_values(base)
+    for name, value in (overrides or {}).items():
+        if not name.isupper():
+            raise ValueError(f"Config override {name!r} is not an UPPERCASE setting")
+        values[name] = value
+    return types.SimpleNamespace(**values)
+
+
+def _digest(payload: Any) -> str:
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def config_key(config) -> str:
+    return _digest(config_values(config))
+
+
+def _file_stats(path: str) -> List[Tuple[str, int, int]]:
+    files = sorted(glob.glob(os.path.join(path, "*.json")) + glob.glob(os.path.join(path, "*.jsonl"))) \
+        if os.path.isdir(path) else [path]
+    stats = []
+    for fp in files:
+        try:
+            st = os.stat(fp)
+            stats.append((fp, st.st_size, st.st_mtime_ns))
+        except OSError:
+            stats.append((fp, -1, -1))
+    return stats
+
+
+def corpus_fingerprint(config) -> str:
+    """Changes whenever the loaded/validated corpus could differ: settings or input files."""
+    settings = {k: v for k, v in config_values(config).items() if k.startswith(_CORPUS_FIELD_PREFIXES)}
+    files = []
+    if getattr(config, "INPUT_TYPE", "chunks") == "chunks":
+        for path in getattr(config, "INPUT_PATHS", []) or []:
+            files.extend(_file_stats(os.path.abspath(path)))
+    # Blob inputs are identified by their settings only; evict the corpus to pick up new blobs
+    return _digest({"settings": settings, "files": files})
+
+
+# --- Resident objects ---
+@dataclass
+class ResidentCorpus:
+    """Validated chunks and the search backend built over them."""
+    fingerprint: str
+    chunks: List[ChunkData]
+    rejected: int
+    backend: Any
+    load_s: float
+    loaded_at: float = field(default_factory=time.time)
+    jobs: int = 0
+    config: Any = None
+    revision: int = 0
+    _gates: Dict[str, Any] = field(default_factory=dict, repr=False)
+    _gate_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _selections: Dict[str, SelectionCache] = field(default_factory=dict, repr=False)
+    _update_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def incremental(self) -> bool:
+        return isinstance(self.backend, IncrementalIndex)
+
+    def selection_cache(self, config) -> Optional[SelectionCache]:
+        """Per-golden bundle cache for this selection configuration (incremental corpora only)."""
+        if not self.incremental:
+            return None
+        key = _digest({k: v for k, v in config_values(config).items()
+                       if k in ("NUM_DISTRACTORS", "MULTI_GOLDEN_MODE", "GOLDEN_SIM_THRESHOLD",
+                                "MAX_GOLDEN_DOCS", "GOLDEN_MIN_DOCS")})
+        with self._gate_lock:
+            if key not in self._selections:
+                self._selections[key] = SelectionCache(self.backend, config)
+            return self._selections[key]
+
+    def apply(self, upserts: List[Dict[str, Any]], deletes: List[Tuple[str, str]],
+              generators: List[QueryGenerator]) -> Dict[str, Any]:
+        """Upsert/delete chunks in place and invalidate what depends on them."""
+        if not self.incremental:
+            raise ValueError("Corpus was not loaded with SERVER_INCREMENTAL_INDEX; reload it to update in place")
+        min_len = int(getattr(self.config, "MIN_TOKEN_LENGTH", 0))
+        max_len = int(getattr(self.config, "MAX_TOKEN_LENGTH", 1 << 30))
+        chunks, rejected = [], []
+        for data in upserts:
+            chunk, _ = to_chunkdata(data)
+            # Same heuristics as validate_chunks; a rejected new version removes the old one
+            if min_len <= len(chunk.chunk_text.split()) <= max_len:
+                chunks.append(chunk)
+            else:
+                rejected.append((chunk.doc_id, chunk.chunk_id))
+        with self._update_lock:
+            changes = ChangeSet()
+            changes.merge(self.backend.delete(list(deletes) + rejected))
+            changes.merge(self.backend.upsert(chunks))
+            for chunk in chunks:
+                # The index keeps the normalized vector
+                chunk.embedding = []  # type: ignore[assignment]
+            with self._gate_lock:
+                caches = list(self._selections.values())
+            bundles = [b for cache in caches for b in cache.invalidate(changes)]
+            queries = sum(g.invalidate_bundle(b) for b in bundles for g in generators)
+            self.chunks = self.backend.chunks()
+            self.revision += 1
+        logger.info("Corpus %s revision %d: %s; %d selections and %d cached queries invalidated",
+                    self.fingerprint, self.revision, changes.summary(), len(bundles), queries)
+        return {
+            "revision": self.revision,
+            "chunks": len(self.chunks),
+            "rejected": len(rejected),
+            **changes.summary(),
+            "invalidated_selections": len(bundles),
+            "invalidated_queries": queries,
+        }
+
+    def add_job(self):
+        with self._gate_lock:
+            self.jobs += 1
+
+    def retrieval_gate(self, config):
+        """Retrieval-mode gate over this corpus, built once per gate configuration."""
+        key = _digest({k: v for k, v in config_values(config).items() if k.startswith("RETRIEVAL_GATE_")})
+        with self._gate_lock:
+            if key not in self._gates:
+                self._gates[key] = create_retrieval_gate(config, "retrieval", backend=self.backend, chunks=self.chunks)
+            return self._gates[key]
+
+    def describe(self) -> Dict[str, Any]:
+        info = self.backend.get_backend_info() if hasattr(self.backend, "get_backend_info") else {}
+        return {
+            "fingerprint": self.fingerprint,
+            "chunks": len(self.chunks),
+            "rejected": self.rejected,
+            "backend": info.get("backend"),
+            "load_s": round(self.load_s, 3),
+            "loaded_at": self.loaded_at,
+            "jobs": self.jobs,
+            "revision": self.revision,
+            "selections": {k: c.stats() for k, c in self._selections.items()},
+        }
+
+
+@dataclass
+class ResidentClients:
+    """Query generator and evaluation LLM for one effective config."""
+    q_generator: QueryGenerator
+    eval_llm: Tuple[Any, Optional[str]]
+
+
+class _LRU:
+    """Bounded map whose missing values are built once, even under concurrent requests."""
+
+    def __init__(self, name: str, max_entries: int, on_evict: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.on_evict = on_evict
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: str, load: Callable[[], Any]) -> Tuple[Any, bool]:
+        """``(value, was_resident)``."""
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return self._items[key], True
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another job is loading the same key; use its result
+            pending.wait()
+        try:
+            value = load()
+            evicted = []
+            with self._lock:
+                self._items[key] = value
+                while len(self._items) > self.max_entries:
+                    evicted.append(self._items.popitem(last=False))
+            # Eviction callbacks may be slow (unlinking shared memory); run them outside the lock
+            for evicted_key, evicted_value in evicted:
+                if self.on_evict is not None:
+                    self.on_evict(evicted_value)
+                logger.info("Evicted resident %s %s", self.name, evicted_key)
+            return value, False
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._items.get(key)
+
+    def pop(self, key: str) -> bool:
+        with self._lock:
+            value = self._items.pop(key, None)
+        if value is not None and self.on_evict is not None:
+            self.on_evict(value)
+        return value is not None
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._items.values())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"resident": len(self._items), "max": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class ResidentRegistry:
+    """Warm corpora, ground truths and clients shared by every job of the service."""
+
+    def __init__(self, server_config=None):
+        # Running jobs keep their mapped embedding rows; eviction only unlinks the shared block
+        self.corpora = _LRU("corpus", getattr(server_config, "SERVER_MAX_CORPORA", 2),
+                            on_evict=lambda corpus: release(corpus.chunks))
+        self.ground_truths = _LRU("ground truth", getattr(server_config, "SERVER_MAX_GROUND_TRUTHS", 4))
+        self.clients = _LRU("clients", getattr(server_config, "SERVER_MAX_CLIENTS", 8))
+        self.incremental = bool(getattr(server_config, "SERVER_INCREMENTAL_INDEX", True))
+
+    def corpus(self, config) -> Tuple[ResidentCorpus, bool]:
+        fingerprint = corpus_fingerprint(config)
+
+        def load() -> ResidentCorpus:
+            started = time.perf_counter()
+            logger.info("Loading corpus %s...", fingerprint)
+            chunks, rejected, backend = load_corpus(config, drop_embeddings=not self.incremental)
+            if not chunks:
+                raise ValueError("No valid chunks loaded; check INPUT_PATHS")
+            if self.incremental:
+                # The mutable index replaces the load-time backend and holds the only copy of the vectors
+                backend = IncrementalIndex(chunks, config)
+                release(chunks)
+                for c in chunks:
+                    c.embedding = []  # type: ignore[assignment]
+            corpus = ResidentCorpus(fingerprint, chunks, len(rejected), backend, time.perf_counter() - started,
+                                    config=config)
+            logger.info("Corpus %s resident: %d chunks in %.1fs", fingerprint, len(chunks), corpus.load_s)
+            return corpus
+
+        corpus, resident = self.corpora.get_or_load(fingerprint, load)
+        corpus.add_job()
+        return corpus, resident
+
+    def ground_truth(self, path: str, max_workers: int = 8) -> Tuple[GroundTruth, bool]:
+        key = _digest(_file_stats(os.path.abspath(path)))
+        return self.ground_truths.get_or_load(key, lambda: load_ground_truth(path, max_workers=max_workers))
+
+    def resident_clients(self, config, evaluation_mode: str) -> Tuple[ResidentClients, bool]:
+        # "retrieval" evaluates with the hybrid LLM path after its gate
+        mode = "hybrid" if (evaluation_mode or "").lower() == "retrieval" else evaluation_mode
+        key = _digest({"config": config_key(config), "llm": (mode or "llm").lower() in ("llm", "hybrid")})
+        return self.clients.get_or_load(
+            key, lambda: ResidentClients(QueryGenerator(config), evaluation_layer.prepare_llm(config, mode)))
+
+    def update_corpus(self, fingerprint: str, upserts: List[Dict[str, Any]],
+                      deletes: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        """Apply chunk changes to a resident corpus; None when it is not resident."""
+        corpus = self.corpora.get(fingerprint)
+        if corpus is None:
+            return None
+        generators = [c.q_generator for c in self.clients.values()]
+        return corpus.apply(upserts, deletes, generators)
+
+    def evict_corpus(self, fingerprint: str) -> bool:
+        return self.corpora.pop(fingerprint)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "corpora": [c.describe() for c in self.corpora.values()],
+            "cache": {
+                "corpora": self.corpora.stats(),
+                "ground_truths": self.ground_truths.stats(),
+                "clients": self.clients.stats(),
+            },
+        }
+
+# --- End File: evaluation_api/server/registry.py ---
@@ -0,0 +1,428 @@
+# --- File: evaluation_api/utils/cache_utils.py ---
+# Single-file cache shared by the generation stages (LLM queries, loaded data, ...).
+# All namespaces live in one SQLite database in WAL mode so that generation
+# threads and separate worker processes can read and write concurrently without
+# creating one file per cached entry.
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_FILENAME = "cache.sqlite3"
+
+# Open caches are flushed by one exit hook; weak references keep it from pinning them
+_OPEN_CACHES: "weakref.WeakSet[SimpleCache]" = weakref.WeakSet()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    value       BLOB NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at  REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at);
+"""
+
+# Config fields that change the LLM output for an identical prompt
+_CONFIG_HASH_FIELDS = (
+    "AZURE_OPENAI_DEPLOYMENT_NAME",
+    "GENERATION_CASCADE",
+    "AZURE_OPENAI_DRAFT_DEPLOYMENT_NAME",
+    "TEMPERATURE",
+    "MAX_TOKENS",
+    "QUERY_TYPE_MAX_TOKENS",
+    "QUERY_LENGTH_TARGETS",
+    "PROMPT_BUDGET_ENABLED",
+    "PROMPT_INPUT_TOKEN_BUDGET",
+    "PROMPT_TYPE_INPUT_BUDGETS",
+    "PROMPT_MIN_DISTRACTOR_TOKENS",
+    "PROMPT_MIN_CHUNK_TOKENS",
+    "PROMPT_TOKENIZER_ENCODING",
+    "PROMPT_CACHE_FRIENDLY",
+)
+
+
+class SimpleCache:
+    """Key/value cache backed by one SQLite file with TTL expiry and LRU eviction.
+
+    Writes and access-time updates are buffered in memory and flushed in a single
+    transaction every ``batch_size`` operations or ``flush_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        namespace: str = "default",
+        ttl_hours: Optional[float] = None,
+        max_size_mb: Optional[float] = None,
+        batch_size: int = 64,
+        flush_interval: float = 2.0,
+    ):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.namespace = namespace
+        self.db_path = os.path.join(self.cache_dir, CACHE_DB_FILENAME)
+        self.ttl_seconds = float(ttl_hours) * 3600.0 if ttl_hours and ttl_hours > 0 else None
+        self.max_size_bytes = int(float(max_size_mb) * 1024 * 1024) if max_size_mb and max_size_mb > 0 else None
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._local = threading.local()
+        self._connections: Set[sqlite3.Connection] = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.time()
+        self._closed = False
+
+        conn = self._conn()
+        with conn:
+            conn.executescript(_SCHEMA)
+        self._purge_expired()
+        self._size_estimate = self._total_size()
+        _OPEN_CACHES.add(self)
+
+    @classmethod
+    def from_config(cls, config, namespace: str) -> "SimpleCache":
+        """Build a cache for ``namespace`` using CACHE_DIR / CACHE_TTL_HOURS / CACHE_MAX_SIZE_MB."""
+        return cls(
+            getattr(config, "CACHE_DIR", "./cache"),
+            namespace=namespace,
+            ttl_hours=getattr(config, "CACHE_TTL_HOURS", 168),
+            max_size_mb=getattr(config, "CACHE_MAX_SIZE_MB", 1024),
+        )
+
+    # --- Connections ---
+    def _conn(self) -> sqlite3.Connection:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._lock:
+                self._connections.add(conn)
+            # The thread-local holder dies with its thread; close the connection then
+            weakref.finalize(holder, _close_connection, conn, self._connections, self._lock)
+        return holder.conn
+
+    # --- Public API ---
+    def get(self, key: str) -> Any:
+        """Return the cached value for ``key`` or None on miss/expiry."""
+        with self._lock:
+            if key in self._pending:
+                self.hits += 1
+                return self._pending[key]
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache read failed for %s/%s: %s", self.namespace, key[:8], e)
+            row = None
+
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] < now):
+            with self._lock:
+                self.misses += 1
+                if row is not None:
+                    self.expired += 1
+            return None
+
+        try:
+            value = pickle.loads(row[0])
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning("Discarding unreadable cache entry %s/%s: %s", self.namespace, key[:8], e)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._touched[key] = now
+            should_flush = self._should_flush(now)
+        if should_flush:
+            self.flush()
+        return value
+
+    def set(self, key: str, value: Any):
+        """Buffer ``value`` under ``key``; it is persisted on the next flush."""
+        now = time.time()
+        with self._lock:
+            self._pending[key] = value
+            should_flush = self._should_flush(now)
+        if should_flush:
+            self.flush()
+
+    def delete(self, key: str):
+        """Remove ``key`` from the cache (buffered writes included)."""
+        with self._lock:
+            self._pending.pop(key, None)
+            self._touched.pop(key, None)
+        conn = self._conn()
+        with self._flush_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                _rollback(conn)
+                raise
+
+    def flush(self):
+        """Write buffered entries and access times in one transaction, then enforce the size cap."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.time()
+        if not pending and not touched:
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        rows = []
+        written = 0
+        for key, value in pending.items():
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            written += len(blob)
+            rows.append((self.namespace, key, sqlite3.Binary(blob), len(blob), now, now, expires_at))
+
+        conn = self._conn()
+        with self._flush_lock:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO cache_entries "
+                        "(namespace, key, value, size, created_at, accessed_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                if touched:
+                    conn.executemany(
+                        "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                        [(ts, self.namespace, k) for k, ts in touched.items()],
+                    )
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                _rollback(conn)
+                logger.warning("Cache flush failed for namespace %s (%d entries dropped): %s",
+                               self.namespace, len(rows), e)
+                return
+            self._size_estimate += written
+
+        if self.max_size_bytes is not None and self._size_estimate > self.max_size_bytes:
+            self._evict()
+
+    def size_info(self) -> Dict[str, Any]:
+        """Entry count, payload size and hit/miss counters for this namespace."""
+        self.flush()
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        lookups = self.hits + self.misses
+        try:
+            db_bytes = sum(
+                os.path.getsize(p)
+                for p in (self.db_path, self.db_path + "-wal")
+                if os.path.exists(p)
+            )
+        except OSError:
+            db_bytes = 0
+        return {
+            "namespace": self.namespace,
+            "path": self.db_path,
+            "entry_count": int(row[0]),
+            "total_size_mb": round(int(row[1]) / (1024 * 1024), 2),
+            "db_size_mb": round(db_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        """Flush pending writes and close all connections opened by this cache."""
+        if self._closed:
+            return
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            logger.warning("Cache flush on close failed: %s", e)
+        self._closed = True
+        _OPEN_CACHES.discard(self)
+        with self._lock:
+            conns = list(self._connections)
+            self._connections.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def __del__(self):
+        # Caches dropped without close() still persist their buffered writes
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # --- Maintenance ---
+    def _should_flush(self, now: float) -> bool:
+        # Caller holds self._lock
+        return (
+            len(self._pending) + len(self._touched) >= self.batch_size
+            or now - self._last_flush >= self.flush_interval
+        )
+
+    def _total_size(self) -> int:
+        row = self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        return int(row[0])
+
+    def _purge_expired(self):
+        conn = self._conn()
+        with self._flush_lock:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                cur = conn.execute(
+                    "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at < ?",
+                    (time.time(),),
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                _rollback(conn)
+                logger.warning("Cache TTL purge failed: %s", e)
+                return
+        if cur.rowcount and cur.rowcount > 0:
+            self.expired += cur.rowcount
+            logger.info("Purged %d expired cache entries from %s", cur.rowcount, self.db_path)
+
+    def _evict(self):
+        """Drop expired entries, then least-recently-used ones until ~90% of the size cap."""
+        self._purge_expired()
+        # Other processes write to the same file, so re-read the real total before evicting
+        total = self._total_size()
+        target = int(self.max_size_bytes * 0.9)
+        evicted = 0
+        conn = self._conn()
+        with self._flush_lock:
+            while total > target:
+                candidates = conn.execute(
+                    "SELECT namespace, key, size FROM cache_entries ORDER BY accessed_at LIMIT 256"
+                ).fetchall()
+                if not candidates:
+                    break
+                # Take only as many of the oldest entries as needed to get under the target
+                victims = []
+                freed = 0
+                for ns, k, size in candidates:
+                    victims.append((ns, k))
+                    freed += size
+                    if total - freed <= target:
+                        break
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+                    conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    _rollback(conn)
+                    logger.warning("Cache eviction failed: %s", e)
+                    break
+                total -= freed
+                evicted += len(victims)
+            self._size_estimate = max(0, total)
+        if evicted:
+            self.evictions += evicted
+            logger.info("Evicted %d LRU cache entries to respect CACHE_MAX_SIZE_MB=%.0f",
+                        evicted, self.max_size_bytes / (1024 * 1024))
+
+
+class _ThreadConnection:
+    """Holds one thread's connection in thread-local storage (weakly referenceable)."""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _close_connection(conn: sqlite3.Connection, connections: Set[sqlite3.Connection], lock: threading.Lock):
+    with lock:
+        if conn not in connections:
+            return  # already closed by SimpleCache.close()
+        connections.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _rollback(conn: sqlite3.Connection):
+    """Roll back only if a transaction is actually open (BEGIN itself may have failed)."""
+    if conn.in_transaction:
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            logger.debug("Cache rollback failed: %s", e)
+
+
+@atexit.register
+def _close_open_caches():
+    for cache in list(_OPEN_CACHES):
+        cache.close()
+
+def create_prompt_cache_key(
+    golden_text: str,
+    distractor_texts: List[str],
+    query_type: str,
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    """Stable hash of everything that determines a generated query for one bundle/type."""
+    payload = json.dumps(
+        {
+            "golden": golden_text,
+            "distractors": list(distractor_texts),
+            "query_type": query_type,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def create_config_hash(config) -> str:
+    """Short hash over the config fields that affect LLM output."""
+    values = {name: getattr(config, name, None) for name in _CONFIG_HASH_FIELDS}
+    payload = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+# --- End File: evaluation_api/utils/cache_utils.py ---
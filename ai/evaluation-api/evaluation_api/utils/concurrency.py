@@ -0,0 +1,174 @@
+# --- File: evaluation_api/utils/concurrency.py ---
+# Adaptive (AIMD) concurrency limiter for LLM calls.
+#
+# The in-flight window grows by LLM_AIMD_INCREASE after every healthy window of
+# completions and is multiplied by LLM_AIMD_DECREASE_FACTOR on a 429, a timeout
+# or a p95 latency spike. LLM_MAX_WORKERS is the ceiling.
+
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .llm_stats import is_rate_limit_error, percentile
+
+
+def _is_timeout_error(exc: BaseException) -> bool:
+    return isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__
+
+
+class AIMDController:
+    """Dynamic concurrency window shared by the generation worker threads."""
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 16,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        max_error_rate: float = 0.05,
+        latency_p95_ms: float = 0.0,
+        latency_spike_factor: float = 2.0,
+        cooldown_s: float = 2.0,
+    ):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = float(min(self.maximum, max(self.minimum, int(initial))))
+        self.increase = float(increase)
+        self.decrease_factor = min(0.95, max(0.05, float(decrease_factor)))
+        self.max_error_rate = float(max_error_rate)
+        self.latency_p95_ms = float(latency_p95_ms)
+        self.latency_spike_factor = float(latency_spike_factor)
+        self.cooldown_s = float(cooldown_s)
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._window_latencies: List[float] = []
+        self._window_errors = 0
+        self._baseline_p95: Optional[float] = None
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.peak = int(self.limit)
+        self.last_p95_ms = 0.0
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=200)
+        self._started = time.time()
+
+    @classmethod
+    def from_config(cls, config) -> "AIMDController":
+        """Build a controller from the LLM_AIMD_* settings (LLM_MAX_WORKERS is the ceiling)."""
+        maximum = int(getattr(config, "LLM_MAX_WORKERS", 16))
+        return cls(
+            initial=int(getattr(config, "LLM_AIMD_INITIAL", min(4, maximum))),
+            minimum=int(getattr(config, "LLM_AIMD_MIN", 1)),
+            maximum=maximum,
+            increase=float(getattr(config, "LLM_AIMD_INCREASE", 1.0)),
+            decrease_factor=float(getattr(config, "LLM_AIMD_DECREASE_FACTOR", 0.5)),
+            max_error_rate=float(getattr(config, "LLM_AIMD_MAX_ERROR_RATE", 0.05)),
+            latency_p95_ms=float(getattr(config, "LLM_AIMD_LATENCY_P95_MS", 0.0)),
+            latency_spike_factor=float(getattr(config, "LLM_AIMD_LATENCY_SPIKE_FACTOR", 2.0)),
+            cooldown_s=float(getattr(config, "LLM_AIMD_COOLDOWN_SECONDS", 2.0)),
+        )
+
+    @property
+    def window(self) -> int:
+        return int(self.limit)
+
+    # --- Slots ---
+    def acquire(self):
+        with self._cond:
+            while self._inflight >= int(self.limit):
+                self._cond.wait()
+            self._inflight += 1
+
+    def release(self, latency_s: float, exc: Optional[BaseException] = None):
+        with self._cond:
+            self._inflight -= 1
+            if exc is not None and (is_rate_limit_error(exc) or _is_timeout_error(exc)):
+                self._decrease("rate_limit" if is_rate_limit_error(exc) else "timeout")
+            else:
+                self._observe(latency_s, ok=exc is None)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold one concurrency slot for the duration of an LLM call."""
+        self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.perf_counter() - started, e)
+            raise
+        self.release(time.perf_counter() - started)
+
+    # --- AIMD (callers hold self._cond) ---
+    def _observe(self, latency_s: float, ok: bool):
+        self._window_latencies.append(latency_s)
+        if not ok:
+            self._window_errors += 1
+        # Judge once per "round trip": a window's worth of completions
+        if len(self._window_latencies) < max(4, int(self.limit)):
+            return
+        p95 = percentile(self._window_latencies, 95)
+        error_rate = self._window_errors / len(self._window_latencies)
+        self._window_latencies = []
+        self._window_errors = 0
+        self.last_p95_ms = round(p95 * 1000.0, 1)
+
+        spiked = False
+        if self.latency_p95_ms > 0:
+            spiked = p95 * 1000.0 > self.latency_p95_ms
+        elif self._baseline_p95 is not None:
+            spiked = p95 > self._baseline_p95 * self.latency_spike_factor
+        # Baseline is an EWMA of healthy windows so one slow window does not shift it
+        if self._baseline_p95 is None:
+            self._baseline_p95 = p95
+        elif not spiked:
+            self._baseline_p95 = self._baseline_p95 * 0.8 + p95 * 0.2
+
+        if spiked:
+            self._decrease("latency_spike")
+        elif error_rate > self.max_error_rate:
+            self._decrease("error_rate")
+        elif self.limit < self.maximum:
+            self.limit = min(float(self.maximum), self.limit + self.increase)
+            self.increases += 1
+            self.peak = max(self.peak, int(self.limit))
+            self._record("increase")
+
+    def _decrease(self, reason: str):
+        now = time.time()
+        # One cut per cooldown: a burst of 429s from the same overload counts once
+        if now - self._last_decrease < self.cooldown_s:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+        self.decreases += 1
+        self._window_latencies = []
+        self._window_errors = 0
+        self._record(reason)
+
+    def _record(self, reason: str):
+        self.history.append({
+            "t": round(time.time() - self._started, 2),
+            "window": int(self.limit),
+            "reason": reason,
+        })
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "window": int(self.limit),
+                "min": self.minimum,
+                "max": self.maximum,
+                "peak": self.peak,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "last_window_p95_ms": self.last_p95_ms,
+                "recent_changes": list(self.history)[-10:],
+            }
+
+# --- End File: evaluation_api/utils/concurrency.py ---
@@ -0,0 +1,388 @@
+# --- File: evaluation_api/utils/dataset_io.py ---
+# Streaming dataset output: incremental orjson encoding, optional gzip/zstd compression,
+# size-based shards with a manifest, and an optional Parquet format.
+#
+# Layouts:
+#   single file  (OUTPUT_SHARD_MAX_MB = 0)   <path>[.gz|.zst] or <stem>.parquet
+#   sharded      (OUTPUT_SHARD_MAX_MB > 0)   <path>.shards/part-00000.jsonl.zst ... + manifest.json
+#
+# Everything is written under a temporary name and renamed into place on close(),
+# so readers never see a half-written dataset. iter_records / read_records read
+# either layout; shards are independent files, so they can be read in parallel.
+
+import gc
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional fast path
+    orjson = None  # type: ignore
+
+MANIFEST_FILE = "manifest.json"
+SHARDS_SUFFIX = ".shards"
+_COMPRESSION_SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """One JSONL line (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _loads(line: bytes) -> Dict[str, Any]:
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def _resolve_compression(compression: Optional[str]) -> str:
+    compression = (compression or "none").lower()
+    if compression not in _COMPRESSION_SUFFIX:
+        raise ValueError(f"Unsupported OUTPUT_COMPRESSION {compression!r} (none|gzip|zstd)")
+    if compression == "zstd":
+        try:
+            import zstandard  # type: ignore  # noqa: F401
+        except ImportError:
+            logger.warning("zstandard not installed; writing gzip instead of zstd.")
+            return "gzip"
+    return compression
+
+
+def _open_compressed(path: str, compression: str, level: Optional[int] = None):
+    """Binary write stream for ``path`` with the requested compression."""
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=level or 6)
+    if compression == "zstd":
+        import zstandard  # type: ignore
+        raw = open(path, "wb")
+        return zstandard.ZstdCompressor(level=level or 3).stream_writer(raw, closefd=True)
+    return open(path, "wb", buffering=1024 * 1024)
+
+
+def _open_for_read(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        import zstandard  # type: ignore
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb", buffering=1024 * 1024)
+
+
+class _JsonlShard:
+    def __init__(self, path: str, compression: str, level: Optional[int]):
+        self.path = path
+        self._f = _open_compressed(path, compression, level)
+        self.records = 0
+        self.raw_bytes = 0
+
+    def write(self, record: Dict[str, Any]):
+        data = encode_record(record)
+        self._f.write(data)
+        self.records += 1
+        self.raw_bytes += len(data)
+
+    def close(self):
+        self._f.close()
+
+
+class _ParquetShard:
+    """Buffers rows and writes them as Parquet row groups.
+
+    Dict-valued top-level fields (e.g. ``validation``) hold heterogeneous keys, so they
+    are stored as JSON strings and listed in the ``json_columns`` schema metadata.
+    """
+
+    def __init__(self, path: str, compression: str, row_group_size: int):
+        self.path = path
+        self.compression = {"none": "NONE", "gzip": "GZIP", "zstd": "ZSTD"}[compression]
+        self.row_group_size = max(1, row_group_size)
+        self._rows: List[Dict[str, Any]] = []
+        self._writer = None
+        self._json_columns: Optional[List[str]] = None
+        self.records = 0
+        self.raw_bytes = 0
+
+    def write(self, record: Dict[str, Any]):
+        if self._json_columns is None:
+            self._json_columns = [k for k, v in record.items() if isinstance(v, dict)]
+        row = {k: (encode_record(v)[:-1].decode("utf-8") if k in self._json_columns else v) for k, v in record.items()}
+        self._rows.append(row)
+        self.records += 1
+        self.raw_bytes += sum(len(v) for v in row.values() if isinstance(v, str))
+        if len(self._rows) >= self.row_group_size:
+            self._flush_rows()
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+
+        if self._writer is None:
+            table = pa.Table.from_pylist(self._rows)
+            table = table.replace_schema_metadata({"json_columns": ",".join(self._json_columns or [])})
+            self._writer = pq.ParquetWriter(self.path, table.schema, compression=self.compression)
+        else:
+            table = pa.Table.from_pylist(self._rows, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush_rows()
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            # No rows: still leave a (schema-less) file so the shard list stays consistent
+            open(self.path, "wb").close()
+
+
+class ShardedDatasetWriter:
+    """Writes records incrementally; the output appears atomically on ``close()``."""
+
+    def __init__(
+        self,
+        path: str,
+        fmt: str = "jsonl",
+        compression: Optional[str] = None,
+        shard_max_mb: float = 0,
+        compression_level: Optional[int] = None,
+        parquet_row_group_size: int = 10000,
+    ):
+        self.fmt = (fmt or "jsonl").lower()
+        if self.fmt not in ("jsonl", "parquet"):
+            raise ValueError(f"Unsupported OUTPUT_FORMAT {fmt!r} (jsonl|parquet)")
+        if self.fmt == "parquet":
+            import pyarrow.parquet  # type: ignore  # noqa: F401  (fail before writing anything)
+            self.compression = (compression or "zstd").lower()
+            if self.compression not in _COMPRESSION_SUFFIX:
+                raise ValueError(f"Unsupported OUTPUT_COMPRESSION {compression!r} (none|gzip|zstd)")
+        else:
+            self.compression = _resolve_compression(compression)
+        self.compression_level = compression_level
+        self.parquet_row_group_size = parquet_row_group_size
+        self.shard_max_bytes = int(float(shard_max_mb) * 1024 * 1024) if shard_max_mb and shard_max_mb > 0 else 0
+        self.sharded = self.shard_max_bytes > 0
+        self.path = self._final_path(path)
+        self.records = 0
+
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        self._tmp = os.path.join(parent, f".{os.path.basename(self.path)}.tmp-{uuid.uuid4().hex[:8]}")
+        if self.sharded:
+            os.makedirs(self._tmp)
+        self._shards: List[Dict[str, Any]] = []
+        self._current = None
+        self._closed = False
+
+    # --- Naming ---
+    def _final_path(self, path: str) -> str:
+        if self.sharded:
+            return path + SHARDS_SUFFIX
+        if self.fmt == "parquet":
+            return os.path.splitext(path)[0] + ".parquet"
+        suffix = _COMPRESSION_SUFFIX[self.compression]
+        return path if path.endswith(suffix) else path + suffix
+
+    def _shard_name(self, index: int) -> str:
+        if self.fmt == "parquet":
+            return f"part-{index:05d}.parquet"
+        return f"part-{index:05d}.jsonl{_COMPRESSION_SUFFIX[self.compression]}"
+
+    def _open_shard(self):
+        target = os.path.join(self._tmp, self._shard_name(len(self._shards))) if self.sharded else self._tmp
+        if self.fmt == "parquet":
+            return _ParquetShard(target, self.compression, self.parquet_row_group_size)
+        return _JsonlShard(target, self.compression, self.compression_level)
+
+    def _close_shard(self):
+        shard, self._current = self._current, None
+        if shard is None:
+            return
+        shard.close()
+        self._shards.append({
+            "file": os.path.basename(shard.path) if self.sharded else os.path.basename(self.path),
+            "records": shard.records,
+            "uncompressed_bytes": shard.raw_bytes,
+            "bytes": os.path.getsize(shard.path),
+        })
+
+    # --- Writing ---
+    def write(self, record: Dict[str, Any]):
+        if self._current is None:
+            self._current = self._open_shard()
+        self._current.write(record)
+        self.records += 1
+        if self.sharded and self._current.raw_bytes >= self.shard_max_bytes:
+            self._close_shard()
+
+    def write_all(self, records: Iterable[Dict[str, Any]]) -> int:
+        for record in records:
+            self.write(record)
+        return self.records
+
+    def close(self) -> str:
+        """Finish the last shard, write the manifest and move the output into place."""
+        if self._closed:
+            return self.path
+        if self._current is None and not self._shards:
+            self._current = self._open_shard()  # empty dataset: still produce a valid file/shard
+        self._close_shard()
+        if self.sharded:
+            manifest = {
+                "format": self.fmt,
+                "compression": self.compression,
+                "records": self.records,
+                "shard_max_mb": round(self.shard_max_bytes / (1024 * 1024), 3),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "shards": self._shards,
+            }
+            with open(os.path.join(self._tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+        _replace(self._tmp, self.path)
+        self._closed = True
+        return self.path
+
+    def abort(self):
+        """Drop everything written so far; the previous output (if any) is left untouched."""
+        if self._closed:
+            return
+        try:
+            if self._current is not None:
+                self._current.close()
+        except Exception:  # noqa: BLE001
+            pass
+        self._current = None
+        if os.path.isdir(self._tmp):
+            shutil.rmtree(self._tmp, ignore_errors=True)
+        elif os.path.exists(self._tmp):
+            os.remove(self._tmp)
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _replace(src: str, dst: str):
+    """Atomically move ``src`` to ``dst``; an existing directory is swapped out first."""
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        old = f"{dst}.old-{uuid.uuid4().hex[:8]}"
+        os.replace(dst, old)
+        os.replace(src, dst)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(src, dst)
+
+
+def create_dataset_writer(config, path: str) -> ShardedDatasetWriter:
+    """Writer configured by OUTPUT_FORMAT / OUTPUT_COMPRESSION / OUTPUT_SHARD_MAX_MB."""
+    return ShardedDatasetWriter(
+        path,
+        fmt=getattr(config, "OUTPUT_FORMAT", "jsonl"),
+        compression=getattr(config, "OUTPUT_COMPRESSION", "none"),
+        shard_max_mb=getattr(config, "OUTPUT_SHARD_MAX_MB", 0),
+        compression_level=getattr(config, "OUTPUT_COMPRESSION_LEVEL", None),
+        parquet_row_group_size=int(getattr(config, "OUTPUT_PARQUET_ROW_GROUP_SIZE", 10000)),
+    )
+
+
+def plain_jsonl_output(config) -> bool:
+    """True when the OUTPUT_* settings ask for one uncompressed JSONL file (appendable in place)."""
+    return (str(getattr(config, "OUTPUT_FORMAT", "jsonl") or "jsonl").lower() == "jsonl"
+            and str(getattr(config, "OUTPUT_COMPRESSION", "none") or "none").lower() == "none"
+            and not float(getattr(config, "OUTPUT_SHARD_MAX_MB", 0) or 0) > 0)
+
+
+# --- Reading ---
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic GC while building large lists of decoded records.
+
+    Millions of fresh, acyclic containers otherwise trigger repeated full collections
+    that cost several times the parsing itself.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def shard_paths(path: str) -> List[str]:
+    """Files of a dataset, in order: the shards listed in the manifest, or ``path`` itself."""
+    if os.path.isdir(path):
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return [os.path.join(path, s["file"]) for s in manifest.get("shards", [])]
+        return sorted(os.path.join(path, n) for n in os.listdir(path) if n.startswith("part-"))
+    return [path]
+
+
+def iter_shard(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of one shard or single-file dataset (JSONL, compressed JSONL or Parquet)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq  # type: ignore
+
+        if os.path.getsize(path) == 0:
+            return
+        pf = pq.ParquetFile(path)
+        metadata = pf.schema_arrow.metadata or {}
+        json_columns = set(filter(None, metadata.get(b"json_columns", b"").decode("utf-8").split(",")))
+        for batch in pf.iter_batches():
+            for row in batch.to_pylist():
+                yield {k: (_loads(v) if k in json_columns and isinstance(v, str) else v) for k, v in row.items()}
+        return
+    with _open_for_read(path) as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream every record of a dataset written by ShardedDatasetWriter (or a plain JSONL file)."""
+    for shard in shard_paths(path):
+        yield from iter_shard(shard)
+
+
+def read_records(
+    path: str,
+    transform: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    max_workers: int = 8,
+) -> List[Any]:
+    """All records of ``path`` in order, reading shards concurrently.
+
+    ``transform`` is applied per record inside the worker, so callers can keep only
+    the fields they need instead of materializing full context text.
+    """
+    paths = shard_paths(path)
+
+    def load(shard: str) -> List[Any]:
+        return [transform(r) if transform else r for r in iter_shard(shard)]
+
+    with gc_paused():
+        if len(paths) <= 1 or max_workers <= 1:
+            return [r for shard in paths for r in load(shard)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as ex:
+            return [r for part in ex.map(load, paths) for r in part]
+
+# --- End File: evaluation_api/utils/dataset_io.py ---
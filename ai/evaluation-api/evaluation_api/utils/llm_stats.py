@@ -0,0 +1,126 @@
+# --- File: evaluation_api/utils/llm_stats.py ---
+# Thread-safe counters and latency samples for LLM calls, shared by the
+# generation and evaluation stages and reported by the CLI/benchmark.
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Latency samples kept for percentiles: the most recent calls only, so long runs stay bounded
+LATENCY_WINDOW = 10000
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return float(ordered[idx])
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Extract a Retry-After hint (seconds) from an openai/httpx error, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "retry-after"):
+        raw = headers.get(name)
+        if raw is None:
+            continue
+        try:
+            value = float(raw)
+        except (TypeError, ValueError):
+            continue
+        return value / 1000.0 if name == "retry-after-ms" else value
+    return None
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for HTTP 429 style errors regardless of client library."""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server-side errors
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# openai/httpx exception types for dropped connections and timeouts
+_TRANSIENT_TYPES = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "RemoteProtocolError",
+}
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """True for errors a retry can fix (rate limits, timeouts, 5xx, dropped connections)."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in _TRANSIENT_STATUS or status >= 500
+    return any(cls.__name__ in _TRANSIENT_TYPES for cls in type(exc).__mro__)
+
+
+class LLMCallStats:
+    """Accumulates call counts, failures, retries and latencies for one stage."""
+
+    def __init__(self, name: str = "llm"):
+        self.name = name
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.started_at = time.time()
+
+    def record_call(self, latency_s: float, ok: bool = True, usage: Any = None):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            self.latencies.append(float(latency_s))
+            if usage is not None:
+                self.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+                self.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+                # Provider prompt-cache hits (usage.prompt_tokens_details.cached_tokens)
+                details = getattr(usage, "prompt_tokens_details", None)
+                self.cached_prompt_tokens += int(getattr(details, "cached_tokens", 0) or 0)
+
+    def record_retry(self, exc: Optional[BaseException] = None):
+        with self._lock:
+            self.retries += 1
+            if exc is not None and is_rate_limit_error(exc):
+                self.rate_limited += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = list(self.latencies)
+            elapsed = max(1e-9, time.time() - self.started_at)
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "failures": self.failures,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "cached_prompt_pct": round(100.0 * self.cached_prompt_tokens / self.prompt_tokens, 1)
+                if self.prompt_tokens else 0.0,
+                "calls_per_sec": round(self.calls / elapsed, 3),
+                "latency_p50_ms": round(percentile(lat, 50) * 1000.0, 1),
+                "latency_p95_ms": round(percentile(lat, 95) * 1000.0, 1),
+            }
+
+# --- End File: evaluation_api/utils/llm_stats.py ---
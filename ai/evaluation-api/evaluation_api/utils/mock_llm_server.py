@@ -0,0 +1,420 @@
+# --- File: evaluation_api/utils/mock_llm_server.py ---
+# Local OpenAI/Azure-OpenAI compatible stand-in for load testing the generation
+# and evaluation stages without spending Azure quota.
+#
+# Modes:
+#   - mock:   synthesize a response from the prompt after a sampled delay
+#   - record: forward to a real endpoint and append every response to a JSONL file
+#   - replay: serve recorded responses (falls back to mock on a miss)
+#
+# Run standalone:
+#   python -m evaluation_api.utils.mock_llm_server --port 8089 --latency-ms 300 --rate-limit-prob 0.05
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from .llm_stats import LATENCY_WINDOW, percentile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MockLLMConfig:
+    """Behaviour of the stand-in server."""
+    mode: str = "mock"                   # mock | record | replay
+    latency_dist: str = "lognormal"      # fixed | uniform | exponential | lognormal
+    latency_ms: float = 250.0            # median (lognormal), mean (exponential) or fixed value
+    latency_spread: float = 0.5          # sigma for lognormal, +/- fraction for uniform
+    latency_max_ms: float = 30000.0
+    rate_limit_prob: float = 0.0         # probability of a random 429
+    capacity: int = 0                    # max in-flight requests before 429 (0 = unlimited)
+    retry_after_s: float = 1.0
+    recordings_path: str = ""
+    upstream_endpoint: str = ""
+    upstream_api_key: str = ""
+    seed: int = 42
+
+
+def _approx_tokens(text: str) -> int:
+    """Rough BPE-like token count (~4 chars/token) for usage accounting."""
+    return max(1, math.ceil(len(text or "") / 4)) if text else 0
+
+
+def _request_key(path: str, body: Dict[str, Any]) -> str:
+    """Stable key for record/replay: deployment path + generation-relevant request fields."""
+    deployment = path.split("?", 1)[0]
+    relevant = {k: body.get(k) for k in ("model", "messages", "temperature", "max_tokens", "top_p")}
+    payload = json.dumps({"path": deployment, "body": relevant}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _synthesize_reply(prompt: str, max_tokens: int, rng: random.Random) -> str:
+    """Produce a plausible reply from the prompt text: a query for generation prompts,
+    a short extract for answer-with-context prompts."""
+    match = re.search(r"Golden Contexts?:\n(.*?)(?:\n\nDistractor Context:|\Z)", prompt, flags=re.S)
+    if match is None:
+        match = re.search(r"## Context\n(.*?)(?:\n\n## Question|\Z)", prompt, flags=re.S)
+    source = match.group(1) if match else prompt
+    words = re.findall(r"[A-Za-z0-9][A-Za-z0-9\-]*", source)
+    if not words:
+        return "mock response"
+    n = max(1, min(len(words), max(1, int(max_tokens or 16) * 3 // 4)))
+    start = rng.randrange(0, max(1, len(words) - n + 1))
+    return " ".join(words[start:start + n])
+
+
+def build_mock_completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Deterministic chat.completion payload for a request body (also used by the local batch stand-in)."""
+    messages = body.get("messages") or []
+    prompt = "\n".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+    key = _request_key("", body)
+    content = _synthesize_reply(prompt, int(body.get("max_tokens") or 32), random.Random(key))
+    prompt_tokens = _approx_tokens(prompt)
+    completion_tokens = _approx_tokens(content)
+    return {
+        "id": "chatcmpl-mock-" + key[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model") or "mock",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class _PrefixCache:
+    """Simulates provider prompt caching: prefixes of >=1024 tokens, matched in 128-token blocks."""
+
+    MIN_CHARS = 1024 * 4
+    BLOCK_CHARS = 128 * 4
+
+    def __init__(self, max_entries: int = 200_000):
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt: str) -> Tuple[int, List[str]]:
+        """Return (cached token count, prefix digests) for ``prompt``."""
+        if len(prompt) < self.MIN_CHARS:
+            return 0, []
+        digests = []
+        h = hashlib.sha256()
+        h.update(prompt[:self.MIN_CHARS].encode("utf-8"))
+        digests.append(h.hexdigest())
+        for end in range(self.MIN_CHARS + self.BLOCK_CHARS, len(prompt) + 1, self.BLOCK_CHARS):
+            h.update(prompt[end - self.BLOCK_CHARS:end].encode("utf-8"))
+            digests.append(h.hexdigest())
+        hits = 0
+        with self._lock:
+            for digest in digests:
+                if digest not in self._seen:
+                    break
+                hits += 1
+        cached_chars = self.MIN_CHARS + (hits - 1) * self.BLOCK_CHARS if hits else 0
+        return cached_chars // 4, digests
+
+    def store(self, digests: List[str]):
+        """Remember prefixes once a request completes (a provider caches after processing)."""
+        with self._lock:
+            for digest in digests:
+                self._seen[digest] = None
+                self._seen.move_to_end(digest)
+            while len(self._seen) > self._max_entries:
+                self._seen.popitem(last=False)
+
+
+class _Recorder:
+    """Append-only JSONL store of recorded responses keyed by request hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                        self._entries[rec["key"]] = rec["response"]
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+            logger.info("Loaded %d recorded responses from %s", len(self._entries), path)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, response: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = response
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "response": response}, ensure_ascii=False) + "\n")
+
+
+class MockLLMServer:
+    """Threaded HTTP server speaking the chat.completions wire format.
+
+    Accepts both Azure (``/openai/deployments/<name>/chat/completions``) and
+    OpenAI (``/v1/chat/completions``) paths. Use as a context manager or call
+    ``start()``/``stop()``; ``url`` is the value for AZURE_OPENAI_ENDPOINT.
+    """
+
+    def __init__(self, cfg: Optional[MockLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.cfg = cfg or MockLLMConfig()
+        if self.cfg.mode not in ("mock", "record", "replay"):
+            raise ValueError(f"Unknown mock server mode: {self.cfg.mode}")
+        if self.cfg.mode in ("record", "replay") and not self.cfg.recordings_path:
+            raise ValueError("recordings_path is required for record/replay modes")
+        if self.cfg.mode == "record" and not self.cfg.upstream_endpoint:
+            raise ValueError("upstream_endpoint is required for record mode")
+
+        self._rng = random.Random(self.cfg.seed)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {
+            "requests": 0,
+            "responses_200": 0,
+            "rate_limited_429": 0,
+            "upstream_errors": 0,
+            "replay_hits": 0,
+            "replay_misses": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "max_inflight": 0,
+        }
+        self._recorder = _Recorder(self.cfg.recordings_path) if self.cfg.mode in ("record", "replay") else None
+        self._prefix_cache = _PrefixCache()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        logger.info("Mock LLM server (%s mode) listening on %s", self.cfg.mode, self.url)
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self.counters)
+            lat = list(self._latencies)
+        out["latency_p50_ms"] = round(percentile(lat, 50) * 1000.0, 1)
+        out["latency_p95_ms"] = round(percentile(lat, 95) * 1000.0, 1)
+        return out
+
+    # --- Request handling ---
+    def _sample_latency(self) -> float:
+        cfg = self.cfg
+        with self._lock:
+            if cfg.latency_dist == "fixed":
+                ms = cfg.latency_ms
+            elif cfg.latency_dist == "uniform":
+                lo = cfg.latency_ms * (1.0 - cfg.latency_spread)
+                hi = cfg.latency_ms * (1.0 + cfg.latency_spread)
+                ms = self._rng.uniform(max(0.0, lo), hi)
+            elif cfg.latency_dist == "exponential":
+                ms = self._rng.expovariate(1.0 / max(cfg.latency_ms, 1e-3))
+            else:
+                ms = self._rng.lognormvariate(math.log(max(cfg.latency_ms, 1e-3)), cfg.latency_spread)
+        return min(ms, cfg.latency_max_ms) / 1000.0
+
+    def _should_rate_limit(self) -> bool:
+        with self._lock:
+            over_capacity = self.cfg.capacity > 0 and self._inflight > self.cfg.capacity
+            return over_capacity or (self.cfg.rate_limit_prob > 0 and self._rng.random() < self.cfg.rate_limit_prob)
+
+    def _forward_upstream(self, path: str, raw: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        url = self.cfg.upstream_endpoint.rstrip("/") + path
+        req = urllib.request.Request(url, data=raw, method="POST", headers={
+            "Content-Type": "application/json",
+            "api-key": self.cfg.upstream_api_key,
+            "Authorization": f"Bearer {self.cfg.upstream_api_key}",
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                return resp.status, json.loads(resp.read()), {}
+        except urllib.error.HTTPError as e:
+            headers = {k: v for k, v in e.headers.items() if k.lower().startswith("retry-after")}
+            try:
+                payload = json.loads(e.read() or b"{}")
+            except json.JSONDecodeError:
+                payload = {"error": {"message": str(e)}}
+            return e.code, payload, headers
+
+    def _handle(self, path: str, raw: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            return 400, {"error": {"message": "invalid JSON body"}}, {}
+
+        with self._lock:
+            self.counters["requests"] += 1
+            self._inflight += 1
+            self.counters["max_inflight"] = max(self.counters["max_inflight"], self._inflight)
+        started = time.perf_counter()
+        try:
+            if self._should_rate_limit():
+                with self._lock:
+                    self.counters["rate_limited_429"] += 1
+                retry_after = self.cfg.retry_after_s
+                return 429, {"error": {"code": "429", "message": "Rate limit is exceeded (mock)."}}, {
+                    "Retry-After": str(max(1, int(math.ceil(retry_after)))),
+                    "retry-after-ms": str(int(retry_after * 1000)),
+                }
+
+            key = _request_key(path, body)
+            if self.cfg.mode == "record":
+                status, payload, headers = self._forward_upstream(path, raw)
+                if status == 200:
+                    self._recorder.put(key, payload)
+                else:
+                    with self._lock:
+                        self.counters["upstream_errors"] += 1
+                    return status, payload, headers
+            else:
+                payload = self._recorder.get(key) if self._recorder is not None else None
+                if self.cfg.mode == "replay":
+                    with self._lock:
+                        self.counters["replay_hits" if payload is not None else "replay_misses"] += 1
+                digests = []
+                if payload is None:
+                    payload = build_mock_completion(body)
+                    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages") or [] if isinstance(m, dict))
+                    cached, digests = self._prefix_cache.lookup(prompt)
+                    payload["usage"]["prompt_tokens_details"] = {"cached_tokens": cached}
+                time.sleep(self._sample_latency())
+                self._prefix_cache.store(digests)
+
+            usage = payload.get("usage") or {}
+            with self._lock:
+                self.counters["responses_200"] += 1
+                self.counters["prompt_tokens"] += int(usage.get("prompt_tokens", 0) or 0)
+                self.counters["completion_tokens"] += int(usage.get("completion_tokens", 0) or 0)
+                self.counters["cached_prompt_tokens"] += int(
+                    (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0)
+            return 200, payload, {}
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._latencies.append(time.perf_counter() - started)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if not self.path.split("?", 1)[0].endswith("/chat/completions"):
+                    status, payload, headers = 404, {"error": {"message": f"unsupported path {self.path}"}}, {}
+                else:
+                    status, payload, headers = server._handle(self.path, raw)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, fmt, *args):
+                logger.debug("mock-llm: " + fmt, *args)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server for throughput testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mode", default="mock", choices=["mock", "record", "replay"])
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=250.0)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0, help="Max in-flight requests before 429 (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--recordings", default="", help="JSONL file for record/replay")
+    parser.add_argument("--upstream", default=os.getenv("AZURE_OPENAI_ENDPOINT", ""), help="Real endpoint for record mode")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] [%(name)s] - %(message)s")
+    cfg = MockLLMConfig(
+        mode=args.mode,
+        latency_dist=args.latency_dist,
+        latency_ms=args.latency_ms,
+        latency_spread=args.latency_spread,
+        rate_limit_prob=args.rate_limit_prob,
+        capacity=args.capacity,
+        retry_after_s=args.retry_after,
+        recordings_path=args.recordings,
+        upstream_endpoint=args.upstream,
+        upstream_api_key=(
+            os.environ.get("AZURE_OPENAI_KEY")
+            or os.environ.get("AZURE_OPENAI_API_KEY")
+            or os.environ.get("OPENAI_API_KEY")
+            or ""
+        ),
+    )
+    server = MockLLMServer(cfg, host=args.host, port=args.port)
+    server.start()
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("mock-llm stats: %s", server.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
+
+# --- End File: evaluation_api/utils/mock_llm_server.py ---
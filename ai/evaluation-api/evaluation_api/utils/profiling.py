@@ -0,0 +1,239 @@
+# --- File: evaluation_api/utils/profiling.py ---
+# Per-stage profiling for CLI runs (generation/cli.py --profile).
+#
+# Every pipeline stage runs inside ``RunProfiler.stage(name)``; artifacts land in one
+# run directory, numbered in stage order:
+#   NN-<stage>.prof            cProfile stats of the main thread (snakeviz / pstats)
+#   NN-<stage>.txt             top functions by cumulative and own time
+#   NN-<stage>.alloc.txt       tracemalloc top allocators and the diff against the previous stage
+#   NN-<stage>.folded          sampled stacks of all threads, "frame;frame;frame count" lines
+#                              (flamegraph.pl, speedscope, inferno)
+#   summary.json               wall/CPU time, traced memory and hot spots per stage
+#
+# cProfile only sees the thread that enables it, so work done on LLM/evaluation thread
+# pools shows up in the .folded samples rather than in the .prof files.
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cpu", "memory", "all")
+
+
+class _StackSampler:
+    """Samples the stacks of all threads every ``interval_s`` into folded-stack counts."""
+
+    def __init__(self, interval_s: float):
+        self.interval_s = max(0.001, interval_s)
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.counts = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Group pool workers ("job_0", "ThreadPoolExecutor-1_3") under their pool name
+                thread = names.get(ident, "thread").rsplit("_", 1)[0]
+                self.counts[";".join([thread] + stack[::-1])] += 1
+
+
+class RunProfiler:
+    """Collects per-stage CPU, allocation and stack-sample profiles into ``run_dir``.
+
+    A profiler without ``run_dir`` is disabled: ``stage()`` only yields, so the CLI can
+    wrap its stages unconditionally.
+    """
+
+    def __init__(self, run_dir: Optional[str] = None, mode: str = "all", flamegraph: bool = False,
+                 top_n: int = 30, sample_interval_ms: float = 5.0, tracemalloc_frames: int = 1):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+        self.run_dir = run_dir
+        self.cpu = mode in ("cpu", "all")
+        self.memory = mode in ("memory", "all")
+        self.flamegraph = flamegraph
+        self.top_n = max(1, int(top_n))
+        self.tracemalloc_frames = max(1, int(tracemalloc_frames))
+        self.stages: List[Dict[str, Any]] = []
+        self._sampler = _StackSampler(sample_interval_ms / 1000.0) if flamegraph else None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+        if self.enabled:
+            os.makedirs(run_dir, exist_ok=True)
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start(self.tracemalloc_frames)
+                self._started_tracemalloc = True
+            logger.info("Profiling (%s%s) into %s", mode, ", flame graph" if flamegraph else "", run_dir)
+
+    @classmethod
+    def from_config(cls, config, mode: Optional[str], run_dir: Optional[str] = None,
+                    flamegraph: bool = False) -> "RunProfiler":
+        """Profiler for a CLI run; disabled when ``mode`` is None."""
+        if mode is None:
+            return cls()
+        if run_dir is None:
+            root = getattr(config, "PROFILE_DIR", "./output/profiles")
+            run_dir = os.path.join(root, time.strftime("%Y%m%d-%H%M%S"))
+        return cls(
+            run_dir, mode=mode, flamegraph=flamegraph,
+            top_n=getattr(config, "PROFILE_TOP_N", 30),
+            sample_interval_ms=getattr(config, "PROFILE_SAMPLE_INTERVAL_MS", 5.0),
+            tracemalloc_frames=getattr(config, "PROFILE_TRACEMALLOC_FRAMES", 1),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.run_dir is not None
+
+    def _path(self, index: int, name: str, suffix: str) -> str:
+        return os.path.join(self.run_dir, f"{index:02d}-{name}{suffix}")
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        index = len(self.stages) + 1
+        profile = cProfile.Profile() if self.cpu else None
+        if self.memory:
+            if self._snapshot is None:
+                self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        if self._sampler is not None:
+            self._sampler.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            record: Dict[str, Any] = {
+                "stage": name,
+                "wall_s": round(time.perf_counter() - wall, 4),
+                "cpu_s": round(time.process_time() - cpu, 4),
+            }
+            if self._sampler is not None:
+                record["samples"] = self._write_folded(index, name, self._sampler.stop())
+            if profile is not None:
+                record["hot_spots"] = self._write_cpu(index, name, profile)
+            if self.memory:
+                record.update(self._write_memory(index, name))
+            self.stages.append(record)
+            logger.info("Profiled stage %s: %.3fs wall, %.3fs CPU", name, record["wall_s"], record["cpu_s"])
+
+    def _write_cpu(self, index: int, name: str, profile: cProfile.Profile) -> List[Dict[str, Any]]:
+        profile.dump_stats(self._path(index, name, ".prof"))
+        stats = pstats.Stats(profile)
+        with open(self._path(index, name, ".txt"), "w", encoding="utf-8") as f:
+            for key in ("cumulative", "tottime"):
+                buf = io.StringIO()
+                pstats.Stats(profile, stream=buf).sort_stats(key).print_stats(self.top_n)
+                f.write(f"=== {name}: top {self.top_n} by {key} ===\n{buf.getvalue()}\n")
+        # Hot spots by own time, for summary.json
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:10]
+        return [
+            {"function": f"{func} ({os.path.basename(path)}:{line})", "calls": nc,
+             "tottime_s": round(tt, 4), "cumtime_s": round(ct, 4)}
+            for (path, line, func), (_, nc, tt, ct, _) in rows
+        ]
+
+    def _write_memory(self, index: int, name: str) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        key = "traceback" if self.tracemalloc_frames > 1 else "lineno"
+        diff = snapshot.compare_to(self._snapshot, key)
+        with open(self._path(index, name, ".alloc.txt"), "w", encoding="utf-8") as f:
+            f.write(f"=== {name}: traced {current / 2**20:.1f} MiB, stage peak {peak / 2**20:.1f} MiB ===\n\n")
+            f.write(f"--- Top {self.top_n} allocators (live after the stage) ---\n")
+            for stat in snapshot.statistics(key)[:self.top_n]:
+                f.write(f"{stat}\n")
+                if key == "traceback":
+                    f.writelines(f"    {line}\n" for line in stat.traceback.format())
+            f.write(f"\n--- Top {self.top_n} changes since the previous stage ---\n")
+            for stat in diff[:self.top_n]:
+                f.write(f"{stat}\n")
+        self._snapshot = snapshot
+        return {
+            "traced_mib": round(current / 2**20, 2),
+            "peak_mib": round(peak / 2**20, 2),
+            "top_growth": [
+                {"site": str(stat.traceback[0]), "size_diff_kib": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in diff[:5]
+            ],
+        }
+
+    def _write_folded(self, index: int, name: str, counts: Counter) -> int:
+        with open(self._path(index, name, ".folded"), "w", encoding="utf-8") as f:
+            for stack, n in counts.most_common():
+                f.write(f"{stack} {n}\n")
+        return sum(counts.values())
+
+    def close(self) -> Optional[str]:
+        """Writes summary.json and stops tracing; returns the summary path."""
+        if not self.enabled:
+            return None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        path = os.path.join(self.run_dir, "summary.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"argv": sys.argv, "stages": self.stages}, f, indent=2)
+        for record in self.stages:
+            hot = record.get("hot_spots") or [{}]
+            logger.info("Profile %-10s %8.3fs wall %8.3fs CPU %s%s", record["stage"], record["wall_s"],
+                        record["cpu_s"],
+                        f"peak {record['peak_mib']:.1f} MiB " if "peak_mib" in record else "",
+                        f"top: {hot[0].get('function', '-')}" if hot[0] else "")
+        logger.info("Profile artifacts written to %s", self.run_dir)
+        return path
+
+    def __enter__(self) -> "RunProfiler":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- End File: evaluation_api/utils/profiling.py ---
@@ -0,0 +1,71 @@
+# --- File: evaluation_api/utils/rate_limit.py ---
+# Shared request pacing and retry policy for LLM calls.
+
+import threading
+import time
+from typing import Optional
+
+from .llm_stats import LLMCallStats, is_transient_error, retry_after_seconds
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``capacity`` burst, refilled at ``refill_rate`` tokens/second."""
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = max(1.0, float(capacity))
+        self.refill_rate = max(1e-6, float(refill_rate))
+        self._tokens = self.capacity
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, prefix: str = "LLM") -> "TokenBucket":
+        """Bucket from ``<prefix>_BURST_CAPACITY`` / ``<prefix>_REFILL_RATE`` (falling back to the LLM_* values)."""
+        capacity = getattr(config, f"{prefix}_BURST_CAPACITY", None) or getattr(config, "LLM_BURST_CAPACITY", 50)
+        refill = getattr(config, f"{prefix}_REFILL_RATE", None) or getattr(config, "LLM_REFILL_RATE", 10.0)
+        return cls(float(capacity), float(refill))
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                # Refill tokens based on time elapsed
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_rate)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                deficit = 1.0 - self._tokens
+            # Adaptive sleep based on token deficit
+            time.sleep(min(max(0.01, deficit / self.refill_rate), 0.1))
+
+
+def llm_retry(stats: Optional[LLMCallStats] = None, attempts: int = 5):
+    """tenacity ``retry`` decorator: Retry-After aware backoff, retries counted in ``stats``.
+
+    Only transient errors (rate limits, timeouts, 5xx, connection drops) are retried;
+    anything else is raised immediately.
+    """
+    from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter  # type: ignore
+
+    backoff = wait_exponential_jitter(initial=0.2, max=6.0)
+
+    def wait_with_retry_after(retry_state):
+        # Honour the server's Retry-After hint on 429s, else exponential backoff
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        hint = retry_after_seconds(exc) if exc is not None else None
+        return min(hint, 60.0) if hint is not None else backoff(retry_state)
+
+    def count_retry(retry_state):
+        if stats is not None:
+            exc = retry_state.outcome.exception() if retry_state.outcome else None
+            stats.record_retry(exc)
+
+    return retry(
+        retry=retry_if_exception(is_transient_error),
+        stop=stop_after_attempt(attempts),
+        wait=wait_with_retry_after,
+        before_sleep=count_retry,
+    )
+
+# --- End File: evaluation_api/utils/rate_limit.py ---
@@ -0,0 +1,25 @@
+# --- File: evaluation_api/utils/rng.py ---
+# Independent, keyed random streams.
+#
+# Every random decision draws from its own stream derived from (SEED, key..., stage)
+# instead of the shared global ``random`` state, so results do not depend on thread
+# scheduling, processing order, sharding or resumption.
+
+import hashlib
+import random
+from typing import Any, Optional
+
+
+def stream_seed(seed: Any, *keys: Any) -> int:
+    """64-bit seed for the stream identified by ``(seed, *keys)``."""
+    payload = "\x1f".join(str(k) for k in (seed,) + keys)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "big")
+
+
+def rng_stream(seed: Optional[Any], *keys: Any) -> random.Random:
+    """Fresh ``random.Random`` for ``(seed, *keys)``; unseeded (OS entropy) when ``seed`` is None."""
+    if seed is None:
+        return random.Random()
+    return random.Random(stream_seed(seed, *keys))
+
+# --- End File: evaluation_api/utils/rng.py ---